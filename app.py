@@ -2,10 +2,20 @@
 # Problem Discovery & Validation (ThermaLoop)
 # Run: streamlit run app_sim1.py
 
-import random
-from typing import Dict, Any, List
+import os
+import time
+from typing import Optional
 import streamlit as st
-import pandas as pd
+import profiling
+from profiling import span, timed
+from engine import (
+    CHANNELS, EFFORT_TOKENS, INTERVIEW_PERSONAS, FLASH_PERSONAS, MIN_QUESTIONS_PER_INTERVIEW, SCORE_CACHE_STATS,
+    Simulation, bank_index, discovery_brief, dump_state, load_state, start_trust, turn_markdown,
+)
+from cohort import ScoreRanks, score_values
+from events import EventLog
+from solver import expert_session
+from store import WriteBehind, new_sid, open_store, snapshotter, valid_sid
 
 st.set_page_config(page_title="Problem Discovery & Validation", page_icon="🎧", layout="wide")
 
@@ -18,247 +28,43 @@ MARKET_BRIEF = (
     "Retrofits feel complex; installers vary in quality; comfort vs savings trade-offs are unclear."
 )
 
-# ---------- Channels (no underscores). yield/speed only used conceptually; allocation drives sampling bias ----------
-CHANNELS = {
-    "Neighborhood Forums":  {"yield": 0.9, "speed": 0.8, "bias": {"Homeowner": 0.5, "Renter": 0.2, "Landlord": 0.2, "Installer": 0.1}},
-    "Email Outreach":       {"yield": 0.7, "speed": 0.7, "bias": {"Homeowner": 0.3, "Renter": 0.3, "Landlord": 0.2, "Installer": 0.2}},
-    "Cold Direct Messages": {"yield": 0.5, "speed": 0.6, "bias": {"Homeowner": 0.3, "Renter": 0.3, "Landlord": 0.2, "Installer": 0.2}},
-    "Sidewalk Intercepts":  {"yield": 0.6, "speed": 0.9, "bias": {"Homeowner": 0.4, "Renter": 0.4, "Landlord": 0.1, "Installer": 0.1}},
-    "Installer Referrals":  {"yield": 0.8, "speed": 0.5, "bias": {"Homeowner": 0.2, "Renter": 0.1, "Landlord": 0.2, "Installer": 0.5}},
-}
-EFFORT_TOKENS = 10
-
-# ---------- Personas (12 interview + 12 flash) ----------
-INTERVIEW_PERSONAS = [
-    {"name":"Maya Chen","segment":"Homeowner","bio":"3-bed townhouse; two kids; upstairs hot in summer.",
-     "pains":[{"text":"Upstairs rooms hotter than downstairs in summer","freq":4,"sev":4,"material":True},
-              {"text":"Energy bill spikes June–August","freq":3,"sev":3,"material":True}],
-     "triggers":["Heat waves; kids up at night"],"workaround":"Portable fans; close downstairs vents",
-     "wtp_ceiling":15,"tell_threshold":0.55,"anecdotes":["We moved the kids downstairs to sleep last July."],"quirk":"Tracks bills in a spreadsheet"},
-    {"name":"Sam Rodriguez","segment":"Homeowner","bio":"Older HVAC; cares for elderly parent; wants comfort.",
-     "pains":[{"text":"Cold draft in living room in winter","freq":4,"sev":4,"material":True}],
-     "triggers":["Cold snaps"],"workaround":"Space heater by sofa","wtp_ceiling":10,"tell_threshold":0.6,
-     "anecdotes":["We stuffed towels by the door last December."],"quirk":"DIY enthusiast"},
-    {"name":"Aisha Patel","segment":"Renter","bio":"Top-floor apartment; pays electric; landlord slow to respond.",
-     "pains":[{"text":"Bedroom overheats; poor sleep","freq":4,"sev":4,"material":True}],
-     "triggers":["Heat waves"],"workaround":"Cracked window; box fan","wtp_ceiling":8,"tell_threshold":0.5,
-     "anecdotes":["I sleep with an ice pack sometimes."],"quirk":"Reads product reviews obsessively"},
-    {"name":"Jordan Blake","segment":"Landlord","bio":"Manages 18 units; fields comfort complaints.",
-     "pains":[{"text":"Frequent tenant complaints about uneven heating","freq":4,"sev":3,"material":True}],
-     "triggers":["First cold snap"],"workaround":"Tell tenants to adjust dampers; duct cleaning",
-     "wtp_ceiling":0,"tell_threshold":0.65,"anecdotes":["Three units called the same night last January."],"quirk":"Wants low-touch solutions"},
-    {"name":"Riley Nguyen","segment":"Installer","bio":"Independent HVAC installer; skeptical of new gadgets.",
-     "pains":[{"text":"Callbacks after installs due to comfort complaints","freq":3,"sev":3,"material":True}],
-     "triggers":["Season changes"],"workaround":"Manual damper balancing; upsell thermostat",
-     "wtp_ceiling":0,"tell_threshold":0.7,"anecdotes":["I've taped vents to force more air to back rooms."],"quirk":"Prefers proven gear"},
-    {"name":"Priya Desai","segment":"Homeowner","bio":"Newer build; nursery cold at night; tech-friendly.",
-     "pains":[{"text":"Nursery too cold at night","freq":4,"sev":4,"material":True}],
-     "triggers":["Baby waking"],"workaround":"Space heater on timer","wtp_ceiling":18,"tell_threshold":0.55,
-     "anecdotes":["We check room temp on a smart baby monitor."],"quirk":"Smart home early adopter"},
-    {"name":"Marcus Lee","segment":"Homeowner","bio":"Old Victorian; leaky windows; budget-aware.",
-     "pains":[{"text":"Heating bill too high for comfort achieved","freq":4,"sev":4,"material":True},
-              {"text":"Basement office stays cold","freq":3,"sev":3,"material":True}],
-     "triggers":["Bill arrival; WFH days"],"workaround":"Heater under desk; sweaters","wtp_ceiling":12,"tell_threshold":0.6,
-     "anecdotes":["I track the thermostat closely in winter."],"quirk":"Likes numbers"},
-    {"name":"Elena Rossi","segment":"Renter","bio":"Garden apartment; landlord controls boiler; wants comfort.",
-     "pains":[{"text":"Bedroom cold, living room warm","freq":4,"sev":3,"material":True}],
-     "triggers":["Cold nights"],"workaround":"Heavy blanket; asks landlord","wtp_ceiling":5,"tell_threshold":0.5,
-     "anecdotes":["Studying in a hoodie and gloves."],"quirk":"Time-pressed student"},
-    {"name":"Derrick Owens","segment":"Installer","bio":"Regional installer; partners with property managers.",
-     "pains":[{"text":"Wants upsell that reduces callbacks","freq":3,"sev":3,"material":True}],
-     "triggers":["Post-install complaints"],"workaround":"Higher-end dampers; room heaters",
-     "wtp_ceiling":0,"tell_threshold":0.65,"anecdotes":["Callbacks kill our margins."],"quirk":"Sales-forward"},
-    {"name":"Hannah Kim","segment":"Homeowner","bio":"Townhome; hosts often; wants quiet comfort in guest room.",
-     "pains":[{"text":"Guest room too hot; vent noise","freq":3,"sev":3,"material":True}],
-     "triggers":["When guests visit"],"workaround":"Close vent; portable AC","wtp_ceiling":9,"tell_threshold":0.55,
-     "anecdotes":["We warn guests to bring a light blanket."],"quirk":"Aesthetic sensitive"},
-    {"name":"Omar Farouk","segment":"Landlord","bio":"Owns 6 single-family rentals; wants fewer tenant calls.",
-     "pains":[{"text":"Comfort complaints drive churn","freq":3,"sev":3,"material":True}],
-     "triggers":["Renewal season"],"workaround":"Remind to adjust vents; one-off fixes","wtp_ceiling":0,"tell_threshold":0.6,
-     "anecdotes":["A family left over heating issues."],"quirk":"Cost-focused"},
-    {"name":"Zoey Park","segment":"Homeowner","bio":"Small bungalow; budget constrained; cares about bills.",
-     "pains":[{"text":"Bill spikes after cold front","freq":3,"sev":3,"material":True}],
-     "triggers":["Utility email; bill shock"],"workaround":"Lower thermostat; layers","wtp_ceiling":6,"tell_threshold":0.5,
-     "anecdotes":["I compare bills with neighbors."],"quirk":"Coupon clipper"},
-    # --- Curveball personas: teach students to distinguish signal from noise ---
-    {"name":"Trent Holloway","segment":"Homeowner","bio":"New construction; good insulation; loves gadgets.",
-     "pains":[{"text":"Occasionally notices slight temp difference between floors","freq":1,"sev":1,"material":False}],
-     "triggers":["Reading smart-home blogs"],"workaround":"None needed; house is comfortable",
-     "wtp_ceiling":25,"tell_threshold":0.4,
-     "anecdotes":["I saw a TikTok about smart vents and thought it looked cool."],
-     "quirk":"Enthusiastic early adopter who says yes to everything but has no real pain"},
-    {"name":"Debra Cassidy","segment":"Homeowner","bio":"Thinks she has airflow issues; actually has poor attic insulation.",
-     "pains":[{"text":"Upstairs bedroom warm in summer","freq":4,"sev":4,"material":False}],
-     "triggers":["Summer heat"],"workaround":"Window AC unit in bedroom",
-     "wtp_ceiling":12,"tell_threshold":0.55,
-     "anecdotes":["We had someone look at the ducts and they said everything was fine."],
-     "quirk":"Misattributes insulation problem to airflow; duct inspection already cleared"},
-]
-
-FLASH_PERSONAS = [
-    {"name":"Flash — Property Manager","segment":"Landlord","bio":"30 units; central HVAC.",
-     "note":"Comfort tickets spike after first cold week; room-by-room balancing is slow."},
-    {"name":"Flash — Parent of Infant","segment":"Homeowner","bio":"Nursery swings at night.",
-     "note":"Tried taping vent and space heater; worried about safety and bills."},
-    {"name":"Flash — Student Renter","segment":"Renter","bio":"Basement room; landlord controls temperature.",
-     "note":"Studies in living room for warmth; electric bill rises with space heater."},
-    {"name":"Flash — Retiree","segment":"Homeowner","bio":"Fixed income; wants payback.",
-     "note":"Wants proof a retrofit pays back within a year."},
-    {"name":"Flash — Short-Term Rental Host","segment":"Landlord","bio":"Reviews mention comfort.",
-     "note":"Would pay for something that reduces guest complaints."},
-    {"name":"Flash — Installer Crew Lead","segment":"Installer","bio":"Trains techs.",
-     "note":"Seeks add-on that reduces rework with clear margin."},
-    {"name":"Flash — Remote Worker","segment":"Homeowner","bio":"Cold basement office.",
-     "note":"Heater helps but hikes bill; wants smarter airflow."},
-    {"name":"Flash — Eco Enthusiast","segment":"Homeowner","bio":"Solar + smart thermostat.",
-     "note":"Comfort fine; wants measurable energy savings."},
-    {"name":"Flash — Building Superintendent","segment":"Installer","bio":"Condo block maintenance.",
-     "note":"Needs clear install steps and warranty handling."},
-    {"name":"Flash — Budget-Conscious Couple","segment":"Homeowner","bio":"Watching expenses.",
-     "note":"Open to DIY if upfront under $150 and payback <12 months."},
-    {"name":"Flash — Pet Owner","segment":"Homeowner","bio":"Dog sleeps in warmest room.",
-     "note":"Wants quieter airflow at night; noise matters."},
-    {"name":"Flash — Tech Skeptic","segment":"Homeowner","bio":"Avoids 'smart' gadgets.",
-     "note":"Needs simple, non-intrusive device with tangible savings."},
-]
-
-# ---------- Segment-tailored question banks (open vs leading governs trust) ----------
-# Each question has a short "label" for the button and "text" for the full question shown after selection
-QB = {
-    "Homeowner": [
-        {"key":"habit_home","label":"Heating/cooling habits","text":"Tell me about your habits for heating and cooling your home.","kind":"open"},
-        {"key":"starters1","label":"Walk through an uncomfortable day","text":"Walk me through a typical day when a room feels uncomfortable.","kind":"open"},
-        {"key":"starters2","label":"Last time temp felt off","text":"Tell me about the last time the temperature felt off. What happened?","kind":"open"},
-        {"key":"impact","label":"Impact on daily life","text":"What does this problem stop you from doing, or make harder?","kind":"open"},
-        {"key":"workarounds","label":"What you've tried","text":"What have you tried so far? How did it go?","kind":"open"},
-        {"key":"frequency","label":"How often it happens","text":"How often does this happen in a typical month?","kind":"open"},
-        {"key":"bill","label":"Energy bill impact","text":"How did your energy bill change when this was worst?","kind":"open"},
-        {"key":"priorities","label":"Top priority right now","text":"What matters most right now: saving energy, convenience, saving money, or home comfort?","kind":"open"},
-        {"key":"leading_buy","label":"Would you buy a fix?","text":"Would you buy a device to fix airflow if it was affordable?","kind":"leading"},
-        {"key":"solutioning","label":"What if: smart vents?","text":"What if I built smart vents you could control by phone?","kind":"leading"},
-    ],
-    "Renter": [
-        {"key":"habit_renter","label":"Managing without control","text":"How do you manage heating and cooling when you can't change the system?","kind":"open"},
-        {"key":"last_time","label":"Last uncomfortable night","text":"Tell me about the last night it was uncomfortable. What did you do?","kind":"open"},
-        {"key":"impact","label":"Impact on sleep/work/bills","text":"How does this affect sleep, work, or bills?","kind":"open"},
-        {"key":"workarounds","label":"Workarounds tried","text":"What workarounds have you tried?","kind":"open"},
-        {"key":"frequency","label":"How often it happens","text":"How often does this happen in a month?","kind":"open"},
-        {"key":"bill","label":"Bill changes from fans/heaters","text":"How does your electric bill change when you use heaters or fans?","kind":"open"},
-        {"key":"priorities","label":"What matters most","text":"Which matters most: comfort, saving money, or convenience?","kind":"open"},
-        {"key":"leading_buy","label":"Pay monthly for better airflow?","text":"If it were renter-friendly, would you pay monthly for better airflow?","kind":"leading"},
-        {"key":"solutioning","label":"What if: clip-on vents + app?","text":"What if there were clip-on vents with an app?","kind":"leading"},
-    ],
-    "Landlord": [
-        {"key":"habit_land","label":"Biggest HVAC frustrations","text":"What are your biggest frustrations with heating and cooling across units?","kind":"open"},
-        {"key":"last_wave","label":"Last heat/cold wave calls","text":"Tell me about the last cold or heat wave. What calls came in?","kind":"open"},
-        {"key":"impact","label":"Effect on renewals/reviews","text":"How do comfort complaints affect renewals or reviews?","kind":"open"},
-        {"key":"ops","label":"Current balancing process","text":"How do you currently handle balancing and follow-ups?","kind":"open"},
-        {"key":"frequency","label":"Ticket frequency per season","text":"How often do these tickets appear in a season?","kind":"open"},
-        {"key":"costs","label":"Where costs spike","text":"Where do costs spike: labor, equipment, or damages?","kind":"open"},
-        {"key":"priorities","label":"Top ops priority","text":"What's the top priority: fewer complaints, lower ops cost, or faster response?","kind":"open"},
-        {"key":"leading_buy","label":"Pay per unit for a fix?","text":"Would you pay per unit for a retrofit that reduces complaints?","kind":"leading"},
-        {"key":"solutioning","label":"What if: smart vents for techs?","text":"What if techs could clip on smart vents and see fewer callbacks?","kind":"leading"},
-    ],
-    "Installer": [
-        {"key":"habit_inst","label":"Post-install complaint patterns","text":"What patterns do you see when customers complain about comfort after installs?","kind":"open"},
-        {"key":"cases","label":"A recent revisit case","text":"Tell me about a recent case you had to revisit.","kind":"open"},
-        {"key":"impact","label":"Callback impact on margins","text":"How do callbacks affect your schedule or margins?","kind":"open"},
-        {"key":"methods","label":"Current diagnosis methods","text":"How do you currently balance airflow or diagnose issues?","kind":"open"},
-        {"key":"frequency","label":"Revisit frequency","text":"How often are revisits needed during season changes?","kind":"open"},
-        {"key":"proof","label":"Proof customers want","text":"What proof do customers ask for to believe improvements?","kind":"open"},
-        {"key":"priorities","label":"Install vs reliability vs upsell","text":"What matters most: simple install, reliability, or upsell potential?","kind":"open"},
-        {"key":"leading_buy","label":"Recommend a reliable add-on?","text":"Would you recommend an add-on if it's reliable and profitable?","kind":"leading"},
-        {"key":"solutioning","label":"What if: auto-balancing kit?","text":"What if a kit made balancing automatic. Would that help?","kind":"leading"},
-    ],
-}
-
-# ---------- Segment-level default answers ----------
-SEGMENT_ANSWERS = {
-    "Homeowner": {
-        "habit_home":"We try to keep a steady set point, but afternoons heat up upstairs.",
-        "starters1":"By evening the nursery hits high 70s; downstairs stays cooler.",
-        "starters2":"Last week during a warm spell, the bedroom hit 79°F at 10pm.",
-        "impact":"Poor sleep for kids; we move fans and argue over the thermostat.",
-        "workarounds":"We half-close vents, run a box fan, sometimes a space heater.",
-        "frequency":"Maybe 8–12 times a month in summer.",
-        "bill":"Bills go up 20–25% mid-summer.",
-        "priorities":"Comfort first at night, but bills matter too.",
-        "leading_buy":"Maybe, if it actually works and isn't loud.",
-        "solutioning":"It'd have to be simple, quiet, and safe around kids."
-    },
-    "Renter": {
-        "habit_renter":"I open windows, use a fan; landlord controls the boiler.",
-        "last_time":"Two nights ago the bedroom was way too warm; I slept on the couch.",
-        "impact":"Sleep suffers; studying is harder; bill creeps up with the fan.",
-        "workarounds":"Fan, window, lighter bedding; landlord is slow.",
-        "frequency":"5–10 nights a month in summer.",
-        "bill":"Electric bill rises $15–30 those months.",
-        "priorities":"Comfort, then cost; I can't change the system.",
-        "leading_buy":"If renter-friendly and I can take it with me—maybe.",
-        "solutioning":"Landlord approval could be an issue—how would that work?"
-    },
-    "Landlord": {
-        "habit_land":"Complaints cluster on first cold week—phones light up.",
-        "last_wave":"Three units called same night; top floors too cold.",
-        "impact":"Bad reviews and sometimes lost renewals.",
-        "ops":"We ask tenants to adjust dampers; sometimes send techs to rebalance.",
-        "frequency":"At season change, then a few times per month.",
-        "costs":"Labor overtime is the big hit; not utilities.",
-        "priorities":"Fewer complaints with minimal complexity.",
-        "leading_buy":"If it cuts complaints without extra headaches, yes.",
-        "solutioning":"Needs clear install steps, durability, and warranty."
-    },
-    "Installer": {
-        "habit_inst":"Often renovations leave ducts unbalanced; returns far from rooms.",
-        "cases":"New furnace; back room still cold; had to revisit to balance.",
-        "impact":"Callbacks wreck the schedule and margins.",
-        "methods":"Manual damper balancing; sometimes recommend new thermostat.",
-        "frequency":"Weekly during season changes.",
-        "proof":"Customers want before/after temps or energy data.",
-        "priorities":"Simple install and reliability; upsell helps.",
-        "leading_buy":"If reliable and upsell-ready, sure.",
-        "solutioning":"Only if it won't jam and support is solid."
-    },
-}
-
 # ---------- State ----------
-def init_state():
-    st.session_state.s1 = {
-        "stage":"intro",
-        "alloc":{k:0 for k in CHANNELS},
-        "booked_ids":[],
-        "current_idx":0,           # walk through interviews one by one
-        "interview":{},            # pid -> dict: asked set, q_count, trust, transcript, ended
-        "flash_open":[],
-        "analytics":{},
-        "draft_struct":{           # structured inputs for hypothesis and test
-            "who":"",
-            "core_pain":"",
-            "trigger":"",
-            "impact":"",
-            "workaround":"",
-            "quantifier":"",
-            "next_method":"",
-            "next_target":""
-        },
-        "chosen_segment": None,           # learner's chosen ICP for next step
-        "chosen_pain": None,              # learner's chosen primary pain
-        "decision": "Proceed",            # Proceed / Narrow / Pivot
-        "problem_text":"",
-        "next_test_text":"",
-        "submitted_draft":False,
-        "score":None,
-        "reasons":{},
-        # Active synthesis: student guesses before seeing data
-        "synth_guess_top1": None,
-        "synth_guess_top2": None,
-        "synth_guess_submitted": False,
-    }
-if "s1" not in st.session_state:
-    init_state()
-S = st.session_state.s1
-
-def clamp(x,a,b): return max(a, min(b, x))
+# Sessions are snapshotted to the store and resumed by the ?sid= in the URL.
+@st.cache_resource
+def session_store() -> WriteBehind:
+    return WriteBehind(open_store())
+
+@st.cache_resource
+def event_log() -> Optional[EventLog]:
+    path = os.environ.get("SIM_EVENTS", "events.jsonl")
+    return EventLog(path) if path else None
+
+# Cohort ranks for the score page; other server processes' submissions show up within RANKS_MAX_AGE seconds.
+RANKS_MAX_AGE = 30
+
+@st.cache_resource
+def score_ranks() -> ScoreRanks:
+    return ScoreRanks(STORE.score_counts())
+
+STORE = session_store()
+EVENT_LOG = event_log()
+# ?debug=1 only shows the panel; collecting is switched on for the whole process by SIM_PROFILE
+DEBUG = profiling.enabled() and st.query_params.get("debug") == "1"
+profiling.instrument(Simulation, "book", "ask", "run_synthesis", "compute_score", "_fold_analytics")
+SID = st.query_params.get("sid", "")
+if not valid_sid(SID):
+    SID = st.query_params["sid"] = new_sid()
+
+def init_state(state=None):
+    sim = st.session_state.sim = Simulation(state)
+    sim.on_change = snapshotter(STORE, SID)
+    if EVENT_LOG is not None:
+        EVENT_LOG.attach(sim, SID, fresh=state is None)
+if "sim" not in st.session_state:
+    stored = STORE.load(SID)
+    init_state(load_state(stored) if stored else None)
+SIM = st.session_state.sim
+S = SIM.s
 
 # ---------- Stage bar ----------
 STAGES = ["intro","target","live","flash","synth","draft","score"]
@@ -279,7 +85,7 @@ def stage_bar():
         if i < current_idx:
             # Completed stage: clickable, checkmark
             if cols[i].button(f"✅ {label}", key=f"nav_{key}"):
-                S["stage"] = key
+                SIM.set_stage(key)
                 st.rerun()
         elif i == current_idx:
             # Current stage: highlighted
@@ -304,7 +110,7 @@ def compute_progress():
         if booked == 0:
             within = 0.0
         else:
-            done = sum(1 for pid in S["booked_ids"] if S["interview"].get(pid, {}).get("ended", False))
+            done = sum(1 for pid in S["booked_ids"] if pid in S["interview"] and S["interview"][pid].ended)
             within = done / booked
     elif S["stage"] == "flash":
         within = min(1.0, len(S["flash_open"]) / 5)
@@ -319,332 +125,6 @@ def compute_progress():
 
     return min(1.0, base + within * step)
 
-# ---------- Recruitment ----------
-def recruit_personas(alloc: Dict[str,int], need:int=6) -> List[int]:
-    # Seed based on allocation so results are stable across reruns with same inputs
-    seed_val = hash(tuple(sorted(alloc.items())))
-    rng = random.Random(seed_val)
-    weights=[]
-    for i,p in enumerate(INTERVIEW_PERSONAS):
-        seg = p["segment"]
-        w=0.0
-        for ch, t in alloc.items():
-            if t<=0: continue
-            chp=CHANNELS[ch]
-            w += t * chp["yield"] * chp["bias"].get(seg,0.1) * rng.uniform(0.85,1.15)
-        weights.append((i, max(0.0001,w)))
-    total = sum(w for _,w in weights)
-    probs = [w/total for _,w in weights]
-    chosen=set()
-    attempts = 0
-    while len(chosen)<min(need,len(INTERVIEW_PERSONAS)) and attempts < 100:
-        r=rng.random(); cum=0
-        for idx,(i,w) in enumerate(weights):
-            cum += probs[idx]
-            if r<=cum:
-                chosen.add(i); break
-        attempts += 1
-    return list(chosen)
-
-# ---------- Interview engine ----------
-def init_interview(pid:int):
-    p = INTERVIEW_PERSONAS[pid]
-    if pid in S["interview"]: return
-    keys = [q["key"] for q in QB[p["segment"]]]
-    random.Random(pid).shuffle(keys)
-    S["interview"][pid] = {
-        "asked":set(), "left":keys, "q_count":0,
-        "trust": 0.4 if p["segment"] in ["Landlord","Installer"] else 0.5,
-        "transcript":[], "ended":False
-    }
-
-def selectable(pid:int)->List[Dict[str,Any]]:
-    stt=S["interview"][pid]
-    seg = INTERVIEW_PERSONAS[pid]["segment"]
-    bank = {q["key"]:q for q in QB[seg]}
-    left=[k for k in stt["left"] if k not in stt["asked"]]
-    # sort: open first
-    objs=[bank[k] for k in left]
-    objs.sort(key=lambda q: 0 if q["kind"]=="open" else 1)
-    return objs[:5]
-
-# Persona-specific answer overrides for curveball personas
-PERSONA_OVERRIDES = {
-    "Trent Holloway": {
-        "habit_home": "Honestly, our house stays pretty comfortable. The system is only two years old.",
-        "starters1": "I don't really have uncomfortable days. Maybe once in a while I notice the upstairs is a degree or two warmer, but nothing serious.",
-        "starters2": "I can't think of a specific time recently. It's more of a 'nice to have' optimization thing for me.",
-        "impact": "It doesn't really stop me from doing anything. I just like the idea of having total control over every room.",
-        "workarounds": "I haven't really needed to try anything. The house is fine.",
-        "frequency": "Maybe once a month I notice something? It's really not frequent.",
-        "bill": "Our bills are pretty normal. No big surprises.",
-        "priorities": "Honestly, I just like cool tech. If it connects to my smart home setup, I'm interested.",
-        "leading_buy": "Oh absolutely, I'd buy it. I love trying new smart home stuff. Take my money!",
-        "solutioning": "Yes, that sounds amazing. When can I get one? Does it work with HomeKit?",
-    },
-    "Debra Cassidy": {
-        "habit_home": "We run the AC hard in summer but the upstairs never really cools down properly.",
-        "starters1": "By 3pm the master bedroom is noticeably warm. The AC is blasting but it's like the air isn't reaching up there.",
-        "starters2": "Last July we had a week where the bedroom hit 82 even with the AC set to 72. We ended up sleeping downstairs.",
-        "impact": "Sleep is terrible in summer. We fight about the thermostat constantly.",
-        "workarounds": "We bought a window AC unit for the bedroom. It helps but it's loud and expensive to run.",
-        "frequency": "Every day from June through September, really.",
-        "bill": "Summer bills are brutal. Over $300 some months. The window unit alone adds probably $40-50.",
-        "priorities": "Comfort upstairs. I just want the bedroom to be cool at night.",
-        "leading_buy": "If it would actually fix the upstairs, yes. We already had a duct guy look at it and he said the ducts were fine though.",
-        "solutioning": "Maybe? But we already had someone check the vents and they said airflow was normal. I'm not sure vents are the problem.",
-    },
-}
-
-def answer_for(pid:int, qkey:str)->str:
-    p = INTERVIEW_PERSONAS[pid]
-    trust = S["interview"][pid]["trust"]
-
-    # Check for persona-specific override first
-    if p["name"] in PERSONA_OVERRIDES and qkey in PERSONA_OVERRIDES[p["name"]]:
-        base = PERSONA_OVERRIDES[p["name"]][qkey]
-    else:
-        base = SEGMENT_ANSWERS[p["segment"]].get(qkey, "Not sure.")
-
-    extra=""
-    if trust >= p["tell_threshold"]:
-        mats=[x for x in p["pains"] if x["material"]]
-        if mats:
-            top=max(mats, key=lambda d:d["freq"]+d["sev"])
-            if qkey in ["impact","workarounds","starters2","last_time","ops","methods"]:
-                extra += f" The key issue is: {top['text']}."
-        if qkey in ["bill","costs"]:
-            extra += " We see a noticeable jump during peak months."
-        if p["wtp_ceiling"]>0 and qkey in ["leading_buy","solutioning"]:
-            extra += f" I might pay up to about ${p['wtp_ceiling']}/month if it really helps."
-    if hash(f"{pid}_{qkey}") % 5 == 0:
-        extra += " It does vary week to week."
-    return base + ((" " + extra) if extra else "")
-
-def ask(pid:int, qkey:str, qtext:str):
-    stt=S["interview"][pid]
-    seg = INTERVIEW_PERSONAS[pid]["segment"]
-    kind = next(q["kind"] for q in QB[seg] if q["key"]==qkey)
-    # trust dynamics
-    stt["trust"] = clamp(stt["trust"] + (0.06 if kind=="open" else -0.08), 0, 1)
-    ans = answer_for(pid, qkey)
-    stt["transcript"].append({"q":qtext,"a":ans,"kind":kind})
-    stt["asked"].add(qkey)
-    stt["q_count"] += 1
-    S["interview"][pid]=stt
-
-# ---------- Synthesis ----------
-def run_synthesis():
-    pain_kw = {
-        "Hot room": ["hot", "overheat", "sticky", "warm", "hotter"],
-        "Cold room": ["cold", "draft", "chilly", "freezing", "cool"],
-        "High bill": ["bill", "cost", "expensive", "spike", "pric"],
-        "No control": ["landlord", "no control", "cannot change", "slow to respond"],
-        "Noise": ["noisy", "loud", "vent noise", "quiet"],
-    }
-    clusters = {k: 0 for k in pain_kw}
-    quotes = {k: [] for k in pain_kw}
-
-    # segment -> cluster counts
-    segments = ["Homeowner", "Renter", "Landlord", "Installer"]
-    seg_cluster = {seg: {c: 0 for c in pain_kw} for seg in segments}
-
-    # interviews: aggregate with TWO multipliers:
-    #   (a) depth weight — more questions asked = deeper signal
-    #   (b) segment saturation decay — each additional interview in the same
-    #       segment yields LESS information density. After the 3rd interview
-    #       in a segment, each new interview's signal decays as 0.8^(n-3).
-    #       This is the real phenomenon: the 5th homeowner tells you very
-    #       little the first 3 didn't. Forces learners to diversify segments.
-    interviews_done = 0
-    total_questions_asked = 0
-    # Sort interview PIDs by booking order so we count in sequence per segment
-    ordered_pids = [pid for pid in S["booked_ids"] if pid in S["interview"] and S["interview"][pid]["q_count"] > 0]
-    segment_interview_count = {seg: 0 for seg in segments}
-    saturation_by_seg: Dict[str, float] = {}   # avg saturation per segment for display
-    for pid in ordered_pids:
-        stt = S["interview"][pid]
-        interviews_done += 1
-        total_questions_asked += stt["q_count"]
-        seg = INTERVIEW_PERSONAS[pid]["segment"]
-        segment_interview_count[seg] += 1
-        n_in_seg = segment_interview_count[seg]
-        # Saturation decay: full value for first 3, then 0.8^(n-3)
-        saturation = 1.0 if n_in_seg <= 3 else 0.8 ** (n_in_seg - 3)
-        saturation_by_seg[seg] = saturation  # latest saturation for that segment
-        # Depth weight: more questions = deeper signal
-        depth_weight = min(2.0, 1.0 + (stt["q_count"] - MIN_QUESTIONS_PER_INTERVIEW) * 0.25)
-        depth_weight = max(0.5, depth_weight)
-        # Effective weight = depth × saturation
-        eff_weight = depth_weight * saturation
-        for t in stt["transcript"]:
-            txt = (t["q"] + " " + t["a"]).lower()
-            for c, words in pain_kw.items():
-                if any(w in txt for w in words):
-                    clusters[c] += eff_weight
-                    seg_cluster[seg][c] += eff_weight
-                    if len(quotes[c]) < 3:
-                        quotes[c].append(t["a"])
-
-        # Bonus: if trust was high enough to unlock material pains, count those
-        p = INTERVIEW_PERSONAS[pid]
-        if stt["trust"] >= p["tell_threshold"]:
-            for pain in p["pains"]:
-                if pain["material"]:
-                    pain_text = pain["text"].lower()
-                    for c, words in pain_kw.items():
-                        if any(w in pain_text for w in words):
-                            # Material-pain unlocks also decay with saturation
-                            clusters[c] += pain["freq"] * 0.5 * saturation
-                            seg_cluster[seg][c] += pain["freq"] * 0.5 * saturation
-
-    # Round cluster counts for display
-    clusters = {k: round(v, 1) for k, v in clusters.items()}
-    for seg in seg_cluster:
-        seg_cluster[seg] = {c: round(v, 1) for c, v in seg_cluster[seg].items()}
-
-    # flash bursts
-    flash_count = len(S["flash_open"])
-    for fidx in S["flash_open"]:
-        f = FLASH_PERSONAS[fidx]
-        txt = (f["bio"] + " " + f["note"]).lower()
-        for c, words in pain_kw.items():
-            if any(w in txt for w in words):
-                clusters[c] += 1
-                if len(quotes[c]) < 3:
-                    quotes[c].append(f["note"])
-
-    # coverage & bias
-    segs = [INTERVIEW_PERSONAS[pid]["segment"] for pid in S["booked_ids"]]
-    seg_mix = {s: segs.count(s) for s in set(segs)} if segs else {}
-
-    total_alloc = sum(S["alloc"].values())
-    top_ch = max(S["alloc"], key=lambda k: S["alloc"][k]) if total_alloc > 0 else None
-    bias_flag = total_alloc > 0 and top_ch and S["alloc"][top_ch] > 0.6 * total_alloc
-
-    # Continuous sampling-bias concentration score (Herfindahl-style on channels + segments)
-    if total_alloc > 0:
-        ch_shares = [v/total_alloc for v in S["alloc"].values() if v > 0]
-        ch_hhi = sum(s*s for s in ch_shares)  # 1.0 = all one channel, low = diverse
-    else:
-        ch_hhi = 1.0
-    if seg_mix:
-        seg_total = sum(seg_mix.values())
-        seg_shares = [v/seg_total for v in seg_mix.values() if v > 0]
-        seg_hhi = sum(s*s for s in seg_shares)
-    else:
-        seg_hhi = 1.0
-    bias_score = round(0.5 * ch_hhi + 0.5 * seg_hhi, 3)  # 0=perfect diversity, 1=total concentration
-
-    # Average "last-interview saturation" across segments the learner hit.
-    # 1.0 = every segment still yielding new info; <0.5 = grinding same segment.
-    avg_saturation = (sum(saturation_by_seg.values()) / len(saturation_by_seg)
-                      if saturation_by_seg else 1.0)
-
-    S["analytics"] = {
-        "clusters": clusters,
-        "quotes": quotes,
-        "seg_mix": seg_mix,
-        "bias_flag": bias_flag,
-        "bias_score": bias_score,
-        "top_channel": top_ch,
-        "seg_cluster": seg_cluster,
-        "interviews_done": interviews_done,
-        "flash_count": flash_count,
-        "total_questions": total_questions_asked,
-        "segment_interview_count": segment_interview_count,
-        "avg_saturation": round(avg_saturation, 2),
-    }
-
-# ---------- Scoring ----------
-def compute_score():
-    # craft
-    total_q=open_q=lead_q=0; trusts=[]
-    for pid, stt in S["interview"].items():
-        if stt["q_count"]>0: trusts.append(stt["trust"])
-        for t in stt["transcript"]:
-            total_q+=1
-            if t["kind"]=="open": open_q+=1
-            else: lead_q+=1
-    open_pct = open_q/max(1,total_q)
-    lead_pct = lead_q/max(1,total_q)
-    avg_trust = sum(trusts)/max(1,len(trusts))
-    craft = 0.5*min(1.0, open_pct/0.7) + 0.3*max(0, 1 - max(0,(lead_pct-0.15)/0.85)) + 0.2*min(1.0, avg_trust/0.6)
-    craft_score=int(100*craft)
-
-    # coverage — composite of segment diversity, channel balance, and saturation
-    seg_div=len(S["analytics"].get("seg_mix",{}))
-    channel_ok = 0 if S["analytics"].get("bias_flag") else 1
-    seg_base = 0.7 if seg_div>=4 else 0.5 if seg_div>=3 else 0.2 if seg_div==2 else 0.1
-    coverage = clamp(seg_base + 0.3*channel_ok, 0, 1)
-    # Continuous sampling-bias penalty (HHI-based concentration).
-    bias_score = S["analytics"].get("bias_score", 0)
-    if bias_score > 0.6:
-        # linear penalty from 0% at bias=0.6 to 30% at bias=1.0
-        penalty = min(0.30, (bias_score - 0.6) * 0.75)
-        coverage = max(0.0, coverage * (1 - penalty))
-    # Saturation penalty: the 5th homeowner interview tells you almost
-    # nothing the first 3 didn't. If the learner ground a single segment,
-    # their last interviews added <50% of an early interview's info value —
-    # which means their headline "N interviews" overstates coverage.
-    avg_sat = S["analytics"].get("avg_saturation", 1.0)
-    if avg_sat < 0.7:
-        # Linear penalty: 0% at 0.7, up to 25% at 0.3
-        sat_penalty = min(0.25, (0.7 - avg_sat) * 0.625)
-        coverage = max(0.0, coverage * (1 - sat_penalty))
-    coverage_score=int(100*coverage)
-
-    # detection (less brittle): match learner-picked primary pain against top-2 clusters;
-    # use text only for extra credit if numbers present
-    clusters = S["analytics"]["clusters"]
-    top2 = sorted(clusters.items(), key=lambda kv: kv[1], reverse=True)[:2]
-    top_names = [k for k,_ in top2]
-    picked = S.get("chosen_pain")
-    aligned = 1 if (picked in top_names) else 0
-    hypo = S["problem_text"].lower()
-    quantified = 1 if any(x in hypo for x in ["%", " times", " per ", " degree", "$"]) else 0
-    detection = clamp(0.75*aligned + 0.25*quantified, 0, 1)
-    detection = int(100*detection)
-
-    # problem: check for specificity and grounding in interview data
-    who_ok = any(s in hypo for s in ["homeowner","renter","landlord","installer"])
-    trig_ok = any(s in hypo for s in ["heat","cold","bill","complain","night","summer","winter","season","spike","draft"])
-    testable_ok = any(s in hypo for s in ["measure","within","increase","reduce","by ","per month","per week","times"])
-    # Bonus: references specific personas, quotes, or interview findings
-    quotes_all = S["analytics"].get("quotes", {})
-    verbatim_refs = 0
-    for cluster_quotes in quotes_all.values():
-        for q in cluster_quotes:
-            # Check if any meaningful phrase from a quote appears in the hypothesis
-            words = [w for w in q.lower().split() if len(w) > 5]
-            if any(w in hypo for w in words):
-                verbatim_refs += 1
-                break
-    evidence_ok = 1 if verbatim_refs > 0 else 0
-    # Length check: very short statements are likely low-effort
-    length_ok = 1 if len(S["problem_text"].strip()) > 80 else 0.5
-    problem=int(100*clamp(0.25*who_ok + 0.25*trig_ok + 0.2*testable_ok + 0.15*evidence_ok + 0.15*length_ok, 0, 1))
-
-    # next test
-    nxt=S["next_test_text"].lower()
-    method_ok = any(s in nxt for s in ["landing","preorder","pilot","trial","survey","interview","prototype","a/b"])
-    threshold_ok = any(x in nxt for x in ["target", ">=", "<=", "%", " signups", " conversions", " complaints"])
-    next_score=int(100*clamp(0.5*method_ok+0.5*threshold_ok,0,1))
-
-    total=int(0.30*craft_score + 0.15*coverage_score + 0.30*detection + 0.15*problem + 0.10*next_score)
-
-    S["score"]={"total":total,"components":{
-        "Interview Craft":craft_score,"Coverage":coverage_score,
-        "Signal Detection":detection,"Problem Statement Quality":problem,
-        "Next Test Plan":next_score}}
-    S["reasons"]={
-        "Interview Craft": f"Open {int(open_pct*100)}%, leading {int(lead_pct*100)}%, avg trust {avg_trust:.2f} (targets: ≥70% open, ≤15% leading, trust ≥0.6).",
-        "Coverage": f"Segments: {', '.join(S['analytics'].get('seg_mix',{}).keys()) or 'none'}. Channel bias: {'high' if S['analytics'].get('bias_flag') else 'balanced'}.",
-        "Signal Detection": f"Primary pain you chose: {picked or '—'}; top cluster(s): {', '.join(top_names) or '—'}; quantification: {'yes' if quantified else 'no'}.",
-        "Problem Statement": "Checked for specific who, triggers, and testable phrasing.",
-        "Next Test Plan": "Checked for clear method and a measurable threshold."
-    }
-
 # ---------- Header ----------
 def header():
     st.title(TITLE)
@@ -679,7 +159,7 @@ and making a call on where to go next.
 **About 15–20 minutes.** Write like a founder, not a student. Your hypothesis is a bet.
 """)
     if st.button("Start simulation", type="primary"):
-        S["stage"]="target"; st.rerun()
+        SIM.set_stage("target"); st.rerun()
 
 def page_target():
     st.subheader("Target & recruit")
@@ -688,7 +168,7 @@ def page_target():
     with c1:
         total=0
         for ch in CHANNELS:
-            S["alloc"][ch] = st.number_input(ch, min_value=0, max_value=5, step=1, value=S["alloc"][ch], key=f"alloc_{ch}")
+            SIM.set_alloc(ch, st.number_input(ch, min_value=0, max_value=5, step=1, value=S["alloc"][ch], key=f"alloc_{ch}"))
             total += S["alloc"][ch]
     with c2:
         st.metric("Tokens allocated", f"{total}/{EFFORT_TOKENS}")
@@ -696,16 +176,11 @@ def page_target():
             st.error("You allocated more than 10 tokens. Reduce some numbers.")
     if st.button("Book personas"):
         if total<=EFFORT_TOKENS:
-            S["booked_ids"]=recruit_personas(S["alloc"], need=6)
-            S["interview"].clear()
-            for pid in S["booked_ids"]:
-                init_interview(pid)
-            S["current_idx"]=0
-            S["stage"]="live"; st.rerun()
+            SIM.book(need=6)
+            SIM.set_stage("live"); st.rerun()
         else:
             st.warning("Fix token allocation before booking.")
 
-MIN_QUESTIONS_PER_INTERVIEW = 4
 
 def rapport_indicator(trust: float) -> str:
     """Return a visual rapport level based on trust score."""
@@ -715,29 +190,15 @@ def rapport_indicator(trust: float) -> str:
         return "🟡 Building rapport"
     else:
         return "🔴 Low rapport"
-
-def page_live():
-    st.subheader("Live interviews")
-    st.caption("Interview everyone you booked. Open questions build trust; leading or solution-focused questions can reduce it.")
-    st.markdown(f"**Interviews booked:** {len(S['booked_ids'])}")
-    # Top summary of booked
-    with st.expander("Booked personas (bios)"):
-        for pid in S["booked_ids"]:
-            p=INTERVIEW_PERSONAS[pid]
-            st.markdown(f"- **{p['name']}** — {p['segment']}  \n  _{p['bio']}_")
-
-    if not S["booked_ids"]:
-        st.warning("No personas booked. Go back to Target & recruit.")
-        return
-
-    # Guided one-by-one
+TRANSCRIPT_WINDOW = 6
+
+# The current interview is a fragment: asking a question reruns only this panel,
+# not header(), stage_bar() or the booked-persona bios. Ending an interview or
+# moving on changes page-level state, so those still trigger a full rerun.
+@st.fragment
+@timed("fragment/interview_panel")
+def interview_panel():
     idx = S["current_idx"]
-    if idx >= len(S["booked_ids"]):
-        st.success("You've finished all booked interviews.")
-        if st.button("Go to Flash Bursts"):
-            S["stage"]="flash"; st.rerun()
-        return
-
     pid = S["booked_ids"][idx]
     p = INTERVIEW_PERSONAS[pid]
     stt=S["interview"][pid]
@@ -747,16 +208,16 @@ def page_live():
     with hcol1:
         st.markdown(f"### Interview {idx+1} of {len(S['booked_ids'])}: **{p['name']}** — {p['segment']}")
     with hcol2:
-        st.markdown(f"**{rapport_indicator(stt['trust'])}**")
+        st.markdown(f"**{rapport_indicator(stt.trust)}**")
 
     st.write(f"**Bio:** {p['bio']}")
     st.write(f"**Known workaround:** {p['workaround']}")
     st.divider()
 
-    if not stt["ended"]:
+    if not stt.ended:
         # Show available questions with short labels; distinguish open vs leading
-        opts = selectable(pid)
-        st.markdown(f"**Choose your next question** ({stt['q_count']}/{MIN_QUESTIONS_PER_INTERVIEW} minimum)")
+        opts = SIM.selectable(pid)
+        st.markdown(f"**Choose your next question** ({stt.q_count}/{MIN_QUESTIONS_PER_INTERVIEW} minimum)")
         for row in [opts[i:i+3] for i in range(0, len(opts), 3)]:
             cols = st.columns(len(row))
             for i,q in enumerate(row):
@@ -764,42 +225,71 @@ def page_live():
                 btn_label = q["label"]
                 if q["kind"] == "leading":
                     btn_label = f"⚠️ {btn_label}"
-                if cols[i].button(btn_label, key=f"q_{pid}_{q['key']}", help=q["text"]):
-                    ask(pid, q["key"], q["text"])
-                    st.rerun()
+                # on_click runs before the fragment rerun, so the panel renders the new turn in one pass
+                cols[i].button(btn_label, key=f"q_{pid}_{q['key']}", help=q["text"],
+                               on_click=SIM.ask, args=(pid, q["key"]))
 
         # Only allow ending after minimum questions
-        if stt["q_count"] >= MIN_QUESTIONS_PER_INTERVIEW:
+        if stt.q_count >= MIN_QUESTIONS_PER_INTERVIEW:
             if st.button("Thank and end interview"):
-                stt["ended"]=True; S["interview"][pid]=stt; st.rerun()
-        elif stt["q_count"] > 0:
-            remaining = MIN_QUESTIONS_PER_INTERVIEW - stt["q_count"]
+                SIM.end_interview(pid); st.rerun()
+        elif stt.q_count > 0:
+            remaining = MIN_QUESTIONS_PER_INTERVIEW - stt.q_count
             st.caption(f"Ask at least {remaining} more question{'s' if remaining > 1 else ''} before ending this interview.")
     else:
         st.success("Interview ended for this persona.")
         if st.button("Next interview"):
-            S["current_idx"] += 1
+            SIM.next_interview()
             st.rerun()
 
     st.markdown("#### Transcript")
-    if stt["transcript"]:
-        for turn in stt["transcript"]:
-            kind_tag = " *(leading)*" if turn["kind"] == "leading" else ""
-            st.write(f"**You:** {turn['q']}{kind_tag}")
-            st.write(f"**{p['name']}:** {turn['a']}")
+    if stt.q_count:
+        # Only the latest turns are rendered one by one; earlier ones collapse into a single block.
+        # Turn codes are sliced first and each formatted turn comes from turn_markdown's cache.
+        codes = stt.turns
+        earlier, recent = codes[:-TRANSCRIPT_WINDOW], codes[-TRANSCRIPT_WINDOW:]
+        if earlier:
+            with st.expander(f"Earlier turns ({len(earlier)})"):
+                st.markdown("\n\n".join(turn_markdown(pid, code) for code in earlier))
+        for code in recent:
+            st.markdown(turn_markdown(pid, code))
     else:
         st.caption("No questions asked yet.")
 
+def page_live():
+    st.subheader("Live interviews")
+    st.caption("Interview everyone you booked. Open questions build trust; leading or solution-focused questions can reduce it.")
+    st.markdown(f"**Interviews booked:** {len(S['booked_ids'])}")
+    # Top summary of booked
+    with st.expander("Booked personas (bios)"):
+        for pid in S["booked_ids"]:
+            p=INTERVIEW_PERSONAS[pid]
+            st.markdown(f"- **{p['name']}** — {p['segment']}  \n  _{p['bio']}_")
+
+    if not S["booked_ids"]:
+        st.warning("No personas booked. Go back to Target & recruit.")
+        return
+
+    # Guided one-by-one
+    idx = S["current_idx"]
+    if idx >= len(S["booked_ids"]):
+        st.success("You've finished all booked interviews.")
+        if st.button("Go to Flash Bursts"):
+            SIM.set_stage("flash"); st.rerun()
+        return
+
+    interview_panel()
+
     st.divider()
     # Minimum interviews gate: require at least 3 ended interviews before advancing.
     MIN_INTERVIEWS_ENDED = 3
-    ended_count = sum(1 for pid in S["booked_ids"] if S["interview"].get(pid, {}).get("ended"))
+    ended_count = sum(1 for pid in S["booked_ids"] if pid in S["interview"] and S["interview"][pid].ended)
     c1, c2 = st.columns(2)
     if c1.button("Back to Target"):
-        S["stage"]="target"; st.rerun()
+        SIM.set_stage("target"); st.rerun()
     if ended_count >= MIN_INTERVIEWS_ENDED:
         if c2.button("Go to Flash Bursts"):
-            S["stage"]="flash"; st.rerun()
+            SIM.set_stage("flash"); st.rerun()
     else:
         with c2:
             st.caption(f"End at least {MIN_INTERVIEWS_ENDED} interviews before advancing ({ended_count} of {MIN_INTERVIEWS_ENDED} done).")
@@ -818,9 +308,12 @@ def page_flash():
                 st.info(f["note"])
             else:
                 if opened<5 and st.button("Open", key=f"f_{i}"):
-                    S["flash_open"].append(i); st.rerun()
+                    SIM.open_flash(i); st.rerun()
     if st.button("Run synthesis"):
-        run_synthesis(); S["stage"]="synth"; st.rerun()
+        # ask() and open_flash() keep analytics current; only build them if nothing was booked yet
+        if not S["analytics"]:
+            SIM.run_synthesis()
+        SIM.set_stage("synth"); st.rerun()
 
 def page_synth():
     st.subheader("Synthesis sprint")
@@ -855,7 +348,7 @@ def page_synth():
 
         st.caption("Once you submit your guesses, you'll see the actual data and how your intuition compared.")
         if st.button("Lock in my guesses and show data"):
-            S["synth_guess_submitted"] = True
+            SIM.submit_guess()
             st.rerun()
         return
 
@@ -906,16 +399,18 @@ def page_synth():
 
         # Visualization: pains by customer segment
         st.markdown("**Pains by segment**")
-        df = pd.DataFrame(a["seg_cluster"]).T  # rows=segments, cols=clusters
-        st.bar_chart(df)
+        with span("render/synth_chart"):
+            import pandas as pd   # deferred: pandas is most of a cold start, and only the charts need it
+            df = pd.DataFrame(a["seg_cluster"]).T  # rows=segments, cols=clusters
+            st.bar_chart(df)
 
     st.divider()
     sc1, sc2 = st.columns(2)
     if sc1.button("Redo my guesses"):
-        S["synth_guess_submitted"] = False
+        SIM.redo_guess()
         st.rerun()
     if sc2.button("Next: Decide & draft"):
-        S["stage"] = "draft"; st.rerun()
+        SIM.set_stage("draft"); st.rerun()
 
 def page_draft():
     st.subheader("Decide & draft")
@@ -929,35 +424,7 @@ def page_draft():
     suggested_pains = [k for k,_ in top2] or list(cluster_counts.keys())
 
     # Pre-fill structured draft fields from interview data the first time the learner lands here.
-    ds = S["draft_struct"]
-    if not S.get("_draft_prefilled"):
-        top_cluster = top2[0][0] if top2 else "Cold room"
-        PAIN_DEFAULTS = {
-            "Cold room":  {"core_pain": "Cold room that no thermostat setting fixes",
-                           "trigger": "During winter evenings or early mornings",
-                           "impact": "Discomfort, sleep disruption, and rising energy bills"},
-            "Hot room":   {"core_pain": "A single room that overheats compared to the rest of the house",
-                           "trigger": "During summer afternoons or during heavy HVAC use",
-                           "impact": "Unusable space, family conflict over thermostat, wasted cooling"},
-            "High bill":  {"core_pain": "Energy bill keeps climbing without explanation",
-                           "trigger": "Peak heating and cooling seasons",
-                           "impact": "Household budget stress and loss of trust in current HVAC"},
-            "No control": {"core_pain": "No room-level control over temperature or airflow",
-                           "trigger": "Whenever any single occupant wants a different setting",
-                           "impact": "Constant compromise, arguments, and inefficient whole-home heating"},
-            "Noise":      {"core_pain": "HVAC system is loud enough to disrupt sleep and work",
-                           "trigger": "Whenever the system cycles on, especially at night",
-                           "impact": "Poor sleep, Zoom call disruption, and ongoing annoyance"},
-        }
-        defaults = PAIN_DEFAULTS.get(top_cluster, PAIN_DEFAULTS["Cold room"])
-        if not ds.get("core_pain"):   ds["core_pain"]   = defaults["core_pain"]
-        if not ds.get("trigger"):     ds["trigger"]     = defaults["trigger"]
-        if not ds.get("impact"):      ds["impact"]      = defaults["impact"]
-        if not ds.get("workaround"):  ds["workaround"]  = "Space heater, fan, closed vents, or tolerating it"
-        if not ds.get("quantifier"):  ds["quantifier"]  = f"{sum(cluster_counts.values())} mentions across interviews; {top2[0][1] if top2 else 0} tied to this cluster"
-        if not ds.get("next_method"): ds["next_method"] = "10-person concierge pilot with ThermaLoop install"
-        if not ds.get("next_target"): ds["next_target"] = "8 of 10 report noticeable improvement within 2 weeks"
-        S["_draft_prefilled"] = True
+    SIM.prefill_draft()
 
     # Decisions
     dc1, dc2, dc3 = st.columns(3)
@@ -981,15 +448,8 @@ def page_draft():
         ds["next_target"] = st.text_input("Success threshold (target)", value=ds.get("next_target",""))
 
     # Compose suggestions (not forced)
-    suggested_hypo = (
-        f"For {S['chosen_segment'].lower()}s, {ds['core_pain']} occurs around {ds['trigger']}, causing {ds['impact']}. "
-        f"They currently {ds['workaround']}. Evidence so far: {ds['quantifier']}."
-    ).strip()
-
-    suggested_next = (
-        f"Run a {ds['next_method']} targeting {S['chosen_segment'].lower()}s for 2–4 weeks. "
-        f"Success if {ds['next_target']}."
-    ).strip()
+    suggested_hypo = SIM.suggested_hypothesis()
+    suggested_next = SIM.suggested_next_test()
 
     st.markdown("**Problem Hypothesis (editable)**")
     S["problem_text"] = st.text_area("Problem Hypothesis", value=S["problem_text"] or suggested_hypo, height=110)
@@ -1013,9 +473,8 @@ def page_draft():
     st.caption("You must submit before scoring.")
     if st.button("Submit"):
         if can_submit:
-            run_synthesis()   # ensure analytics are fresh
-            S["submitted_draft"] = True
-            S["stage"] = "score"   # auto-advance after submit
+            SIM.submit_draft()
+            SIM.set_stage("score")   # auto-advance after submit
             st.rerun()
         else:
             if not struct_filled:
@@ -1026,12 +485,30 @@ def page_draft():
     st.divider()
     colA, colB = st.columns(2)
     if colA.button("Back to Synthesis"):
-        S["stage"] = "synth"; st.rerun()
+        SIM.set_stage("synth"); st.rerun()
     if colB.button("Go to Feedback & Score"):
-        if S["submitted_draft"]:
-            S["stage"] = "score"; st.rerun()
-        else:
+        if not S["submitted_draft"]:
             st.warning("Submit your hypothesis and next test first.")
+        elif can_submit:
+            SIM.submit_draft()   # resubmit, so edits since the last Submit are logged and scored
+            SIM.set_stage("score"); st.rerun()
+        else:
+            st.warning("Your edits left the draft incomplete; complete it and Submit again.")
+
+def cohort_ranks(score) -> ScoreRanks:
+    """Live cohort ranks, counting this session once per SID at its latest score (the store
+    remembers where each SID is counted, so reloads don't count the learner again and a
+    resubmit or restarted attempt moves the count)."""
+    ranks = score_ranks()
+    values = score_values(score)
+    if st.session_state.get("ranked") != (SID, values):
+        old = STORE.count_scores(SID, values)
+        if old is not None:
+            ranks.move(old, values)
+        st.session_state.ranked = (SID, values)
+    elif time.monotonic() - ranks.loaded > RANKS_MAX_AGE:
+        ranks.reload(STORE.score_counts())
+    return ranks
 
 def page_score():
     st.subheader("Feedback & score")
@@ -1039,14 +516,22 @@ def page_score():
         st.warning("Submit your hypothesis and next test before scoring.")
         return
     if not S.get("analytics"):
-        run_synthesis()
-    compute_score()
+        SIM.run_synthesis()
+    SIM.compute_score()
     sc=S["score"]
+    ranks = cohort_ranks(sc)
+    def rank(name, v):
+        share = ranks.better_than(name, v)
+        return "" if share is None else f"better than {100*share:.0f}% of your cohort"
     st.metric("Total score", f"{sc['total']}/100")
+    total_rank = rank("total", sc["total"])
+    if total_rank:
+        st.caption(f"You scored {total_rank}.")
     st.markdown("#### Components")
     for k,v in sc["components"].items():
         label = "Excellent" if v>=80 else ("Good" if v>=60 else "Needs work")
-        st.write(f"- **{k}:** {v}/100 — {label}")
+        r = rank(k, v)
+        st.write(f"- **{k}:** {v}/100 — {label}" + (f" · {r}" if r else ""))
         st.caption(S["reasons"].get(k,""))
 
     st.markdown("#### Key lessons for you")
@@ -1093,23 +578,22 @@ def page_score():
     st.markdown("#### Trust trajectory across your interviews")
     trust_rows = []
     for pid, stt in S["interview"].items():
-        if stt["q_count"] == 0:
+        if stt.q_count == 0:
             continue
         p = INTERVIEW_PERSONAS[pid]
-        start_trust = 0.4 if p["segment"] in ["Landlord", "Installer"] else 0.5
-        end_trust = stt["trust"]
-        delta = end_trust - start_trust
+        begin_trust = start_trust(p["segment"])
+        end_trust = stt.trust
+        delta = end_trust - begin_trust
         unlocked = end_trust >= p["tell_threshold"]
         trust_rows.append({
             "Persona": f"{p['name']} ({p['segment']})",
-            "Start trust": round(start_trust, 2),
+            "Start trust": round(begin_trust, 2),
             "End trust": round(end_trust, 2),
             "Δ": f"{delta:+.2f}",
             "Material pains unlocked": "Yes" if unlocked else "No",
         })
     if trust_rows:
-        df_trust = pd.DataFrame(trust_rows)
-        st.dataframe(df_trust, use_container_width=True, hide_index=True)
+        st.dataframe(trust_rows, use_container_width=True, hide_index=True)
         avg_delta = sum(float(r["Δ"]) for r in trust_rows) / len(trust_rows)
         if avg_delta >= 0.1:
             st.success(f"Average trust Δ: {avg_delta:+.2f}. Rapport built across interviews — material pains unlock at ≥ tell-threshold.")
@@ -1118,6 +602,24 @@ def page_score():
         else:
             st.info(f"Average trust Δ: {avg_delta:+.2f}. Mixed. Material pains reliably unlock only above a +0.10 average.")
 
+    # --- Expert path: the best questions for the same interviewees (solver.py) ---
+    with st.expander("Expert path: the best questions for your interviewees"):
+        # solved once per scored submission, not on every rerun of the page
+        key = SIM.score_key()
+        if st.session_state.get("expert_path", (None,))[0] != key:
+            with span("render/expert_path"):
+                st.session_state.expert_path = (key, expert_session(S))
+        paths, expert = st.session_state.expert_path[1]
+        st.caption(f"Asking these instead, with the same draft, would score {expert['total']}/100 "
+                   f"(Interview Craft {expert['components']['Interview Craft']}/100); you scored {sc['total']}/100.")
+        for path in paths:
+            p = INTERVIEW_PERSONAS[path.pid]
+            bank = bank_index(p["segment"]).by_key
+            st.markdown(f"**{p['name']}** ({p['segment']}): {len(path.keys)} questions, trust ends at {path.trust:.2f}"
+                        + (", material pains unlocked" if path.unlocked else ""))
+            st.markdown("\n".join(f"{i}. {'⚠️ ' if bank[k]['kind']=='leading' else ''}{bank[k]['text']}"
+                                   for i, k in enumerate(path.keys, 1)))
+
     # Sampling-bias concentration disclosure (continuous Herfindahl metric)
     bscore = S["analytics"].get("bias_score", 0)
     if bscore > 0.6:
@@ -1152,8 +654,7 @@ def page_score():
                 "Status": "Full-weight" if n <= 3 else "Saturating" if n <= 5 else "Over-sampled",
             })
         if sat_rows:
-            import pandas as _pd
-            st.dataframe(_pd.DataFrame(sat_rows), use_container_width=True, hide_index=True)
+            st.dataframe(sat_rows, use_container_width=True, hide_index=True)
         if avg_sat < 0.7:
             st.warning(
                 f"**Average saturation across segments: {avg_sat:.2f}** (below 0.70). "
@@ -1175,21 +676,23 @@ def page_score():
             ch_seg_data[ch] = {seg: round(tokens * weight, 1) for seg, weight in bias.items()}
 
     if ch_seg_data:
-        import altair as alt
-        df_ch = pd.DataFrame(ch_seg_data).T
-        df_ch.index.name = "Channel"
-        df_ch = df_ch.reset_index()
-        df_melted = df_ch.melt(id_vars="Channel", var_name="Segment", value_name="Reach")
-        _chart = alt.Chart(df_melted).mark_bar().encode(
-            x=alt.X("Channel:N", axis=alt.Axis(labelAngle=-35, labelLimit=200), sort=None),
-            y=alt.Y("Reach:Q", stack="zero"),
-            color=alt.Color("Segment:N", scale=alt.Scale(
-                domain=["Homeowner","Installer","Landlord","Renter"],
-                range=["#1f77b4","#7fbbdb","#d62728","#f4a0a0"]
-            )),
-            tooltip=["Channel","Segment","Reach"]
-        ).properties(height=350)
-        st.altair_chart(_chart, use_container_width=True)
+        with span("render/score_chart"):
+            import altair as alt
+            import pandas as pd
+            df_ch = pd.DataFrame(ch_seg_data).T
+            df_ch.index.name = "Channel"
+            df_ch = df_ch.reset_index()
+            df_melted = df_ch.melt(id_vars="Channel", var_name="Segment", value_name="Reach")
+            _chart = alt.Chart(df_melted).mark_bar().encode(
+                x=alt.X("Channel:N", axis=alt.Axis(labelAngle=-35, labelLimit=200), sort=None),
+                y=alt.Y("Reach:Q", stack="zero"),
+                color=alt.Color("Segment:N", scale=alt.Scale(
+                    domain=["Homeowner","Installer","Landlord","Renter"],
+                    range=["#1f77b4","#7fbbdb","#d62728","#f4a0a0"]
+                )),
+                tooltip=["Channel","Segment","Reach"]
+            ).properties(height=350)
+            st.altair_chart(_chart, use_container_width=True)
 
         # Highlight the lesson
         booked_segs = [INTERVIEW_PERSONAS[pid]["segment"] for pid in S["booked_ids"]]
@@ -1225,64 +728,7 @@ def page_score():
     st.markdown("#### Your Discovery Brief")
     st.caption("A portable summary of your findings. Copy this or use it as input for the next simulation.")
 
-    ds = S["draft_struct"]
-    a = S.get("analytics", {})
-    seg_mix = a.get("seg_mix", {})
-    clusters = a.get("clusters", {})
-    sorted_clusters = sorted(clusters.items(), key=lambda kv: kv[1], reverse=True)
-    top_pains = ", ".join([f"{k} ({v})" for k, v in sorted_clusters[:3]]) if sorted_clusters else "None"
-    booked_names = ", ".join([f"{INTERVIEW_PERSONAS[pid]['name']} ({INTERVIEW_PERSONAS[pid]['segment']})" for pid in S["booked_ids"]])
-
-    # Collect top quotes, deduplicating by base answer (before "The key issue is:" suffix)
-    import re as _re
-    top_quotes = []
-    _seen_bases = set()
-    for _, qs in a.get("quotes", {}).items():
-        for q in qs:
-            base = _re.split(r"\s*The key issue is:", q)[0].strip()
-            if base not in _seen_bases:
-                _seen_bases.add(base)
-                top_quotes.append(q)
-            if len(top_quotes) >= 3:
-                break
-        if len(top_quotes) >= 3:
-            break
-    quotes_text = "\n".join([f'  - "{q}"' for q in top_quotes]) if top_quotes else "  - (none captured)"
-
-    brief_text = f"""DISCOVERY BRIEF: ThermaLoop
-{'='*40}
-
-TARGET SEGMENT: {S.get('chosen_segment', '(not set)')}
-PRIMARY PAIN: {S.get('chosen_pain', '(not set)')}
-DECISION: {S.get('decision', 'Proceed')}
-
-PROBLEM HYPOTHESIS:
-{S['problem_text']}
-
-EVIDENCE SUMMARY:
-- Interviews conducted: {a.get('interviews_done', 0)}
-- Flash bursts reviewed: {a.get('flash_count', 0)}
-- Segments covered: {', '.join([f'{k} ({v})' for k, v in seg_mix.items()]) if seg_mix else 'None'}
-- Top pain clusters: {top_pains}
-- Key quotes:
-{quotes_text}
-
-NEXT TEST PLAN:
-{S['next_test_text']}
-
-STRUCTURED FIELDS:
-- Core pain: {ds.get('core_pain', '')}
-- Trigger: {ds.get('trigger', '')}
-- Impact: {ds.get('impact', '')}
-- Current workaround: {ds.get('workaround', '')}
-- Quantification: {ds.get('quantifier', '')}
-- Test method: {ds.get('next_method', '')}
-- Success threshold: {ds.get('next_target', '')}
-
-SCORE: {sc['total']}/100
-{'='*40}
-"""
-
+    brief_text = discovery_brief(S)
     st.code(brief_text, language=None)
     st.download_button(
         label="Download Discovery Brief (.txt)",
@@ -1295,19 +741,43 @@ SCORE: {sc['total']}/100
 
     c1,c2=st.columns(2)
     if c1.button("Restart simulation"):
-        init_state(); st.rerun()
+        init_state()
+        STORE.put(SID, dump_state(st.session_state.sim.s))
+        st.rerun()
     if c2.button("Back to Decide & Draft"):
-        S["stage"]="draft"; st.rerun()
+        SIM.set_stage("draft"); st.rerun()
+
+# ---------- Profiling panel ----------
+def profiling_panel():
+    with st.sidebar.expander("Profiling", expanded=True):
+        rows = [{k: round(v, 2) if isinstance(v, float) else v for k, v in r.items()} for r in profiling.REGISTRY.rows()]
+        st.dataframe(rows, hide_index=True)
+        st.caption(f"Score cache: {SCORE_CACHE_STATS['hits']} hits / {SCORE_CACHE_STATS['misses']} misses. "
+                   f"Snapshots: {STORE.stats['puts']} queued, {STORE.stats['writes']} written.")
+        counters = profiling.REGISTRY.counters
+        if counters:
+            st.caption(" · ".join(f"{k}: {v:g}" for k, v in sorted(counters.items())))
+
+def metric_gauges():
+    return {"score_cache_hits": SCORE_CACHE_STATS["hits"], "score_cache_misses": SCORE_CACHE_STATS["misses"],
+            "store_puts": STORE.stats["puts"], "store_writes": STORE.stats["writes"]}
 
 # ---------- Router ----------
 def main():
     header()
-    if S["stage"]=="intro":   page_intro()
-    elif S["stage"]=="target":page_target()
-    elif S["stage"]=="live":  page_live()
-    elif S["stage"]=="flash": page_flash()
-    elif S["stage"]=="synth": page_synth()
-    elif S["stage"]=="draft": page_draft()
-    else:                     page_score()
-
-main()
+    with span(f"page/{S['stage']}"):
+        if S["stage"]=="intro":   page_intro()
+        elif S["stage"]=="target":page_target()
+        elif S["stage"]=="live":  page_live()
+        elif S["stage"]=="flash": page_flash()
+        elif S["stage"]=="synth": page_synth()
+        elif S["stage"]=="draft": page_draft()
+        else:                     page_score()
+
+try:
+    with span("script_run"):
+        main()
+    if DEBUG:
+        profiling_panel()
+finally:
+    profiling.write_metrics(metric_gauges())
\ No newline at end of file
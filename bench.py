@@ -0,0 +1,394 @@
+# bench.py
+# Reproducible benchmarks for synthesis, scoring, recruitment, answers and the discovery brief.
+# Run:  python bench.py [--baseline bench_baseline.json] [--save] [--threshold 0.25] [--only score]
+#       python bench.py --baseline ""   (just print the numbers)
+#
+# Sessions are synthetic: 6, 60 and 600 booked interviews of 4-40 turns each. The
+# built-in scenario has 14 personas and ~10 questions per segment, so the suite
+# runs against a scaled copy (600 personas, 40 questions per segment) exported to
+# a temporary catalog (see catalog.py). The same seed always builds the same sessions.
+#
+# score_batch/* checks parity with score_session on the same table before timing.
+# Every case reports ops/sec, p50/p99 latency and the tracemalloc peak of one call;
+# cold_start/* time a fresh process up to the first render of the intro page, and
+# click/* the question clicks of one interview (see click_latency).
+# Against a baseline file, a case whose p50 is more than `threshold` slower fails the
+# run, and so does a missing baseline file: a gate that cannot compare must not pass.
+# Baselines are machine-specific, so none is committed; --save one on the CI runner.
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+SIZES = (6, 60, 600)
+TURNS = (4, 40)
+PERSONAS, QUESTIONS = 600, 40
+BATCH = 256   # sessions per score_batch call
+
+# ---------- Scaled scenario ----------
+def _key(key: str, r: int) -> str:
+    return key if r == 0 else f"{key}.{r}"
+
+def write_scaled_catalog(path: str, personas: int = PERSONAS, questions: int = QUESTIONS):
+    """Export the built-in scenario with personas cloned to `personas` and each bank padded to `questions`."""
+    from catalog import write_catalog
+    import engine
+    base = list(engine.INTERVIEW_PERSONAS)
+    people = []
+    for i in range(personas):
+        p = dict(base[i % len(base)])
+        if i >= len(base):
+            p["name"] = f"{p['name']} #{i // len(base)}"
+        people.append(p)
+    qb, seg_answers = {}, {}
+    for seg, qs in engine.QB.items():
+        reps = -(-questions // len(qs))
+        qb[seg] = [dict(q, key=_key(q["key"], r), text=q["text"] + (f" ({r})" if r else ""))
+                   for r in range(reps) for q in qs][:questions]
+        seg_answers[seg] = {_key(k, r): v for r in range(reps) for k, v in engine.SEGMENT_ANSWERS.get(seg, {}).items()}
+    reps = -(-questions // min(len(qs) for qs in engine.QB.values()))
+    overrides = {}
+    for i, p in enumerate(people):
+        ov = engine.PERSONA_OVERRIDES.get(base[i % len(base)]["name"])
+        if ov:
+            overrides[p["name"]] = {_key(k, r): v for r in range(reps) for k, v in ov.items()}
+    write_catalog(path, people, list(engine.FLASH_PERSONAS), qb, seg_answers, overrides)
+
+# ---------- Synthetic sessions ----------
+def synthetic_session(n_interviews: int, seed: int):
+    """A submitted session with `n_interviews` booked interviews of TURNS[0]..TURNS[1] turns each.
+
+    Interviews are built turn by turn with the same trust rule as Simulation.ask,
+    but without refolding analytics after every turn; run_synthesis() does that once.
+    """
+    from engine import (CHANNELS, FLASH_PERSONAS, INTERVIEW_PERSONAS, Interview, Simulation, bank_index, clamp,
+                        question_order, start_trust)
+    rng = random.Random(seed)
+    sim = Simulation(seed=seed)
+    S = sim.s
+    for ch in CHANNELS:
+        S["alloc"][ch] = rng.randint(0, 3)
+    S["booked_ids"] = rng.sample(range(len(INTERVIEW_PERSONAS)), n_interviews)
+    for pid in S["booked_ids"]:
+        p = INTERVIEW_PERSONAS[pid]
+        questions = bank_index(p["segment"]).questions
+        stt = Interview(pid, start_trust(p["segment"]))
+        order = list(question_order(pid))
+        for pos in order[:rng.randint(TURNS[0], min(TURNS[1], len(order)))]:
+            stt.trust = clamp(stt.trust + (0.06 if questions[pos]["kind"] == "open" else -0.08), 0, 1)
+            stt.turns.append(pos << 1 | (stt.trust >= p["tell_threshold"]))
+            stt.asked |= 1 << pos
+        stt.ended = True
+        S["interview"][pid] = stt
+    S["flash_open"] = rng.sample(range(len(FLASH_PERSONAS)), 3)
+    sim.run_synthesis()
+    clusters = S["analytics"]["clusters"]
+    S["chosen_segment"] = INTERVIEW_PERSONAS[S["booked_ids"][0]]["segment"]
+    S["chosen_pain"] = max(clusters, key=clusters.get)
+    sim.prefill_draft()
+    S["problem_text"] = sim.suggested_hypothesis()
+    S["next_test_text"] = sim.suggested_next_test()
+    S["submitted_draft"] = True
+    sim.compute_score()
+    return sim
+
+# ---------- Replaced implementations ----------
+# Kept as they were (up to names) so their cases time the code each optimization replaced.
+def old_match_clusters(text: str) -> tuple:
+    """Pain clusters by substring scan: any(w in txt) per cluster, no regex, no cache."""
+    from engine import PAIN_KEYWORDS
+    txt = text.lower()
+    return tuple(c for c, words in PAIN_KEYWORDS.items() if any(w in txt for w in words))
+
+def old_recruit_personas(alloc: Dict[str, int], need: int = 6, seed=None) -> List[int]:
+    """Linear cumulative-probability walk per draw, rejecting repeats, giving up after 100 draws."""
+    from engine import CHANNELS, INTERVIEW_PERSONAS, persona_segments, stable_seed
+    rng = random.Random(stable_seed(tuple(sorted(alloc.items())), seed))
+    weights = []
+    for i, seg in enumerate(persona_segments()):
+        w = 0.0
+        for ch, t in alloc.items():
+            if t <= 0: continue
+            chp = CHANNELS[ch]
+            w += t * chp["yield"] * chp["bias"].get(seg, 0.1) * rng.uniform(0.85, 1.15)
+        weights.append((i, max(0.0001, w)))
+    total = sum(w for _, w in weights)
+    probs = [w / total for _, w in weights]
+    chosen = set()
+    attempts = 0
+    while len(chosen) < min(need, len(INTERVIEW_PERSONAS)) and attempts < 100:
+        r = rng.random(); cum = 0
+        for idx, (i, w) in enumerate(weights):
+            cum += probs[idx]
+            if r <= cum:
+                chosen.add(i); break
+        attempts += 1
+    return list(chosen)
+
+def old_interview_state(S: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """S["interview"] as it was before Interview: a set of asked keys, a shuffled copy of
+    the bank's keys and one dict per transcript turn, for each interview."""
+    from engine import INTERVIEW_PERSONAS, QB, lookup_answer
+    out = {}
+    for pid, stt in S["interview"].items():
+        bank = QB[INTERVIEW_PERSONAS[pid]["segment"]]
+        keys = [q["key"] for q in bank]
+        random.Random(pid).shuffle(keys)
+        transcript = [{"q": bank[c >> 1]["text"], "a": lookup_answer(pid, bank[c >> 1]["key"], bool(c & 1)),
+                       "kind": bank[c >> 1]["kind"]} for c in stt.turns]
+        out[pid] = {"asked": {bank[c >> 1]["key"] for c in stt.turns}, "left": keys, "q_count": len(transcript),
+                    "trust": stt.trust, "transcript": transcript, "ended": stt.ended}
+    return out
+
+# ---------- Cases ----------
+def cases(seed: int) -> List[Tuple[str, Callable[[int], Any]]]:
+    """(name, fn) pairs; fn(i) performs one operation for iteration i."""
+    import engine
+    from engine import CHANNELS, SCORE_KEYS, discovery_brief, recruit_personas, score_session
+    sizes = [n for n in SIZES if n <= len(engine.INTERVIEW_PERSONAS)]
+    if len(sizes) < len(SIZES):
+        print(f"catalog has {len(engine.INTERVIEW_PERSONAS)} personas; skipping sizes above that", file=sys.stderr)
+    out = []
+    for n in sizes:
+        sim = synthetic_session(n, seed + n)
+        S = sim.s
+        inputs = [S[k] for k in SCORE_KEYS]
+        out.append((f"run_synthesis/{n}", lambda i, sim=sim: sim.run_synthesis()))
+        out.append((f"compute_score/{n}", lambda i, inputs=inputs: score_session(*inputs)))
+        out.append((f"compute_score_cached/{n}", lambda i, sim=sim: sim.compute_score()))
+        out.append((f"discovery_brief/{n}", lambda i, S=S: discovery_brief(S)))
+        pairs = [(pid, engine.bank_index(engine.INTERVIEW_PERSONAS[pid]["segment"]).questions[pos]["key"])
+                 for pid in S["booked_ids"] for pos in engine.question_order(pid)]
+        out.append((f"answer_for/{n}", lambda i, sim=sim, pairs=pairs: sim.answer_for(*pairs[i % len(pairs)])))
+        # per-session interview memory: peak KB is the size of the state built
+        out.append((f"interview_state/{n}", lambda i, S=S: {pid: engine.Interview(pid, t.trust, t.asked, t.turns, t.ended)
+                                                           for pid, t in S["interview"].items()}))
+        out.append((f"interview_state_old/{n}", lambda i, S=S: old_interview_state(S)))
+    # score_batch against the per-session loop it replaced, on drafts of mixed quality;
+    # both must give the same scores before either is timed
+    rng = random.Random(seed)
+    table = {k: [] for k in SCORE_KEYS}
+    for j in range(BATCH):
+        S = synthetic_session(sizes[0], seed * 7919 + j).s
+        S["chosen_pain"] = rng.choice([S["chosen_pain"], None] + list(S["analytics"]["clusters"]))
+        S["problem_text"] = S["problem_text"][:rng.randint(0, len(S["problem_text"]))]
+        S["next_test_text"] = rng.choice([S["next_test_text"], "", "Run a survey"])
+        for k in SCORE_KEYS:
+            table[k].append(S[k])
+    loop = lambda i: [score_session(*row)[0] for row in zip(*(table[k] for k in SCORE_KEYS))]
+    assert engine.score_batch(table) == loop(0), "score_batch disagrees with score_session"
+    out.append((f"score_batch/{BATCH}", lambda i: engine.score_batch(table)))
+    out.append((f"score_loop/{BATCH}", loop))
+    allocs = [{ch: rng.randint(0, 5) for ch in CHANNELS} for _ in range(64)]
+    for need in sizes:
+        # a new seed per call, so every draw misses the recruitment cache
+        out.append((f"recruit_personas/{need}",
+                    lambda i, need=need: recruit_personas(allocs[i % len(allocs)], need=need, seed=seed * 1000003 + i)))
+        out.append((f"recruit_personas_old/{need}",
+                    lambda i, need=need: old_recruit_personas(allocs[i % len(allocs)], need=need, seed=seed * 1000003 + i)))
+    # cluster matching over transcript texts: the old substring scan, the precompiled
+    # patterns with the cache bypassed, and the cached lookups synthesis actually does
+    texts = [q["text"] + " " + ans for pid, _, qkey, _, ans in rng.sample(list(engine.answer_table()), BATCH)
+             for q in [engine.bank_index(engine.INTERVIEW_PERSONAS[pid]["segment"]).by_key[qkey]]]
+    assert [old_match_clusters(t) for t in texts] == [engine.match_clusters(t) for t in texts]
+    uncached = engine.match_clusters.__wrapped__
+    out.append((f"match_clusters_old/{BATCH}", lambda i: [old_match_clusters(t) for t in texts]))
+    out.append((f"match_clusters_uncached/{BATCH}", lambda i: [uncached(t) for t in texts]))
+    out.append((f"match_clusters/{BATCH}", lambda i: [engine.match_clusters(t) for t in texts]))
+    return out
+
+def measure(fn: Callable[[int], Any], min_time: float, max_iters: int) -> Dict[str, float]:
+    fn(0)   # warm-up
+    lat = []
+    t_end = time.perf_counter() + min_time
+    i = 1
+    gc.collect()
+    gc.disable()   # like timeit: collector pauses land on arbitrary calls and swamp p99
+    try:
+        while i <= max_iters and (time.perf_counter() < t_end or i < 5):
+            t = time.perf_counter_ns()
+            fn(i)
+            lat.append(time.perf_counter_ns() - t)
+            i += 1
+    finally:
+        gc.enable()
+    lat.sort()
+    pct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] / 1e3
+    tracemalloc.start()
+    fn(i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"ops_per_sec": round(len(lat) / (sum(lat) / 1e9), 1), "p50_us": round(pct(0.5), 2),
+            "p99_us": round(pct(0.99), 2), "peak_kb": round(peak / 1024, 1), "iters": len(lat)}
+
+# ---------- Cold start ----------
+# Each sample is a fresh interpreter that imports Streamlit's test harness and runs
+# app.py once, i.e. the first render of page_intro. Peak is the child's max RSS.
+_COLD_START = """
+import resource, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+t2 = time.perf_counter()
+if at.exception:
+    sys.exit(str(at.exception[0].message))
+print(t1 - t0, t2 - t1, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "pandas" in sys.modules)
+"""
+
+def cold_start(repeats: int, env: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    samples = {"cold_start/streamlit_import": [], "cold_start/first_render": []}
+    rss, heavy = [], False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(env, SIM_STORE=os.path.join(tmp, "sessions.sqlite"), SIM_EVENTS="")
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, "-c", _COLD_START, app], env=env, cwd=tmp,
+                                 check=True, capture_output=True, text=True).stdout.split()
+            samples["cold_start/streamlit_import"].append(float(out[0]))
+            samples["cold_start/first_render"].append(float(out[1]))
+            rss.append(int(out[2]))
+            heavy = heavy or out[3] == "True"
+    if heavy:
+        print("note: pandas was imported while rendering the intro page", file=sys.stderr)
+    return {name: _seconds_summary(lat, float(max(rss))) for name, lat in samples.items()}
+
+def _seconds_summary(lat: List[float], peak_kb: float) -> Dict[str, float]:
+    lat = sorted(lat)
+    return {"ops_per_sec": round(len(lat) / sum(lat), 2), "p50_us": round(lat[len(lat) // 2] * 1e6, 1),
+            "p99_us": round(lat[min(len(lat) - 1, int(0.99 * len(lat)))] * 1e6, 1),
+            "peak_kb": peak_kb, "iters": len(lat)}
+
+# ---------- Click latency ----------
+# One fresh process with profiling on drives a live interview through AppTest, which
+# reruns the whole script on every click. Per click, the script_run span is what a
+# click cost when every question reran the full page; fragment/interview_panel is
+# the part a fragment rerun executes. Streamlit's own per-rerun overhead is in neither.
+_CLICKS = """
+import os, resource, sys
+sys.path.insert(0, os.path.dirname(sys.argv[1]))
+from streamlit.testing.v1 import AppTest
+import profiling
+from engine import CHANNELS, Simulation, dump_state
+from store import open_store
+sim = Simulation(seed=0)
+for ch in CHANNELS:
+    sim.set_alloc(ch, 2)
+sim.book()
+pid = sim.s["booked_ids"][0]
+sim.init_interview(pid)
+sim.set_stage("live")
+open_store().save_many([("benchclick0", dump_state(sim.s))])
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.query_params["sid"] = "benchclick0"
+at.run()
+for _ in range(int(sys.argv[2])):
+    at.button(key=next(b.key for b in at.button if (b.key or "").startswith(f"q_{pid}_"))).click().run()
+    if at.exception:
+        sys.exit(str(at.exception[0].message))
+    t = profiling.REGISTRY.timings
+    print(t["script_run"].last, t["fragment/interview_panel"].last)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def click_latency(clicks: int, env: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(env, SIM_STORE=os.path.join(tmp, "sessions.sqlite"), SIM_EVENTS="", SIM_PROFILE="1",
+                   SIM_PROFILE_FILE=os.path.join(tmp, "metrics.prom"))
+        lines = subprocess.run([sys.executable, "-c", _CLICKS, app, str(clicks)], env=env, cwd=tmp,
+                               check=True, capture_output=True, text=True).stdout.split("\n")
+    rows = [tuple(map(float, line.split())) for line in lines[:clicks]]
+    rss = float(lines[clicks])
+    return {"click/full_rerun": _seconds_summary([r[0] for r in rows], rss),
+            "click/interview_panel": _seconds_summary([r[1] for r in rows], rss)}
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    failures = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b and r["p50_us"] > b["p50_us"] * (1 + threshold):
+            failures.append(f"{name}: p50 {r['p50_us']:.1f}us vs baseline {b['p50_us']:.1f}us "
+                            f"(+{(r['p50_us'] / b['p50_us'] - 1) * 100:.0f}%)")
+    return failures
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark synthesis, scoring, recruitment, answers and briefs.")
+    ap.add_argument("--baseline", default="bench_baseline.json", help="JSON baseline to compare against ('' skips)")
+    ap.add_argument("--save", action="store_true", help="write this run's results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed p50 slowdown before failing")
+    ap.add_argument("--only", default="", help="run only cases whose name contains this text")
+    ap.add_argument("--min-time", type=float, default=0.5, help="seconds per case")
+    ap.add_argument("--max-iters", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cold", type=int, default=5, help="fresh-process samples of app cold start (0 skips)")
+    ap.add_argument("--clicks", type=int, default=20, help="question clicks timed in one live interview (0 skips)")
+    ap.add_argument("--json", default="", help="also write results to this path")
+    ap.add_argument("--make-catalog", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.save and not args.baseline:
+        ap.error("--save needs a --baseline path")
+
+    if args.make_catalog:
+        write_scaled_catalog(args.make_catalog)
+        return 0
+    app_env = dict(os.environ)
+    if not os.environ.get("SIM_CATALOG"):
+        # the engine reads its scenario at import, so the scaled catalog is exported by a child process
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "bench.sqlite")
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--make-catalog", path],
+                       check=True, env={k: v for k, v in os.environ.items() if k != "SIM_CATALOG"})
+        os.environ["SIM_CATALOG"] = path
+
+    results = {}
+    print(f"{'case':<28}{'ops/s':>12}{'p50 us':>11}{'p99 us':>11}{'peak KB':>10}")
+    for name, fn in cases(args.seed):
+        if args.only and args.only not in name:
+            continue
+        r = results[name] = measure(fn, args.min_time, args.max_iters)
+        print(f"{name:<28}{r['ops_per_sec']:>12,.0f}{r['p50_us']:>11.1f}{r['p99_us']:>11.1f}{r['peak_kb']:>10.1f}")
+    if args.cold and (not args.only or args.only in "cold_start/first_render"):
+        for name, r in cold_start(args.cold, app_env).items():
+            results[name] = r
+            print(f"{name:<28}{r['ops_per_sec']:>12,.2f}{r['p50_us']:>11.0f}{r['p99_us']:>11.0f}{r['peak_kb']:>10.0f}")
+    if args.clicks and (not args.only or args.only in "click/interview_panel click/full_rerun"):
+        for name, r in click_latency(args.clicks, dict(os.environ)).items():   # scaled catalog: 40-question banks
+            results[name] = r
+            print(f"{name:<28}{r['ops_per_sec']:>12,.1f}{r['p50_us']:>11.0f}{r['p99_us']:>11.0f}{r['peak_kb']:>10.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"saved baseline to {args.baseline}")
+        return 0
+    if not args.baseline:
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save to create one, or --baseline '' to skip the check",
+              file=sys.stderr)
+        return 2
+    with open(args.baseline) as f:
+        failures = compare(results, json.load(f), args.threshold)
+    for line in failures:
+        print("REGRESSION " + line)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# catalog.py
+# Scenario catalogs stored in SQLite, read lazily and shared read-only between processes.
+# Export the built-in scenario: python catalog.py export thermaloop.sqlite
+# Dump the answer table:        python catalog.py answers answers.csv
+# Use a catalog:                SIM_CATALOG=thermaloop.sqlite streamlit run app.py
+#
+# Rows are fetched by id on demand, so a pack with 50k personas does not become
+# 50k dicts in every session. The file is opened immutable with mmap enabled, so
+# all workers share one copy of its pages through the OS page cache.
+
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+from abc import abstractmethod
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from typing import Dict, Any, List
+
+MMAP_BYTES = 1 << 30
+
+SCHEMA = """
+CREATE TABLE personas  (id INTEGER PRIMARY KEY, name TEXT NOT NULL, segment TEXT NOT NULL, doc TEXT NOT NULL);
+CREATE TABLE flash     (id INTEGER PRIMARY KEY, doc TEXT NOT NULL);
+CREATE TABLE questions (segment TEXT NOT NULL, pos INTEGER NOT NULL, doc TEXT NOT NULL, PRIMARY KEY (segment, pos));
+-- scope is a segment name (default answers) or a persona name (overrides)
+CREATE TABLE answers   (kind TEXT NOT NULL, scope TEXT NOT NULL, qkey TEXT NOT NULL, text TEXT NOT NULL,
+                        PRIMARY KEY (kind, scope, qkey));
+"""
+
+def write_catalog(path: str, interview_personas: List[Dict[str, Any]], flash_personas: List[Dict[str, Any]],
+                  question_bank: Dict[str, List[Dict[str, Any]]], segment_answers: Dict[str, Dict[str, str]],
+                  persona_overrides: Dict[str, Dict[str, str]]):
+    if os.path.exists(path):
+        os.remove(path)
+    con = sqlite3.connect(path)
+    with con:
+        con.executescript(SCHEMA)
+        con.executemany("INSERT INTO personas VALUES (?,?,?,?)",
+                        ((i, p["name"], p["segment"], json.dumps(p)) for i, p in enumerate(interview_personas)))
+        con.executemany("INSERT INTO flash VALUES (?,?)", ((i, json.dumps(f)) for i, f in enumerate(flash_personas)))
+        con.executemany("INSERT INTO questions VALUES (?,?,?)",
+                        ((seg, i, json.dumps(q)) for seg, qs in question_bank.items() for i, q in enumerate(qs)))
+        con.executemany("INSERT INTO answers VALUES ('segment',?,?,?)",
+                        ((seg, k, v) for seg, ans in segment_answers.items() for k, v in ans.items()))
+        con.executemany("INSERT INTO answers VALUES ('persona',?,?,?)",
+                        ((name, k, v) for name, ans in persona_overrides.items() for k, v in ans.items()))
+    con.execute("VACUUM")
+    con.close()
+
+class SQLiteCatalog:
+    """Read-only view of a catalog file; one connection per process and thread."""
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"scenario catalog not found: {path}")
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+
+    def query(self, sql: str, args: tuple = ()) -> List[tuple]:
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():   # never reuse a connection across fork()
+            uri = pathlib.Path(self.path).as_uri() + "?mode=ro&immutable=1"   # quotes ?, # and % in the path
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            con.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+            self._local.con, self._local.pid = con, os.getpid()
+        return con.execute(sql, args).fetchall()
+
+    def tables(self):
+        """(INTERVIEW_PERSONAS, FLASH_PERSONAS, QB, SEGMENT_ANSWERS, PERSONA_OVERRIDES) as lazy containers."""
+        return (_Rows(self, "personas"), _Rows(self, "flash"), _QuestionBank(self),
+                _Answers(self, "segment"), _Answers(self, "persona"))
+
+class _Rows(Sequence):
+    """Id-indexed JSON documents; each row is decoded once, on first access."""
+
+    def __init__(self, cat: SQLiteCatalog, table: str):
+        self.cat, self.table = cat, table
+        self._len = None
+        self._segments = None
+        self._get = lru_cache(maxsize=4096)(self._fetch)
+
+    def _fetch(self, i: int) -> Dict[str, Any]:
+        rows = self.cat.query(f"SELECT doc FROM {self.table} WHERE id=?", (i,))
+        if not rows:
+            raise IndexError(i)
+        return json.loads(rows[0][0])
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = self.cat.query(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self._get(i)
+
+    @property
+    def segments(self) -> List[str]:
+        """Segment of every persona, in id order, without decoding the documents."""
+        if self._segments is None:
+            self._segments = [s for (s,) in self.cat.query(f"SELECT segment FROM {self.table} ORDER BY id")]
+        return self._segments
+
+class _LazyMapping(Mapping):
+    def __init__(self, cat: SQLiteCatalog):
+        self.cat = cat
+        self._cache: Dict[str, Any] = {}
+        self._keys = None
+
+    @abstractmethod
+    def _load(self, key: str): ...
+
+    @abstractmethod
+    def keys_list(self) -> List[str]: ...
+
+    def __getitem__(self, key: str):
+        try:
+            value = self._cache[key]
+        except KeyError:
+            # misses are cached too: most personas have no overrides
+            value = self._cache[key] = self._load(key) or None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return iter(self.keys_list())
+
+    def __len__(self) -> int:
+        return len(self.keys_list())
+
+class _QuestionBank(_LazyMapping):
+    def _load(self, seg: str):
+        return [json.loads(d) for (d,) in self.cat.query("SELECT doc FROM questions WHERE segment=? ORDER BY pos", (seg,))]
+
+    def keys_list(self) -> List[str]:
+        if self._keys is None:
+            self._keys = [s for (s,) in self.cat.query("SELECT segment FROM questions GROUP BY segment ORDER BY MIN(rowid)")]
+        return self._keys
+
+class _Answers(_LazyMapping):
+    def __init__(self, cat: SQLiteCatalog, kind: str):
+        super().__init__(cat)
+        self.kind = kind
+
+    def _load(self, scope: str):
+        return dict(self.cat.query("SELECT qkey, text FROM answers WHERE kind=? AND scope=? ORDER BY rowid",
+                                   (self.kind, scope)))
+
+    def keys_list(self) -> List[str]:
+        if self._keys is None:
+            self._keys = [s for (s,) in self.cat.query("SELECT scope FROM answers WHERE kind=? GROUP BY scope ORDER BY MIN(rowid)",
+                                                       (self.kind,))]
+        return self._keys
+
+if __name__ == "__main__":
+    usage = "usage: python catalog.py export PATH.sqlite | python catalog.py answers PATH.csv"
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "answers"):
+        sys.exit(usage)
+    if sys.argv[1] == "export":
+        os.environ.pop("SIM_CATALOG", None)   # always export the built-in scenario
+    import engine
+    if sys.argv[1] == "export":
+        write_catalog(sys.argv[2], engine.INTERVIEW_PERSONAS, engine.FLASH_PERSONAS, engine.QB,
+                      engine.SEGMENT_ANSWERS, engine.PERSONA_OVERRIDES)
+    else:
+        import csv
+        with open(sys.argv[2], "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["pid", "persona", "qkey", "unlocked", "answer"])
+            w.writerows(engine.answer_table())
+    print(f"wrote {sys.argv[2]}")
@@ -0,0 +1,370 @@
+# cohort.py
+# Cohort-wide analytics that merge: summarize shards of sessions anywhere, then add the summaries up.
+# Build: python cohort.py build --out cohort.json [--store sessions.sqlite] [--workers 8] [--chunk 500]
+# Merge: python cohort.py merge shard1.json shard2.json ... --out cohort.json
+# Show:  python cohort.py show cohort.json
+# Ranks: python cohort.py ranks [--store sessions.sqlite] [--force]   (recount the live score ranks, e.g. after a regrade)
+#
+# A CohortSummary holds only sums, counts and fixed-size sketches, so merging is
+# associative and commutative and its size does not grow with the cohort:
+#   - analytics are summed as integers in their display precision (cluster weights
+#     in tenths, bias score in thousandths, saturation in hundredths), so totals are
+#     exact whatever order the shards are added in;
+#   - scores are integers 0-100, so each score distribution is an exact 101-bin
+#     histogram and percentiles read from it are exact too;
+#   - quotes per cluster are a bottom-k sample: the k distinct quotes with the
+#     smallest stable hash. A quote kept cohort-wide is kept by every shard that
+#     saw it, so its count is exact as well.
+#
+# ScoreRanks answers "better than X% of the cohort" on every score page render
+# from the same 101 bins, kept in Fenwick trees so a new submission and a rank
+# query are both O(log 101); the counts persist in the session store.
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from engine import PAIN_KEYWORDS, SCORE_WEIGHTS, SEGMENTS, stable_seed
+
+QUOTE_SAMPLE = 8                                  # distinct quotes kept per cluster
+SCORE_NAMES = ("total",) + tuple(SCORE_WEIGHTS)   # one histogram each
+SCORE_BINS = 101
+COUNTERS = ("sessions", "synthesized", "submitted", "bias_flagged", "interviews", "questions", "flash",
+            "bias_milli", "saturation_centi")
+
+@lru_cache(maxsize=4096)
+def _quote_rank(quote: str) -> Tuple[int, str]:
+    return stable_seed("quote", quote), quote
+
+def _bottom_k(counts: Dict[str, int]) -> Dict[str, int]:
+    if len(counts) <= QUOTE_SAMPLE:
+        return counts
+    return {q: counts[q] for q in sorted(counts, key=_quote_rank)[:QUOTE_SAMPLE]}
+
+def _add_counts(into: Dict[str, int], other: Dict[str, int]):
+    for k, v in other.items():
+        into[k] = into.get(k, 0) + v
+
+def _tenths(x: float) -> int:
+    return int(round(x * 10))
+
+def score_values(score: Dict[str, Any]) -> Dict[str, int]:
+    """Score name -> histogram bin for one session's score."""
+    values = {"total": score["total"], **score["components"]}
+    return {name: min(SCORE_BINS - 1, max(0, int(values[name]))) for name in SCORE_NAMES if name in values}
+
+class CohortSummary:
+    """Mergeable summary of many sessions' analytics and scores; `a + b` combines two shards."""
+
+    def __init__(self):
+        self.n = dict.fromkeys(COUNTERS, 0)
+        self.clusters: Dict[str, int] = {}                  # cluster -> summed weight, tenths
+        self.seg_cluster: Dict[str, Dict[str, int]] = {}    # segment -> cluster -> summed weight, tenths
+        self.seg_interviews: Dict[str, int] = {}            # segment -> interviews booked
+        self.seg_reached: Dict[str, int] = {}               # segment -> sessions with at least one interview there
+        self.top_cluster: Dict[str, int] = {}               # cluster -> sessions where it came out on top
+        self.top_channel: Dict[str, int] = {}
+        self.quotes: Dict[str, Dict[str, int]] = {}         # cluster -> bottom-k quote -> occurrences
+        self.scores: Dict[str, List[int]] = {}              # score name -> 101 bins
+
+    # ---------- Building ----------
+    def add_state(self, S: Dict[str, Any]):
+        """Fold one session state (or its JSON document) into the summary."""
+        n = self.n
+        n["sessions"] += 1
+        a = S.get("analytics") or {}
+        if a.get("clusters"):
+            n["synthesized"] += 1
+            n["bias_flagged"] += bool(a.get("bias_flag"))
+            n["interviews"] += a.get("interviews_done", 0)
+            n["questions"] += a.get("total_questions", 0)
+            n["flash"] += a.get("flash_count", 0)
+            n["bias_milli"] += int(round(a.get("bias_score", 0) * 1000))
+            n["saturation_centi"] += int(round(a.get("avg_saturation", 1.0) * 100))
+            clusters = a["clusters"]
+            _add_counts(self.clusters, {c: _tenths(v) for c, v in clusters.items()})
+            for seg, row in a.get("seg_cluster", {}).items():
+                _add_counts(self.seg_cluster.setdefault(seg, {}), {c: _tenths(v) for c, v in row.items()})
+            _add_counts(self.seg_interviews, a.get("seg_mix", {}))
+            _add_counts(self.seg_reached, {seg: 1 for seg, k in a.get("seg_mix", {}).items() if k})
+            top = max(clusters, key=clusters.get)
+            if clusters[top] > 0:
+                self.top_cluster[top] = self.top_cluster.get(top, 0) + 1
+            if a.get("top_channel"):
+                self.top_channel[a["top_channel"]] = self.top_channel.get(a["top_channel"], 0) + 1
+            for c, qs in a.get("quotes", {}).items():
+                counts = self.quotes.setdefault(c, {})
+                _add_counts(counts, {q: qs.count(q) for q in qs})
+                self.quotes[c] = _bottom_k(counts)
+        score = S.get("score")
+        if S.get("submitted_draft") and score:
+            n["submitted"] += 1
+            for name, v in score_values(score).items():
+                self.scores.setdefault(name, [0] * SCORE_BINS)[v] += 1
+
+    def update(self, other: "CohortSummary"):
+        """Merge `other` into this summary in place."""
+        _add_counts(self.n, other.n)
+        _add_counts(self.clusters, other.clusters)
+        for seg, row in other.seg_cluster.items():
+            _add_counts(self.seg_cluster.setdefault(seg, {}), row)
+        for mine, theirs in ((self.seg_interviews, other.seg_interviews), (self.seg_reached, other.seg_reached),
+                             (self.top_cluster, other.top_cluster), (self.top_channel, other.top_channel)):
+            _add_counts(mine, theirs)
+        for c, counts in other.quotes.items():
+            merged = dict(self.quotes.get(c, {}))
+            _add_counts(merged, counts)
+            self.quotes[c] = _bottom_k(merged)
+        for name, bins in other.scores.items():
+            mine = self.scores.setdefault(name, [0] * SCORE_BINS)
+            for i, k in enumerate(bins):
+                mine[i] += k
+
+    def __add__(self, other: "CohortSummary") -> "CohortSummary":
+        out = CohortSummary()
+        out.update(self)
+        out.update(other)
+        return out
+
+    @classmethod
+    def of(cls, states: Iterable[Dict[str, Any]]) -> "CohortSummary":
+        out = cls()
+        for S in states:
+            out.add_state(S)
+        return out
+
+    # ---------- Serialization ----------
+    def to_dict(self) -> Dict[str, Any]:
+        return {"n": dict(self.n), "clusters": dict(self.clusters),
+                "seg_cluster": {seg: dict(row) for seg, row in self.seg_cluster.items()},
+                "seg_interviews": dict(self.seg_interviews), "seg_reached": dict(self.seg_reached),
+                "top_cluster": dict(self.top_cluster), "top_channel": dict(self.top_channel),
+                "quotes": {c: dict(qs) for c, qs in self.quotes.items()},
+                "scores": {name: list(bins) for name, bins in self.scores.items()}}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "CohortSummary":
+        out = cls()
+        out.n.update(d["n"])
+        for k in ("clusters", "seg_interviews", "seg_reached", "top_cluster", "top_channel"):
+            setattr(out, k, dict(d[k]))
+        out.seg_cluster = {seg: dict(row) for seg, row in d["seg_cluster"].items()}
+        out.quotes = {c: dict(qs) for c, qs in d["quotes"].items()}
+        out.scores = {name: list(bins) for name, bins in d["scores"].items()}
+        return out
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CohortSummary) and _canonical(self) == _canonical(other)
+
+    # ---------- Reading ----------
+    def percentile(self, name: str, q: float) -> Optional[int]:
+        """Nearest-rank q-quantile (0..1) of score `name`; None before any submission."""
+        bins = self.scores.get(name)
+        total = sum(bins) if bins else 0
+        if not total:
+            return None
+        need, cum = max(1, math.ceil(q * total)), 0
+        for value, k in enumerate(bins):
+            cum += k
+            if cum >= need:
+                return value
+        return SCORE_BINS - 1
+
+    def view(self) -> Dict[str, Any]:
+        """Per-session means and shares, as an instructor dashboard would show them."""
+        n = self.n
+        per = max(1, n["synthesized"])
+        scores = {}
+        for name, bins in self.scores.items():
+            total = sum(bins)
+            if total:
+                scores[name] = {"mean": round(sum(v * k for v, k in enumerate(bins)) / total, 1),
+                                **{f"p{q}": self.percentile(name, q / 100) for q in (25, 50, 75, 90)}}
+        return {
+            "sessions": n["sessions"], "synthesized": n["synthesized"], "submitted": n["submitted"],
+            "clusters": {c: round(self.clusters.get(c, 0) / 10 / per, 2) for c in PAIN_KEYWORDS},
+            "top_cluster_share": {c: round(self.top_cluster.get(c, 0) / per, 3) for c in PAIN_KEYWORDS},
+            "segment_coverage": {seg: round(self.seg_reached.get(seg, 0) / per, 3) for seg in SEGMENTS},
+            "segment_interviews": {seg: self.seg_interviews.get(seg, 0) for seg in SEGMENTS},
+            "seg_cluster": {seg: {c: round(v / 10 / per, 2) for c, v in row.items()}
+                            for seg, row in self.seg_cluster.items()},
+            "bias_flag_rate": round(n["bias_flagged"] / per, 3),
+            "mean_bias_score": round(n["bias_milli"] / 1000 / per, 3),
+            "mean_saturation": round(n["saturation_centi"] / 100 / per, 2),
+            "mean_interviews": round(n["interviews"] / per, 2),
+            "mean_questions": round(n["questions"] / per, 2),
+            "top_channel": dict(sorted(self.top_channel.items(), key=lambda kv: -kv[1])),
+            "quotes": {c: sorted(qs.items(), key=lambda kv: (-kv[1], kv[0])) for c, qs in self.quotes.items()},
+            "scores": scores,
+        }
+
+def _canonical(s: CohortSummary) -> str:
+    return json.dumps(s.to_dict(), sort_keys=True)
+
+# ---------- Live ranks ----------
+class ScoreRanks:
+    """Per-score counts of the cohort in Fenwick trees over the 101 score values; thread-safe."""
+
+    def __init__(self, counts: Optional[Mapping[str, Any]] = None):
+        self._lock = threading.Lock()
+        self.reload(counts or {})
+
+    def reload(self, counts: Mapping[str, Any]):
+        """Replace all counts; a score's counts are a 101-list or a {value: count} mapping."""
+        trees, totals = {}, {}
+        for name, row in counts.items():
+            tree = [0] + (list(row) if isinstance(row, list) else [row.get(v, 0) for v in range(SCORE_BINS)])
+            totals[name] = sum(tree)
+            for i in range(1, SCORE_BINS + 1):
+                j = i + (i & -i)
+                if j <= SCORE_BINS:
+                    tree[j] += tree[i]
+            trees[name] = tree
+        with self._lock:
+            self.trees, self.totals = trees, totals
+            self.loaded = time.monotonic()
+
+    def add(self, values: Dict[str, int]):
+        """Count one more learner at `values` (see score_values)."""
+        self.move({}, values)
+
+    def move(self, old: Dict[str, int], new: Dict[str, int]):
+        """Move one learner counted at `old` to `new`; `old` is {} for a learner not counted yet."""
+        with self._lock:
+            for values, d in ((old, -1), (new, 1)):
+                for name, v in values.items():
+                    tree = self.trees.setdefault(name, [0] * (SCORE_BINS + 1))
+                    self.totals[name] = self.totals.get(name, 0) + d
+                    i = v + 1
+                    while i <= SCORE_BINS:
+                        tree[i] += d
+                        i += i & -i
+
+    def below(self, name: str, value: int) -> int:
+        """Learners who scored strictly less than `value` on `name`."""
+        tree, i, n = self.trees.get(name), min(SCORE_BINS, max(0, value)), 0
+        if tree is None:
+            return 0
+        while i:
+            n += tree[i]
+            i -= i & -i
+        return n
+
+    def better_than(self, name: str, value: int) -> Optional[float]:
+        """Share (0..1) of the rest of the cohort scoring below `value`, for a learner already counted;
+        None while they are the only one."""
+        others = self.totals.get(name, 0) - 1
+        return self.below(name, value) / others if others > 0 else None
+
+# ---------- Map-reduce over a store ----------
+def summarize_chunk(rows: List[Tuple[str, str]]) -> Dict[str, Any]:
+    # plain JSON is enough: only analytics, score and the submitted flag are read
+    return CohortSummary.of(json.loads(text) for _, text in rows).to_dict()
+
+def build(store, workers: Optional[int] = None, chunk: int = 500, inflight: int = 0) -> CohortSummary:
+    """Summarize every session in `store`, `chunk` sessions per pool task."""
+    out = CohortSummary()
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        after = ""
+        while True:
+            rows = store.scan(after, chunk)
+            if not rows:
+                break
+            after = rows[-1][0]
+            pending.append(pool.submit(summarize_chunk, rows))
+            if len(pending) >= (inflight or 2 * workers):
+                out.update(CohortSummary.from_dict(pending.popleft().result()))
+        while pending:
+            out.update(CohortSummary.from_dict(pending.popleft().result()))
+    return out
+
+def recount(store, chunk: int = 1000) -> Tuple[Dict[str, Dict[int, int]], Dict[str, Dict[str, int]]]:
+    """Score counts of every submitted, scored session in `store`, and the values each sid is counted at."""
+    counts: Dict[str, Dict[int, int]] = {}
+    marks: Dict[str, Dict[str, int]] = {}
+    after = ""
+    while True:
+        rows = store.scan(after, chunk)
+        if not rows:
+            return counts, marks
+        after = rows[-1][0]
+        for sid, text in rows:
+            S = json.loads(text)
+            if S.get("submitted_draft") and S.get("score"):
+                marks[sid] = score_values(S["score"])
+                for name, v in marks[sid].items():
+                    row = counts.setdefault(name, {})
+                    row[v] = row.get(v, 0) + 1
+
+def report(s: CohortSummary, out=sys.stdout):
+    v = s.view()
+    print(f"{v['sessions']} sessions, {v['synthesized']} synthesized, {v['submitted']} submitted", file=out)
+    print("pain clusters (mean weight per session, share where it led):", file=out)
+    for c, w in sorted(v["clusters"].items(), key=lambda kv: -kv[1]):
+        print(f"  {c:<12}{w:>8.2f}{100 * v['top_cluster_share'][c]:>7.1f}%", file=out)
+    print("segment coverage (sessions reaching it, interviews):", file=out)
+    for seg in SEGMENTS:
+        print(f"  {seg:<12}{100 * v['segment_coverage'][seg]:>7.1f}%{v['segment_interviews'][seg]:>9}", file=out)
+    print(f"bias flagged {100 * v['bias_flag_rate']:.1f}%, mean bias {v['mean_bias_score']:.3f}, "
+          f"mean saturation {v['mean_saturation']:.2f}", file=out)
+    for name, row in v["scores"].items():
+        print(f"  {name:<28}mean {row['mean']:>5.1f}  p25 {row['p25']:>3}  p50 {row['p50']:>3}  "
+              f"p75 {row['p75']:>3}  p90 {row['p90']:>3}", file=out)
+
+def _load(path: str) -> CohortSummary:
+    with open(path) as f:
+        return CohortSummary.from_dict(json.load(f))
+
+def _save(s: CohortSummary, path: str):
+    with open(path + ".tmp", "w") as f:
+        json.dump(s.to_dict(), f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+if __name__ == "__main__":
+    from store import open_store
+    ap = argparse.ArgumentParser(description="Mergeable cohort analytics.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="summarize every session in a store")
+    b.add_argument("--out", required=True)
+    b.add_argument("--store", default=None, help="session store (default: SIM_STORE or sessions.sqlite)")
+    b.add_argument("--chunk", type=int, default=500, help="sessions per task")
+    b.add_argument("--workers", type=int, default=None)
+    m = sub.add_parser("merge", help="add up summaries built on separate shards")
+    m.add_argument("parts", nargs="+")
+    m.add_argument("--out", required=True)
+    sh = sub.add_parser("show", help="print a summary")
+    sh.add_argument("path")
+    r = sub.add_parser("ranks", help="recount the store's score counts from its sessions")
+    r.add_argument("--store", default=None)
+    r.add_argument("--force", action="store_true", help="replace live counts even with an empty recount")
+    args = ap.parse_args()
+    if args.cmd == "build":
+        summary = build(open_store(args.store), args.workers, args.chunk)
+        _save(summary, args.out)
+    elif args.cmd == "ranks":
+        store = open_store(args.store)
+        counts, marks = recount(store)
+        live = sum(store.score_counts().get("total", {}).values())
+        if not marks and live and not args.force:
+            sys.exit(f"no scored sessions in the store, but {live} live counts; not wiping them (--force to do it)")
+        store.set_score_counts(counts, marks)
+        print(f"recounted {len(marks)} scored sessions (live counts had {live})")
+        sys.exit(0)
+    elif args.cmd == "merge":
+        summary = CohortSummary()
+        for path in args.parts:
+            summary.update(_load(path))
+        _save(summary, args.out)
+    else:
+        summary = _load(args.path)
+    report(summary)
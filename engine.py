@@ -0,0 +1,1225 @@
+# engine.py
+# Headless simulation engine for Problem Discovery & Validation (ThermaLoop).
+# Pure Python: no Streamlit import, so sessions can be driven from scripts and batch jobs.
+
+import hashlib
+import json
+import os
+import random
+import re
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Any, Iterator, List, NamedTuple, Optional, Tuple
+
+# ---------- Channels (no underscores). yield/speed only used conceptually; allocation drives sampling bias ----------
+CHANNELS = {
+    "Neighborhood Forums":  {"yield": 0.9, "speed": 0.8, "bias": {"Homeowner": 0.5, "Renter": 0.2, "Landlord": 0.2, "Installer": 0.1}},
+    "Email Outreach":       {"yield": 0.7, "speed": 0.7, "bias": {"Homeowner": 0.3, "Renter": 0.3, "Landlord": 0.2, "Installer": 0.2}},
+    "Cold Direct Messages": {"yield": 0.5, "speed": 0.6, "bias": {"Homeowner": 0.3, "Renter": 0.3, "Landlord": 0.2, "Installer": 0.2}},
+    "Sidewalk Intercepts":  {"yield": 0.6, "speed": 0.9, "bias": {"Homeowner": 0.4, "Renter": 0.4, "Landlord": 0.1, "Installer": 0.1}},
+    "Installer Referrals":  {"yield": 0.8, "speed": 0.5, "bias": {"Homeowner": 0.2, "Renter": 0.1, "Landlord": 0.2, "Installer": 0.5}},
+}
+EFFORT_TOKENS = 10
+
+# ---------- Personas (12 interview + 12 flash) ----------
+INTERVIEW_PERSONAS = [
+    {"name":"Maya Chen","segment":"Homeowner","bio":"3-bed townhouse; two kids; upstairs hot in summer.",
+     "pains":[{"text":"Upstairs rooms hotter than downstairs in summer","freq":4,"sev":4,"material":True},
+              {"text":"Energy bill spikes June–August","freq":3,"sev":3,"material":True}],
+     "triggers":["Heat waves; kids up at night"],"workaround":"Portable fans; close downstairs vents",
+     "wtp_ceiling":15,"tell_threshold":0.55,"anecdotes":["We moved the kids downstairs to sleep last July."],"quirk":"Tracks bills in a spreadsheet"},
+    {"name":"Sam Rodriguez","segment":"Homeowner","bio":"Older HVAC; cares for elderly parent; wants comfort.",
+     "pains":[{"text":"Cold draft in living room in winter","freq":4,"sev":4,"material":True}],
+     "triggers":["Cold snaps"],"workaround":"Space heater by sofa","wtp_ceiling":10,"tell_threshold":0.6,
+     "anecdotes":["We stuffed towels by the door last December."],"quirk":"DIY enthusiast"},
+    {"name":"Aisha Patel","segment":"Renter","bio":"Top-floor apartment; pays electric; landlord slow to respond.",
+     "pains":[{"text":"Bedroom overheats; poor sleep","freq":4,"sev":4,"material":True}],
+     "triggers":["Heat waves"],"workaround":"Cracked window; box fan","wtp_ceiling":8,"tell_threshold":0.5,
+     "anecdotes":["I sleep with an ice pack sometimes."],"quirk":"Reads product reviews obsessively"},
+    {"name":"Jordan Blake","segment":"Landlord","bio":"Manages 18 units; fields comfort complaints.",
+     "pains":[{"text":"Frequent tenant complaints about uneven heating","freq":4,"sev":3,"material":True}],
+     "triggers":["First cold snap"],"workaround":"Tell tenants to adjust dampers; duct cleaning",
+     "wtp_ceiling":0,"tell_threshold":0.65,"anecdotes":["Three units called the same night last January."],"quirk":"Wants low-touch solutions"},
+    {"name":"Riley Nguyen","segment":"Installer","bio":"Independent HVAC installer; skeptical of new gadgets.",
+     "pains":[{"text":"Callbacks after installs due to comfort complaints","freq":3,"sev":3,"material":True}],
+     "triggers":["Season changes"],"workaround":"Manual damper balancing; upsell thermostat",
+     "wtp_ceiling":0,"tell_threshold":0.7,"anecdotes":["I've taped vents to force more air to back rooms."],"quirk":"Prefers proven gear"},
+    {"name":"Priya Desai","segment":"Homeowner","bio":"Newer build; nursery cold at night; tech-friendly.",
+     "pains":[{"text":"Nursery too cold at night","freq":4,"sev":4,"material":True}],
+     "triggers":["Baby waking"],"workaround":"Space heater on timer","wtp_ceiling":18,"tell_threshold":0.55,
+     "anecdotes":["We check room temp on a smart baby monitor."],"quirk":"Smart home early adopter"},
+    {"name":"Marcus Lee","segment":"Homeowner","bio":"Old Victorian; leaky windows; budget-aware.",
+     "pains":[{"text":"Heating bill too high for comfort achieved","freq":4,"sev":4,"material":True},
+              {"text":"Basement office stays cold","freq":3,"sev":3,"material":True}],
+     "triggers":["Bill arrival; WFH days"],"workaround":"Heater under desk; sweaters","wtp_ceiling":12,"tell_threshold":0.6,
+     "anecdotes":["I track the thermostat closely in winter."],"quirk":"Likes numbers"},
+    {"name":"Elena Rossi","segment":"Renter","bio":"Garden apartment; landlord controls boiler; wants comfort.",
+     "pains":[{"text":"Bedroom cold, living room warm","freq":4,"sev":3,"material":True}],
+     "triggers":["Cold nights"],"workaround":"Heavy blanket; asks landlord","wtp_ceiling":5,"tell_threshold":0.5,
+     "anecdotes":["Studying in a hoodie and gloves."],"quirk":"Time-pressed student"},
+    {"name":"Derrick Owens","segment":"Installer","bio":"Regional installer; partners with property managers.",
+     "pains":[{"text":"Wants upsell that reduces callbacks","freq":3,"sev":3,"material":True}],
+     "triggers":["Post-install complaints"],"workaround":"Higher-end dampers; room heaters",
+     "wtp_ceiling":0,"tell_threshold":0.65,"anecdotes":["Callbacks kill our margins."],"quirk":"Sales-forward"},
+    {"name":"Hannah Kim","segment":"Homeowner","bio":"Townhome; hosts often; wants quiet comfort in guest room.",
+     "pains":[{"text":"Guest room too hot; vent noise","freq":3,"sev":3,"material":True}],
+     "triggers":["When guests visit"],"workaround":"Close vent; portable AC","wtp_ceiling":9,"tell_threshold":0.55,
+     "anecdotes":["We warn guests to bring a light blanket."],"quirk":"Aesthetic sensitive"},
+    {"name":"Omar Farouk","segment":"Landlord","bio":"Owns 6 single-family rentals; wants fewer tenant calls.",
+     "pains":[{"text":"Comfort complaints drive churn","freq":3,"sev":3,"material":True}],
+     "triggers":["Renewal season"],"workaround":"Remind to adjust vents; one-off fixes","wtp_ceiling":0,"tell_threshold":0.6,
+     "anecdotes":["A family left over heating issues."],"quirk":"Cost-focused"},
+    {"name":"Zoey Park","segment":"Homeowner","bio":"Small bungalow; budget constrained; cares about bills.",
+     "pains":[{"text":"Bill spikes after cold front","freq":3,"sev":3,"material":True}],
+     "triggers":["Utility email; bill shock"],"workaround":"Lower thermostat; layers","wtp_ceiling":6,"tell_threshold":0.5,
+     "anecdotes":["I compare bills with neighbors."],"quirk":"Coupon clipper"},
+    # --- Curveball personas: teach students to distinguish signal from noise ---
+    {"name":"Trent Holloway","segment":"Homeowner","bio":"New construction; good insulation; loves gadgets.",
+     "pains":[{"text":"Occasionally notices slight temp difference between floors","freq":1,"sev":1,"material":False}],
+     "triggers":["Reading smart-home blogs"],"workaround":"None needed; house is comfortable",
+     "wtp_ceiling":25,"tell_threshold":0.4,
+     "anecdotes":["I saw a TikTok about smart vents and thought it looked cool."],
+     "quirk":"Enthusiastic early adopter who says yes to everything but has no real pain"},
+    {"name":"Debra Cassidy","segment":"Homeowner","bio":"Thinks she has airflow issues; actually has poor attic insulation.",
+     "pains":[{"text":"Upstairs bedroom warm in summer","freq":4,"sev":4,"material":False}],
+     "triggers":["Summer heat"],"workaround":"Window AC unit in bedroom",
+     "wtp_ceiling":12,"tell_threshold":0.55,
+     "anecdotes":["We had someone look at the ducts and they said everything was fine."],
+     "quirk":"Misattributes insulation problem to airflow; duct inspection already cleared"},
+]
+
+FLASH_PERSONAS = [
+    {"name":"Flash — Property Manager","segment":"Landlord","bio":"30 units; central HVAC.",
+     "note":"Comfort tickets spike after first cold week; room-by-room balancing is slow."},
+    {"name":"Flash — Parent of Infant","segment":"Homeowner","bio":"Nursery swings at night.",
+     "note":"Tried taping vent and space heater; worried about safety and bills."},
+    {"name":"Flash — Student Renter","segment":"Renter","bio":"Basement room; landlord controls temperature.",
+     "note":"Studies in living room for warmth; electric bill rises with space heater."},
+    {"name":"Flash — Retiree","segment":"Homeowner","bio":"Fixed income; wants payback.",
+     "note":"Wants proof a retrofit pays back within a year."},
+    {"name":"Flash — Short-Term Rental Host","segment":"Landlord","bio":"Reviews mention comfort.",
+     "note":"Would pay for something that reduces guest complaints."},
+    {"name":"Flash — Installer Crew Lead","segment":"Installer","bio":"Trains techs.",
+     "note":"Seeks add-on that reduces rework with clear margin."},
+    {"name":"Flash — Remote Worker","segment":"Homeowner","bio":"Cold basement office.",
+     "note":"Heater helps but hikes bill; wants smarter airflow."},
+    {"name":"Flash — Eco Enthusiast","segment":"Homeowner","bio":"Solar + smart thermostat.",
+     "note":"Comfort fine; wants measurable energy savings."},
+    {"name":"Flash — Building Superintendent","segment":"Installer","bio":"Condo block maintenance.",
+     "note":"Needs clear install steps and warranty handling."},
+    {"name":"Flash — Budget-Conscious Couple","segment":"Homeowner","bio":"Watching expenses.",
+     "note":"Open to DIY if upfront under $150 and payback <12 months."},
+    {"name":"Flash — Pet Owner","segment":"Homeowner","bio":"Dog sleeps in warmest room.",
+     "note":"Wants quieter airflow at night; noise matters."},
+    {"name":"Flash — Tech Skeptic","segment":"Homeowner","bio":"Avoids 'smart' gadgets.",
+     "note":"Needs simple, non-intrusive device with tangible savings."},
+]
+
+# ---------- Segment-tailored question banks (open vs leading governs trust) ----------
+# Each question has a short "label" for the button and "text" for the full question shown after selection
+QB = {
+    "Homeowner": [
+        {"key":"habit_home","label":"Heating/cooling habits","text":"Tell me about your habits for heating and cooling your home.","kind":"open"},
+        {"key":"starters1","label":"Walk through an uncomfortable day","text":"Walk me through a typical day when a room feels uncomfortable.","kind":"open"},
+        {"key":"starters2","label":"Last time temp felt off","text":"Tell me about the last time the temperature felt off. What happened?","kind":"open"},
+        {"key":"impact","label":"Impact on daily life","text":"What does this problem stop you from doing, or make harder?","kind":"open"},
+        {"key":"workarounds","label":"What you've tried","text":"What have you tried so far? How did it go?","kind":"open"},
+        {"key":"frequency","label":"How often it happens","text":"How often does this happen in a typical month?","kind":"open"},
+        {"key":"bill","label":"Energy bill impact","text":"How did your energy bill change when this was worst?","kind":"open"},
+        {"key":"priorities","label":"Top priority right now","text":"What matters most right now: saving energy, convenience, saving money, or home comfort?","kind":"open"},
+        {"key":"leading_buy","label":"Would you buy a fix?","text":"Would you buy a device to fix airflow if it was affordable?","kind":"leading"},
+        {"key":"solutioning","label":"What if: smart vents?","text":"What if I built smart vents you could control by phone?","kind":"leading"},
+    ],
+    "Renter": [
+        {"key":"habit_renter","label":"Managing without control","text":"How do you manage heating and cooling when you can't change the system?","kind":"open"},
+        {"key":"last_time","label":"Last uncomfortable night","text":"Tell me about the last night it was uncomfortable. What did you do?","kind":"open"},
+        {"key":"impact","label":"Impact on sleep/work/bills","text":"How does this affect sleep, work, or bills?","kind":"open"},
+        {"key":"workarounds","label":"Workarounds tried","text":"What workarounds have you tried?","kind":"open"},
+        {"key":"frequency","label":"How often it happens","text":"How often does this happen in a month?","kind":"open"},
+        {"key":"bill","label":"Bill changes from fans/heaters","text":"How does your electric bill change when you use heaters or fans?","kind":"open"},
+        {"key":"priorities","label":"What matters most","text":"Which matters most: comfort, saving money, or convenience?","kind":"open"},
+        {"key":"leading_buy","label":"Pay monthly for better airflow?","text":"If it were renter-friendly, would you pay monthly for better airflow?","kind":"leading"},
+        {"key":"solutioning","label":"What if: clip-on vents + app?","text":"What if there were clip-on vents with an app?","kind":"leading"},
+    ],
+    "Landlord": [
+        {"key":"habit_land","label":"Biggest HVAC frustrations","text":"What are your biggest frustrations with heating and cooling across units?","kind":"open"},
+        {"key":"last_wave","label":"Last heat/cold wave calls","text":"Tell me about the last cold or heat wave. What calls came in?","kind":"open"},
+        {"key":"impact","label":"Effect on renewals/reviews","text":"How do comfort complaints affect renewals or reviews?","kind":"open"},
+        {"key":"ops","label":"Current balancing process","text":"How do you currently handle balancing and follow-ups?","kind":"open"},
+        {"key":"frequency","label":"Ticket frequency per season","text":"How often do these tickets appear in a season?","kind":"open"},
+        {"key":"costs","label":"Where costs spike","text":"Where do costs spike: labor, equipment, or damages?","kind":"open"},
+        {"key":"priorities","label":"Top ops priority","text":"What's the top priority: fewer complaints, lower ops cost, or faster response?","kind":"open"},
+        {"key":"leading_buy","label":"Pay per unit for a fix?","text":"Would you pay per unit for a retrofit that reduces complaints?","kind":"leading"},
+        {"key":"solutioning","label":"What if: smart vents for techs?","text":"What if techs could clip on smart vents and see fewer callbacks?","kind":"leading"},
+    ],
+    "Installer": [
+        {"key":"habit_inst","label":"Post-install complaint patterns","text":"What patterns do you see when customers complain about comfort after installs?","kind":"open"},
+        {"key":"cases","label":"A recent revisit case","text":"Tell me about a recent case you had to revisit.","kind":"open"},
+        {"key":"impact","label":"Callback impact on margins","text":"How do callbacks affect your schedule or margins?","kind":"open"},
+        {"key":"methods","label":"Current diagnosis methods","text":"How do you currently balance airflow or diagnose issues?","kind":"open"},
+        {"key":"frequency","label":"Revisit frequency","text":"How often are revisits needed during season changes?","kind":"open"},
+        {"key":"proof","label":"Proof customers want","text":"What proof do customers ask for to believe improvements?","kind":"open"},
+        {"key":"priorities","label":"Install vs reliability vs upsell","text":"What matters most: simple install, reliability, or upsell potential?","kind":"open"},
+        {"key":"leading_buy","label":"Recommend a reliable add-on?","text":"Would you recommend an add-on if it's reliable and profitable?","kind":"leading"},
+        {"key":"solutioning","label":"What if: auto-balancing kit?","text":"What if a kit made balancing automatic. Would that help?","kind":"leading"},
+    ],
+}
+
+# ---------- Segment-level default answers ----------
+SEGMENT_ANSWERS = {
+    "Homeowner": {
+        "habit_home":"We try to keep a steady set point, but afternoons heat up upstairs.",
+        "starters1":"By evening the nursery hits high 70s; downstairs stays cooler.",
+        "starters2":"Last week during a warm spell, the bedroom hit 79°F at 10pm.",
+        "impact":"Poor sleep for kids; we move fans and argue over the thermostat.",
+        "workarounds":"We half-close vents, run a box fan, sometimes a space heater.",
+        "frequency":"Maybe 8–12 times a month in summer.",
+        "bill":"Bills go up 20–25% mid-summer.",
+        "priorities":"Comfort first at night, but bills matter too.",
+        "leading_buy":"Maybe, if it actually works and isn't loud.",
+        "solutioning":"It'd have to be simple, quiet, and safe around kids."
+    },
+    "Renter": {
+        "habit_renter":"I open windows, use a fan; landlord controls the boiler.",
+        "last_time":"Two nights ago the bedroom was way too warm; I slept on the couch.",
+        "impact":"Sleep suffers; studying is harder; bill creeps up with the fan.",
+        "workarounds":"Fan, window, lighter bedding; landlord is slow.",
+        "frequency":"5–10 nights a month in summer.",
+        "bill":"Electric bill rises $15–30 those months.",
+        "priorities":"Comfort, then cost; I can't change the system.",
+        "leading_buy":"If renter-friendly and I can take it with me—maybe.",
+        "solutioning":"Landlord approval could be an issue—how would that work?"
+    },
+    "Landlord": {
+        "habit_land":"Complaints cluster on first cold week—phones light up.",
+        "last_wave":"Three units called same night; top floors too cold.",
+        "impact":"Bad reviews and sometimes lost renewals.",
+        "ops":"We ask tenants to adjust dampers; sometimes send techs to rebalance.",
+        "frequency":"At season change, then a few times per month.",
+        "costs":"Labor overtime is the big hit; not utilities.",
+        "priorities":"Fewer complaints with minimal complexity.",
+        "leading_buy":"If it cuts complaints without extra headaches, yes.",
+        "solutioning":"Needs clear install steps, durability, and warranty."
+    },
+    "Installer": {
+        "habit_inst":"Often renovations leave ducts unbalanced; returns far from rooms.",
+        "cases":"New furnace; back room still cold; had to revisit to balance.",
+        "impact":"Callbacks wreck the schedule and margins.",
+        "methods":"Manual damper balancing; sometimes recommend new thermostat.",
+        "frequency":"Weekly during season changes.",
+        "proof":"Customers want before/after temps or energy data.",
+        "priorities":"Simple install and reliability; upsell helps.",
+        "leading_buy":"If reliable and upsell-ready, sure.",
+        "solutioning":"Only if it won't jam and support is solid."
+    },
+}
+
+# Persona-specific answer overrides for curveball personas
+PERSONA_OVERRIDES = {
+    "Trent Holloway": {
+        "habit_home": "Honestly, our house stays pretty comfortable. The system is only two years old.",
+        "starters1": "I don't really have uncomfortable days. Maybe once in a while I notice the upstairs is a degree or two warmer, but nothing serious.",
+        "starters2": "I can't think of a specific time recently. It's more of a 'nice to have' optimization thing for me.",
+        "impact": "It doesn't really stop me from doing anything. I just like the idea of having total control over every room.",
+        "workarounds": "I haven't really needed to try anything. The house is fine.",
+        "frequency": "Maybe once a month I notice something? It's really not frequent.",
+        "bill": "Our bills are pretty normal. No big surprises.",
+        "priorities": "Honestly, I just like cool tech. If it connects to my smart home setup, I'm interested.",
+        "leading_buy": "Oh absolutely, I'd buy it. I love trying new smart home stuff. Take my money!",
+        "solutioning": "Yes, that sounds amazing. When can I get one? Does it work with HomeKit?",
+    },
+    "Debra Cassidy": {
+        "habit_home": "We run the AC hard in summer but the upstairs never really cools down properly.",
+        "starters1": "By 3pm the master bedroom is noticeably warm. The AC is blasting but it's like the air isn't reaching up there.",
+        "starters2": "Last July we had a week where the bedroom hit 82 even with the AC set to 72. We ended up sleeping downstairs.",
+        "impact": "Sleep is terrible in summer. We fight about the thermostat constantly.",
+        "workarounds": "We bought a window AC unit for the bedroom. It helps but it's loud and expensive to run.",
+        "frequency": "Every day from June through September, really.",
+        "bill": "Summer bills are brutal. Over $300 some months. The window unit alone adds probably $40-50.",
+        "priorities": "Comfort upstairs. I just want the bedroom to be cool at night.",
+        "leading_buy": "If it would actually fix the upstairs, yes. We already had a duct guy look at it and he said the ducts were fine though.",
+        "solutioning": "Maybe? But we already had someone check the vents and they said airflow was normal. I'm not sure vents are the problem.",
+    },
+}
+
+
+# ---------- External scenario catalog ----------
+# SIM_CATALOG=path.sqlite replaces the built-in scenario above with a catalog file
+# (see catalog.py). Rows are then fetched by id on demand and shared read-only
+# across processes instead of living as literals in every worker.
+if os.environ.get("SIM_CATALOG"):
+    from catalog import SQLiteCatalog
+    INTERVIEW_PERSONAS, FLASH_PERSONAS, QB, SEGMENT_ANSWERS, PERSONA_OVERRIDES = \
+        SQLiteCatalog(os.environ["SIM_CATALOG"]).tables()
+
+# A transcript turn is one byte (position << 1 | unlocked), so a bank holds at most 128 questions.
+MAX_BANK_QUESTIONS = 128
+for _seg, _qs in QB.items():
+    if len(_qs) > MAX_BANK_QUESTIONS:
+        raise ValueError(f"question bank {_seg!r} has {len(_qs)} questions; "
+                         f"a turn code fits at most {MAX_BANK_QUESTIONS}")
+
+@lru_cache(maxsize=1)
+def persona_segments() -> List[str]:
+    """Segment of every interview persona, without materialising lazy catalog rows."""
+    return getattr(INTERVIEW_PERSONAS, "segments", None) or [p["segment"] for p in INTERVIEW_PERSONAS]
+
+# ---------- Pain keyword clusters used by synthesis ----------
+PAIN_KEYWORDS = {
+    "Hot room": ["hot", "overheat", "sticky", "warm", "hotter"],
+    "Cold room": ["cold", "draft", "chilly", "freezing", "cool"],
+    "High bill": ["bill", "cost", "expensive", "spike", "pric"],
+    "No control": ["landlord", "no control", "cannot change", "slow to respond"],
+    "Noise": ["noisy", "loud", "vent noise", "quiet"],
+}
+# One precompiled alternation per cluster, built once at import.
+_PAIN_PATTERNS = [(c, re.compile("|".join(re.escape(w) for w in words))) for c, words in PAIN_KEYWORDS.items()]
+
+@lru_cache(maxsize=8192)
+def match_clusters(text: str) -> tuple:
+    """Clusters whose keywords occur in `text` (case-insensitive), in PAIN_KEYWORDS order.
+
+    Transcript turns come from a fixed answer bank, so most texts repeat across
+    sessions and are answered from the cache.
+    """
+    txt = text.lower()
+    return tuple(c for c, pat in _PAIN_PATTERNS if pat.search(txt))
+
+# Structured-draft defaults for the strongest pain cluster
+PAIN_DEFAULTS = {
+    "Cold room":  {"core_pain": "Cold room that no thermostat setting fixes",
+                   "trigger": "During winter evenings or early mornings",
+                   "impact": "Discomfort, sleep disruption, and rising energy bills"},
+    "Hot room":   {"core_pain": "A single room that overheats compared to the rest of the house",
+                   "trigger": "During summer afternoons or during heavy HVAC use",
+                   "impact": "Unusable space, family conflict over thermostat, wasted cooling"},
+    "High bill":  {"core_pain": "Energy bill keeps climbing without explanation",
+                   "trigger": "Peak heating and cooling seasons",
+                   "impact": "Household budget stress and loss of trust in current HVAC"},
+    "No control": {"core_pain": "No room-level control over temperature or airflow",
+                   "trigger": "Whenever any single occupant wants a different setting",
+                   "impact": "Constant compromise, arguments, and inefficient whole-home heating"},
+    "Noise":      {"core_pain": "HVAC system is loud enough to disrupt sleep and work",
+                   "trigger": "Whenever the system cycles on, especially at night",
+                   "impact": "Poor sleep, Zoom call disruption, and ongoing annoyance"},
+}
+
+# Bank order first, then any persona segment a catalog adds without a bank of its own.
+SEGMENTS = list(dict.fromkeys([*QB, *persona_segments()]))
+MIN_QUESTIONS_PER_INTERVIEW = 4
+
+def clamp(x,a,b): return max(a, min(b, x))
+
+def start_trust(segment: str) -> float:
+    return 0.4 if segment in ["Landlord","Installer"] else 0.5
+
+# ---------- State ----------
+def new_state() -> Dict[str, Any]:
+    return {
+        "stage":"intro",
+        "seed":None,               # optional per-session seed mixed into recruitment
+        "alloc":{k:0 for k in CHANNELS},
+        "booked_ids":[],
+        "current_idx":0,           # walk through interviews one by one
+        "interview":{},            # pid -> Interview
+        "flash_open":[],
+        "analytics":{},
+        "draft_struct":{           # structured inputs for hypothesis and test
+            "who":"",
+            "core_pain":"",
+            "trigger":"",
+            "impact":"",
+            "workaround":"",
+            "quantifier":"",
+            "next_method":"",
+            "next_target":""
+        },
+        "chosen_segment": None,           # learner's chosen ICP for next step
+        "chosen_pain": None,              # learner's chosen primary pain
+        "decision": "Proceed",            # Proceed / Narrow / Pivot
+        "problem_text":"",
+        "next_test_text":"",
+        "submitted_draft":False,
+        "score":None,
+        "reasons":{},
+        # Active synthesis: student guesses before seeing data
+        "synth_guess_top1": None,
+        "synth_guess_top2": None,
+        "synth_guess_submitted": False,
+    }
+
+# Learner-written fields carried by a draft submission
+DRAFT_KEYS = ("draft_struct", "chosen_segment", "chosen_pain", "decision", "problem_text", "next_test_text")
+
+class Turn(NamedTuple):
+    q: str
+    a: str
+    kind: str
+
+# ---------- Static question indexes ----------
+# Derived from the static banks and built once per process; engine.py is imported
+# once per server process, so Streamlit reruns share these like st.cache_resource.
+class BankIndex(NamedTuple):
+    questions: Tuple[Dict[str, Any], ...]   # QB[segment], by bank position
+    pos: Dict[str, int]                     # key -> bank position
+    by_key: Dict[str, Dict[str, Any]]       # key -> question
+    kind: Dict[str, str]                    # key -> "open" / "leading"
+
+@lru_cache(maxsize=None)
+def bank_index(segment:str) -> BankIndex:
+    qs = tuple(QB[segment])
+    return BankIndex(qs, {q["key"]: i for i, q in enumerate(qs)}, {q["key"]: q for q in qs},
+                     {q["key"]: q["kind"] for q in qs})
+
+@lru_cache(maxsize=4096)
+def question_order(pid:int) -> Tuple[int, ...]:
+    """Fixed per-persona shuffle of bank positions; shared by every session."""
+    order = list(range(len(QB[INTERVIEW_PERSONAS[pid]["segment"]])))
+    random.Random(pid).shuffle(order)
+    return tuple(order)
+
+@lru_cache(maxsize=4096)
+def open_first_order(pid:int) -> Tuple[int, ...]:
+    """question_order(pid) with open questions first (stable), the order selectable() offers them in."""
+    qs = bank_index(INTERVIEW_PERSONAS[pid]["segment"]).questions
+    return tuple(sorted(question_order(pid), key=lambda i: 0 if qs[i]["kind"]=="open" else 1))
+
+class Interview:
+    """One booked interview, integer-coded to keep per-session memory small.
+
+    Questions are positions in the persona's QB bank. `asked` is a bitmask of
+    positions and each transcript turn is one byte (position << 1 | unlocked);
+    question and answer text are looked up from the shared banks on demand.
+    """
+    __slots__ = ("pid", "trust", "asked", "turns", "ended")
+
+    def __init__(self, pid:int, trust:float, asked:int=0, turns:bytes=b"", ended:bool=False):
+        self.pid = pid
+        self.trust = trust
+        self.asked = asked
+        self.turns = bytearray(turns)
+        self.ended = ended
+
+    @property
+    def order(self) -> Tuple[int, ...]:
+        return question_order(self.pid)
+
+    @property
+    def q_count(self) -> int:
+        return len(self.turns)
+
+    def turn(self, i:int) -> Turn:
+        code = self.turns[i]
+        q = bank_index(INTERVIEW_PERSONAS[self.pid]["segment"]).questions[code >> 1]
+        return Turn(q["text"], lookup_answer(self.pid, q["key"], bool(code & 1)), q["kind"])
+
+    @property
+    def transcript(self) -> List[Turn]:
+        return [self.turn(i) for i in range(len(self.turns))]
+
+    def kinds(self) -> List[str]:
+        bank = bank_index(INTERVIEW_PERSONAS[self.pid]["segment"]).questions
+        return [bank[code >> 1]["kind"] for code in self.turns]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"pid": self.pid, "trust": self.trust, "asked": self.asked,
+                "turns": list(self.turns), "ended": self.ended}
+
+    @classmethod
+    def from_dict(cls, d:Dict[str, Any]) -> "Interview":
+        return cls(d["pid"], d["trust"], d["asked"], bytes(d["turns"]), d["ended"])
+
+class _Signal:
+    """Running synthesis signal of one interview: cluster hit counts and first quotes."""
+    __slots__ = ("hits", "quotes")
+
+    def __init__(self):
+        self.hits: Dict[str, int] = {}
+        self.quotes: Dict[str, List[str]] = {}
+
+_NO_SIGNAL = _Signal()
+
+@lru_cache(maxsize=4096)
+def unlock_bonus(pid:int) -> Tuple[Tuple[str, float], ...]:
+    """(cluster, weight) credited when a persona's material pains are unlocked."""
+    return tuple((c, pain["freq"] * 0.5) for pain in INTERVIEW_PERSONAS[pid]["pains"] if pain["material"]
+                 for c in match_clusters(pain["text"]))
+
+# ---------- Seeding ----------
+def stable_seed(*parts) -> int:
+    """64-bit seed from a blake2b digest of `parts`.
+
+    Unlike hash(), this does not change between Python processes (string hashing
+    is randomized per process), so replicas, replays and caches agree.
+    """
+    return int.from_bytes(hashlib.blake2b(repr(parts).encode(), digest_size=8).digest(), "big")
+
+# ---------- Serialization ----------
+def dump_state(state: Dict[str, Any]) -> str:
+    """JSON snapshot of a session state dict."""
+    doc = dict(state)
+    doc["interview"] = [stt.to_dict() for stt in state["interview"].values()]
+    return json.dumps(doc, separators=(",", ":"))
+
+def load_state(text: str) -> Dict[str, Any]:
+    """Inverse of dump_state; keys missing from older snapshots take their defaults."""
+    state = new_state()
+    state.update(json.loads(text))
+    state["interview"] = {d["pid"]: Interview.from_dict(d) for d in state["interview"]}
+    return state
+
+# ---------- Recruitment ----------
+class FenwickSampler:
+    """Weighted draws without replacement over indices 0..n-1, O(log n) per draw and removal.
+
+    A Fenwick (binary indexed) tree holds prefix sums of the weights, so a draw
+    descends the tree instead of walking a cumulative list, and a drawn index is
+    removed by zeroing its weight rather than rejected and redrawn.
+    """
+
+    def __init__(self, weights: List[float]):
+        self.n = n = len(weights)
+        self.weights = list(weights)
+        self.total = sum(weights)
+        tree = [0.0] + self.weights
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+        self.top = 1 << (n.bit_length() - 1) if n else 0
+
+    def _add(self, i:int, delta:float):
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def draw(self, rng: random.Random) -> int:
+        """Pick an index with probability weight/total and remove it."""
+        target = rng.random() * self.total
+        pos, step = 0, self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        # Float drift can land past the last live weight; fall back to the nearest live index.
+        if pos >= self.n or self.weights[pos] <= 0:
+            pos = max(i for i in range(self.n) if self.weights[i] > 0)
+        self._add(pos, -self.weights[pos])
+        self.total -= self.weights[pos]
+        self.weights[pos] = 0.0
+        return pos
+
+def recruit_personas(alloc: Dict[str,int], need:int=6, seed:Optional[int]=None) -> List[int]:
+    return list(_recruit(tuple(sorted(alloc.items())), need, seed))
+
+@lru_cache(maxsize=1024)
+def _recruit(alloc_items: tuple, need:int, seed:Optional[int]) -> tuple:
+    # Seed based on allocation (and the optional session seed) so results are stable
+    # across reruns, workers and restarts with the same inputs; cached per allocation vector
+    rng = random.Random(stable_seed(alloc_items, seed))
+    weights=[]
+    for seg in persona_segments():
+        w=0.0
+        for ch, t in alloc_items:
+            if t<=0: continue
+            chp=CHANNELS[ch]
+            w += t * chp["yield"] * chp["bias"].get(seg,0.1) * rng.uniform(0.85,1.15)
+        weights.append(max(0.0001,w))
+    sampler = FenwickSampler(weights)
+    # Every persona keeps a positive weight, so this always books min(need, pool size)
+    return tuple(sorted(sampler.draw(rng) for _ in range(min(need, len(weights)))))
+
+# ---------- Answer table ----------
+# An answer depends only on (pid, qkey, whether trust >= tell_threshold), so each
+# persona's answers are composed once, on its first question, and then looked up.
+_ANSWER_TABLE: Dict[int, Dict[Tuple[str, bool], str]] = {}
+
+def compose_answer(pid:int, qkey:str, unlocked:bool)->str:
+    p = INTERVIEW_PERSONAS[pid]
+
+    # Check for persona-specific override first
+    if p["name"] in PERSONA_OVERRIDES and qkey in PERSONA_OVERRIDES[p["name"]]:
+        base = PERSONA_OVERRIDES[p["name"]][qkey]
+    else:
+        base = SEGMENT_ANSWERS[p["segment"]].get(qkey, "Not sure.")
+
+    extra=""
+    if unlocked:
+        mats=[x for x in p["pains"] if x["material"]]
+        if mats:
+            top=max(mats, key=lambda d:d["freq"]+d["sev"])
+            if qkey in ["impact","workarounds","starters2","last_time","ops","methods"]:
+                extra += f" The key issue is: {top['text']}."
+        if qkey in ["bill","costs"]:
+            extra += " We see a noticeable jump during peak months."
+        if p["wtp_ceiling"]>0 and qkey in ["leading_buy","solutioning"]:
+            extra += f" I might pay up to about ${p['wtp_ceiling']}/month if it really helps."
+    if stable_seed(pid, qkey) % 5 == 0:
+        extra += " It does vary week to week."
+    return base + ((" " + extra) if extra else "")
+
+def _persona_answers(pid:int) -> Dict[Tuple[str, bool], str]:
+    rows = _ANSWER_TABLE.get(pid)
+    if rows is None:
+        seg = INTERVIEW_PERSONAS[pid]["segment"]
+        rows = _ANSWER_TABLE[pid] = {(q["key"], unlocked): compose_answer(pid, q["key"], unlocked)
+                                     for q in QB[seg] for unlocked in (False, True)}
+    return rows
+
+def lookup_answer(pid:int, qkey:str, unlocked:bool)->str:
+    ans = _persona_answers(pid).get((qkey, unlocked))
+    return ans if ans is not None else compose_answer(pid, qkey, unlocked)
+
+# Caches outside the engine built from answers (e.g. solver's); cleared with the answer table.
+_ANSWER_DEPENDENTS: List[Callable[[], None]] = []
+
+def on_answers_changed(clear: Callable[[], None]):
+    """Register `clear` to run whenever invalidate_answers does."""
+    _ANSWER_DEPENDENTS.append(clear)
+
+def invalidate_answers(pid:Optional[int]=None):
+    """Drop composed answers after personas, overrides or segment answers change."""
+    if pid is None:
+        _ANSWER_TABLE.clear()
+    else:
+        _ANSWER_TABLE.pop(pid, None)
+    turn_markdown.cache_clear()
+    for clear in _ANSWER_DEPENDENTS:
+        clear()
+
+@lru_cache(maxsize=4096)
+def turn_markdown(pid:int, code:int) -> str:
+    """Markdown for one transcript turn (an Interview.turns code), as the live page shows it.
+    Engine-level, so it is built once per process and shared by every rerun and session."""
+    p = INTERVIEW_PERSONAS[pid]
+    q = bank_index(p["segment"]).questions[code >> 1]
+    kind_tag = " *(leading)*" if q["kind"] == "leading" else ""
+    return f"**You:** {q['text']}{kind_tag}\n\n**{p['name']}:** {lookup_answer(pid, q['key'], bool(code & 1))}"
+
+def answer_table() -> Iterator[Tuple[int, str, str, bool, str]]:
+    """Every (pid, persona, qkey, unlocked, answer) row, for offline analysis."""
+    for pid in range(len(INTERVIEW_PERSONAS)):
+        name = INTERVIEW_PERSONAS[pid]["name"]
+        for (qkey, unlocked), ans in _persona_answers(pid).items():
+            yield pid, name, qkey, unlocked, ans
+
+# ---------- Scoring ----------
+# Inputs compute_score reads from a session; score_batch takes one column per key.
+SCORE_KEYS = ("interview", "analytics", "chosen_pain", "problem_text", "next_test_text")
+SCORE_WEIGHTS = {"Interview Craft":0.30, "Coverage":0.15, "Signal Detection":0.30,
+                 "Problem Statement Quality":0.15, "Next Test Plan":0.10}
+
+def weighted_total(components: Dict[str, int], weights: Optional[Dict[str, float]] = None) -> int:
+    W = weights or SCORE_WEIGHTS
+    return int(sum(W[k]*components[k] for k in SCORE_WEIGHTS))
+
+def craft_points(open_q:int, lead_q:int, avg_trust:float) -> int:
+    """Interview Craft component from question kinds and average final trust (targets: ≥70% open, ≤15% leading, trust ≥0.6)."""
+    total_q = max(1, open_q + lead_q)
+    open_pct, lead_pct = open_q/total_q, lead_q/total_q
+    craft = 0.5*min(1.0, open_pct/0.7) + 0.3*max(0, 1 - max(0,(lead_pct-0.15)/0.85)) + 0.2*min(1.0, avg_trust/0.6)
+    return int(100*craft)
+
+@lru_cache(maxsize=4096)
+def _quote_words(quote: str) -> tuple:
+    # Quotes repeat verbatim across sessions (they come from the answer bank), so split once.
+    return tuple(w for w in quote.lower().split() if len(w) > 5)
+
+def _craft_inputs(interview: Dict[int, "Interview"]) -> Tuple[int, int, float]:
+    """(open questions, leading questions, average final trust over started interviews)."""
+    open_q=lead_q=0; trusts=[]
+    for pid, stt in interview.items():
+        if stt.q_count>0: trusts.append(stt.trust)
+        for kind in stt.kinds():
+            if kind=="open": open_q+=1
+            else: lead_q+=1
+    return open_q, lead_q, sum(trusts)/max(1,len(trusts))
+
+def _coverage_inputs(analytics: Dict[str, Any]) -> Tuple[int, bool, float, float]:
+    """(segments reached, channel bias flag, bias score, average saturation)."""
+    return (len(analytics.get("seg_mix",{})), bool(analytics.get("bias_flag")),
+            analytics.get("bias_score", 0), analytics.get("avg_saturation", 1.0))
+
+def _top_clusters(analytics: Dict[str, Any]) -> List[str]:
+    top2 = sorted(analytics["clusters"].items(), key=lambda kv: kv[1], reverse=True)[:2]
+    return [k for k,_ in top2]
+
+def _any_of(words: List[str]) -> "re.Pattern":
+    """Matches wherever any of `words` occurs, like any(w in text for w in words)."""
+    return re.compile("|".join(map(re.escape, words)))
+
+_QUANTIFIED = _any_of(["%", " times", " per ", " degree", "$"])
+_WHO = _any_of(["homeowner","renter","landlord","installer"])
+_TRIGGER = _any_of(["heat","cold","bill","complain","night","summer","winter","season","spike","draft"])
+_TESTABLE = _any_of(["measure","within","increase","reduce","by ","per month","per week","times"])
+_METHOD = _any_of(["landing","preorder","pilot","trial","survey","interview","prototype","a/b"])
+_THRESHOLD = _any_of(["target", ">=", "<=", "%", " signups", " conversions", " complaints"])
+
+def _text_checks(analytics: Dict[str, Any], chosen_pain: Optional[str], problem_text: str,
+                 next_test_text: str) -> Tuple[float, ...]:
+    """Per-session checks of the draft, in the order score_batch reads them:
+    aligned, quantified, who, trigger, testable, evidence, length, method, threshold."""
+    # detection (less brittle): match learner-picked primary pain against top-2 clusters;
+    # use text only for extra credit if numbers present
+    aligned = 1 if (chosen_pain in _top_clusters(analytics)) else 0
+    hypo = problem_text.lower()
+    quantified = 1 if _QUANTIFIED.search(hypo) else 0
+
+    # problem: check for specificity and grounding in interview data
+    who_ok = _WHO.search(hypo) is not None
+    trig_ok = _TRIGGER.search(hypo) is not None
+    testable_ok = _TESTABLE.search(hypo) is not None
+    # Bonus: references specific personas, quotes, or interview findings
+    quotes_all = analytics.get("quotes", {})
+    # Check if any meaningful phrase from a quote appears in the hypothesis
+    evidence_ok = 1 if any(w in hypo for cluster_quotes in quotes_all.values()
+                           for q in cluster_quotes for w in _quote_words(q)) else 0
+    # Length check: very short statements are likely low-effort
+    length_ok = 1 if len(problem_text.strip()) > 80 else 0.5
+
+    # next test
+    nxt=next_test_text.lower()
+    method_ok = _METHOD.search(nxt) is not None
+    threshold_ok = _THRESHOLD.search(nxt) is not None
+    return aligned, quantified, who_ok, trig_ok, testable_ok, evidence_ok, length_ok, method_ok, threshold_ok
+
+def score_session(interview: Dict[int, "Interview"], analytics: Dict[str, Any], chosen_pain: Optional[str],
+                  problem_text: str, next_test_text: str):
+    """Pure scoring of one session's inputs. Returns (score, reasons) as stored in S."""
+    # craft
+    open_q, lead_q, avg_trust = _craft_inputs(interview)
+    total_q = open_q + lead_q
+    open_pct = open_q/max(1,total_q)
+    lead_pct = lead_q/max(1,total_q)
+    craft_score=craft_points(open_q, lead_q, avg_trust)
+
+    # coverage — composite of segment diversity, channel balance, and saturation
+    seg_div, bias_flag, bias_score, avg_sat = _coverage_inputs(analytics)
+    channel_ok = 0 if bias_flag else 1
+    seg_base = 0.7 if seg_div>=4 else 0.5 if seg_div>=3 else 0.2 if seg_div==2 else 0.1
+    coverage = clamp(seg_base + 0.3*channel_ok, 0, 1)
+    # Continuous sampling-bias penalty (HHI-based concentration).
+    if bias_score > 0.6:
+        # linear penalty from 0% at bias=0.6 to 30% at bias=1.0
+        penalty = min(0.30, (bias_score - 0.6) * 0.75)
+        coverage = max(0.0, coverage * (1 - penalty))
+    # Saturation penalty: the 5th homeowner interview tells you almost
+    # nothing the first 3 didn't. If the learner ground a single segment,
+    # their last interviews added <50% of an early interview's info value —
+    # which means their headline "N interviews" overstates coverage.
+    if avg_sat < 0.7:
+        # Linear penalty: 0% at 0.7, up to 25% at 0.3
+        sat_penalty = min(0.25, (0.7 - avg_sat) * 0.625)
+        coverage = max(0.0, coverage * (1 - sat_penalty))
+    coverage_score=int(100*coverage)
+
+    (aligned, quantified, who_ok, trig_ok, testable_ok, evidence_ok, length_ok,
+     method_ok, threshold_ok) = _text_checks(analytics, chosen_pain, problem_text, next_test_text)
+    detection = clamp(0.75*aligned + 0.25*quantified, 0, 1)
+    detection = int(100*detection)
+    problem=int(100*clamp(0.25*who_ok + 0.25*trig_ok + 0.2*testable_ok + 0.15*evidence_ok + 0.15*length_ok, 0, 1))
+    next_score=int(100*clamp(0.5*method_ok+0.5*threshold_ok,0,1))
+    picked, top_names = chosen_pain, _top_clusters(analytics)
+
+    components={
+        "Interview Craft":craft_score,"Coverage":coverage_score,
+        "Signal Detection":detection,"Problem Statement Quality":problem,
+        "Next Test Plan":next_score}
+    score={"total":weighted_total(components),"components":components}
+    reasons={
+        "Interview Craft": f"Open {int(open_pct*100)}%, leading {int(lead_pct*100)}%, avg trust {avg_trust:.2f} (targets: ≥70% open, ≤15% leading, trust ≥0.6).",
+        "Coverage": f"Segments: {', '.join(analytics.get('seg_mix',{}).keys()) or 'none'}. Channel bias: {'high' if analytics.get('bias_flag') else 'balanced'}.",
+        "Signal Detection": f"Primary pain you chose: {picked or '—'}; top cluster(s): {', '.join(top_names) or '—'}; quantification: {'yes' if quantified else 'no'}.",
+        "Problem Statement": "Checked for specific who, triggers, and testable phrasing.",
+        "Next Test Plan": "Checked for clear method and a measurable threshold."
+    }
+    return score, reasons
+
+# Process-wide LRU of score results keyed on score_fingerprint(); reruns with
+# unchanged inputs (e.g. a download-button click) skip rescoring.
+SCORE_CACHE_SIZE = 1024
+SCORE_CACHE_STATS = {"hits": 0, "misses": 0}
+_SCORE_CACHE: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+def set_score_weights(weights: Dict[str, float]):
+    """Replace the component weights of the total (e.g. for a regrade); drops cached scores.
+    All components must be given and the weights must sum to 1, so totals stay within 0-100."""
+    unknown, missing = set(weights) - set(SCORE_WEIGHTS), set(SCORE_WEIGHTS) - set(weights)
+    if unknown:
+        raise ValueError(f"unknown score components: {', '.join(sorted(unknown))}")
+    if missing:
+        raise ValueError(f"missing score components: {', '.join(sorted(missing))}")
+    if any(w < 0 for w in weights.values()) or abs(sum(weights.values()) - 1.0) > 1e-9:
+        raise ValueError(f"score weights must be non-negative and sum to 1, not {sum(weights.values()):g}")
+    SCORE_WEIGHTS.update(weights)
+    _SCORE_CACHE.clear()
+
+def analytics_digest(analytics: Dict[str, Any]) -> bytes:
+    """Stable digest of an analytics dict. _fold_analytics replaces the dict rather than
+    editing it, so a Simulation computes this once per fold (see compute_score)."""
+    blob = json.dumps(analytics, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(blob.encode(), digest_size=16).digest()
+
+def score_fingerprint(interview: Dict[int, "Interview"], analytics_key: bytes, chosen_pain: Optional[str],
+                      problem_text: str, next_test_text: str) -> bytes:
+    """Stable digest of exactly the fields score_session reads, given analytics_digest() of the
+    analytics; hashes the raw turn codes and draft text, so a cache hit costs microseconds."""
+    h = hashlib.blake2b(analytics_key, digest_size=16)
+    items = sorted(interview.items())
+    h.update(array("q", [pid for pid, _ in items] + [len(stt.turns) for _, stt in items]).tobytes())
+    h.update(array("d", [stt.trust for _, stt in items]).tobytes())
+    h.update(b"".join([stt.turns for _, stt in items]))
+    h.update(json.dumps([chosen_pain, problem_text, next_test_text]).encode())
+    return h.digest()
+
+def score_batch(table) -> List[Dict[str, Any]]:
+    """Score many completed sessions at once; the same scores as score_session, without reasons.
+
+    `table` is columnar: it maps every name in SCORE_KEYS to a sequence with one
+    entry per session (a dict of lists or a pandas DataFrame both work).
+    Draft keywords are checked per session. Turn kinds are counted for the whole
+    batch in one pass over its turn codes, and the component formulas and weighted
+    total run once over arrays, in score_session's operation order, so the scores
+    match it exactly.
+    """
+    import numpy as np   # ships with Streamlit; imported here so importing the engine stays light
+    cols = [table[k] for k in SCORE_KEYS]
+    n = len(cols[0])
+    if not n:
+        return []
+    offsets: Dict[str, int] = {}   # segment -> start of its bank in is_open
+    is_open: List[bool] = []
+    turns, starts, owner, rows = [], [], [], []
+    for i, (interview, analytics, pain, problem, nxt) in enumerate(zip(*cols)):
+        trusts = []
+        for stt in interview.values():
+            if not stt.turns:
+                continue
+            seg = INTERVIEW_PERSONAS[stt.pid]["segment"]
+            if seg not in offsets:
+                offsets[seg] = len(is_open)
+                is_open += [q["kind"] == "open" for q in bank_index(seg).questions]
+            turns.append(stt.turns); starts.append(offsets[seg]); owner.append(i); trusts.append(stt.trust)
+        rows.append((sum(trusts)/max(1,len(trusts)),) + _coverage_inputs(analytics)
+                    + _text_checks(analytics, pain, problem, nxt))
+    lengths = [len(t) for t in turns]
+    pos = (np.frombuffer(b"".join(turns), np.uint8) >> 1) + np.repeat(np.array(starts, np.intp), lengths)
+    sess = np.repeat(np.array(owner, np.intp), lengths)
+    total_q = np.bincount(sess, minlength=n)
+    open_q = np.bincount(sess, weights=np.array(is_open, float)[pos], minlength=n)
+    lead_q = total_q - open_q
+    (avg_trust, seg_div, bias_flag, bias_score, avg_sat, aligned, quantified, who_ok, trig_ok, testable_ok,
+     evidence_ok, length_ok, method_ok, threshold_ok) = np.array(rows, dtype=float).T
+    total_q = np.maximum(1, total_q)
+    open_pct, lead_pct = open_q/total_q, lead_q/total_q
+    craft = (0.5*np.minimum(1.0, open_pct/0.7) + 0.3*np.maximum(0, 1 - np.maximum(0, (lead_pct-0.15)/0.85))
+             + 0.2*np.minimum(1.0, avg_trust/0.6))
+    seg_base = np.select([seg_div>=4, seg_div>=3, seg_div==2], [0.7, 0.5, 0.2], 0.1)
+    coverage = np.clip(seg_base + 0.3*(1 - bias_flag), 0, 1)
+    coverage = np.where(bias_score > 0.6,
+                        np.maximum(0.0, coverage * (1 - np.minimum(0.30, (bias_score - 0.6) * 0.75))), coverage)
+    coverage = np.where(avg_sat < 0.7,
+                        np.maximum(0.0, coverage * (1 - np.minimum(0.25, (0.7 - avg_sat) * 0.625))), coverage)
+    components = {
+        "Interview Craft": np.trunc(100*craft), "Coverage": np.trunc(100*coverage),
+        "Signal Detection": np.trunc(100*np.clip(0.75*aligned + 0.25*quantified, 0, 1)),
+        "Problem Statement Quality": np.trunc(100*np.clip(0.25*who_ok + 0.25*trig_ok + 0.2*testable_ok
+                                                          + 0.15*evidence_ok + 0.15*length_ok, 0, 1)),
+        "Next Test Plan": np.trunc(100*np.clip(0.5*method_ok + 0.5*threshold_ok, 0, 1))}
+    total = np.zeros(len(rows))
+    for k, w in SCORE_WEIGHTS.items():   # summed in weighted_total's order
+        total = total + w*components[k]
+    cols = {k: v.astype(int).tolist() for k, v in components.items()}
+    return [{"total": t, "components": {k: cols[k][i] for k in SCORE_WEIGHTS}}
+            for i, t in enumerate(np.trunc(total).astype(int).tolist())]
+
+# ---------- Discovery brief ----------
+_QUOTE_BASE = re.compile(r"\s*The key issue is:")
+
+def discovery_brief(S: Dict[str, Any]) -> str:
+    """Plain-text summary of a scored session, as shown and downloaded on the score page."""
+    ds = S["draft_struct"]
+    a = S.get("analytics", {})
+    seg_mix = a.get("seg_mix", {})
+    clusters = a.get("clusters", {})
+    sorted_clusters = sorted(clusters.items(), key=lambda kv: kv[1], reverse=True)
+    top_pains = ", ".join([f"{k} ({v})" for k, v in sorted_clusters[:3]]) if sorted_clusters else "None"
+
+    # Collect top quotes, deduplicating by base answer (before "The key issue is:" suffix)
+    top_quotes = []
+    seen_bases = set()
+    for _, qs in a.get("quotes", {}).items():
+        for q in qs:
+            base = _QUOTE_BASE.split(q, 1)[0].strip()
+            if base not in seen_bases:
+                seen_bases.add(base)
+                top_quotes.append(q)
+            if len(top_quotes) >= 3:
+                break
+        if len(top_quotes) >= 3:
+            break
+    quotes_text = "\n".join([f'  - "{q}"' for q in top_quotes]) if top_quotes else "  - (none captured)"
+
+    return f"""DISCOVERY BRIEF: ThermaLoop
+{'='*40}
+
+TARGET SEGMENT: {S.get('chosen_segment', '(not set)')}
+PRIMARY PAIN: {S.get('chosen_pain', '(not set)')}
+DECISION: {S.get('decision', 'Proceed')}
+
+PROBLEM HYPOTHESIS:
+{S['problem_text']}
+
+EVIDENCE SUMMARY:
+- Interviews conducted: {a.get('interviews_done', 0)}
+- Flash bursts reviewed: {a.get('flash_count', 0)}
+- Segments covered: {', '.join([f'{k} ({v})' for k, v in seg_mix.items()]) if seg_mix else 'None'}
+- Top pain clusters: {top_pains}
+- Key quotes:
+{quotes_text}
+
+NEXT TEST PLAN:
+{S['next_test_text']}
+
+STRUCTURED FIELDS:
+- Core pain: {ds.get('core_pain', '')}
+- Trigger: {ds.get('trigger', '')}
+- Impact: {ds.get('impact', '')}
+- Current workaround: {ds.get('workaround', '')}
+- Quantification: {ds.get('quantifier', '')}
+- Test method: {ds.get('next_method', '')}
+- Success threshold: {ds.get('next_target', '')}
+
+SCORE: {S['score']['total']}/100
+{'='*40}
+"""
+
+class Simulation:
+    """One learner session. `s` is the plain state dict the Streamlit pages read and write."""
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None, seed: Optional[int] = None):
+        self.s = state if state is not None else new_state()
+        if seed is not None:
+            self.s["seed"] = seed
+        self._signals: Dict[int, _Signal] = {}
+        self._saturation = (None, [])
+        self._analytics_key: Tuple[Optional[Dict[str, Any]], bytes] = (None, b"")   # (analytics dict, its digest)
+        self._rebuild_signals()
+        self.on_change: Optional[Callable[["Simulation"], None]] = None   # e.g. a store snapshot
+        self.on_event: Optional[Callable[[str, tuple], None]] = None     # e.g. an event log
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def _emit(self, kind:str, *args):
+        """Report a learner action (see events.EVENTS); replaying them rebuilds the state."""
+        if self.on_event is not None:
+            self.on_event(kind, args)
+        self._changed()
+
+    def set_stage(self, stage:str):
+        if self.s["stage"] != stage:
+            self.s["stage"] = stage
+            self._emit("stage", stage)
+
+    def set_alloc(self, channel:str, tokens:int):
+        S = self.s
+        if S["alloc"][channel] != tokens:
+            S["alloc"][channel] = tokens
+            if S["analytics"]:
+                self._fold_analytics()
+            self._emit("alloc", channel, tokens)
+
+    # ---------- Recruitment ----------
+    def book(self, need:int=6) -> List[int]:
+        S = self.s
+        S["booked_ids"] = recruit_personas(S["alloc"], need=need, seed=S.get("seed"))
+        S["interview"].clear()
+        for pid in S["booked_ids"]:
+            self.init_interview(pid)
+        S["current_idx"] = 0
+        self._signals = {}
+        self._fold_analytics()
+        self._emit("book", need)
+        return S["booked_ids"]
+
+    # ---------- Interview engine ----------
+    def init_interview(self, pid:int):
+        S = self.s
+        if pid in S["interview"]: return
+        S["interview"][pid] = Interview(pid, start_trust(INTERVIEW_PERSONAS[pid]["segment"]))
+
+    def selectable(self, pid:int)->List[Dict[str,Any]]:
+        asked=self.s["interview"][pid].asked
+        bank = bank_index(INTERVIEW_PERSONAS[pid]["segment"]).questions
+        objs=[]
+        for i in open_first_order(pid):   # open first
+            if not asked >> i & 1:
+                objs.append(bank[i])
+                if len(objs) == 5: break
+        return objs
+
+    def answer_for(self, pid:int, qkey:str)->str:
+        p = INTERVIEW_PERSONAS[pid]
+        return lookup_answer(pid, qkey, self.s["interview"][pid].trust >= p["tell_threshold"])
+
+    def ask(self, pid:int, qkey:str):
+        stt=self.s["interview"][pid]
+        p = INTERVIEW_PERSONAS[pid]
+        idx = bank_index(p["segment"])
+        pos = idx.pos[qkey]
+        kind = idx.kind[qkey]
+        # trust dynamics
+        stt.trust = clamp(stt.trust + (0.06 if kind=="open" else -0.08), 0, 1)
+        stt.turns.append(pos << 1 | (stt.trust >= p["tell_threshold"]))
+        stt.asked |= 1 << pos
+        self._apply_turn(pid, stt.turn(-1))
+        self._fold_analytics()
+        self._emit("ask", pid, qkey)
+
+    def end_interview(self, pid:int):
+        self.s["interview"][pid].ended = True
+        self._emit("end", pid)
+
+    def next_interview(self):
+        self.s["current_idx"] += 1
+        self._emit("next")
+
+    def open_flash(self, fidx:int):
+        S = self.s
+        if fidx not in S["flash_open"]:
+            S["flash_open"].append(fidx)
+            self._fold_analytics()
+            self._emit("flash", fidx)
+
+    # ---------- Synthesis ----------
+    # Analytics are kept current incrementally. Each interview carries a running
+    # signal (cluster hits and first quotes) that ask() extends
+    # by one turn; _fold_analytics() then recombines the per-interview signals,
+    # which costs O(booked × clusters) regardless of transcript length.
+    def _apply_turn(self, pid:int, turn:Turn):
+        sig = self._signals.get(pid)
+        if sig is None:
+            sig = self._signals[pid] = _Signal()
+        for c in match_clusters(turn.q + " " + turn.a):
+            sig.hits[c] = sig.hits.get(c, 0) + 1
+            qs = sig.quotes.setdefault(c, [])
+            if len(qs) < 3:
+                qs.append(turn.a)
+
+    def _saturation_weights(self, ordered_pids:List[int]) -> List[float]:
+        # Only changes when the set or order of started interviews changes.
+        key = tuple(ordered_pids)
+        if self._saturation[0] != key:
+            segment_interview_count = {seg: 0 for seg in SEGMENTS}
+            weights = []
+            for pid in ordered_pids:
+                seg = INTERVIEW_PERSONAS[pid]["segment"]
+                segment_interview_count[seg] += 1
+                n_in_seg = segment_interview_count[seg]
+                # Saturation decay: full value for first 3, then 0.8^(n-3)
+                weights.append(1.0 if n_in_seg <= 3 else 0.8 ** (n_in_seg - 3))
+            self._saturation = (key, weights)
+        return self._saturation[1]
+
+    def _rebuild_signals(self):
+        self._signals = {}
+        for pid, stt in self.s["interview"].items():
+            for turn in stt.transcript:
+                self._apply_turn(pid, turn)
+
+    def run_synthesis(self):
+        """Rebuild analytics from scratch (e.g. after loading a stored state)."""
+        self._rebuild_signals()
+        self._fold_analytics()
+        self._changed()
+
+    def _fold_analytics(self):
+        S = self.s
+        clusters = {k: 0 for k in PAIN_KEYWORDS}
+        quotes = {k: [] for k in PAIN_KEYWORDS}
+
+        # segment -> cluster counts
+        seg_cluster = {seg: {c: 0 for c in PAIN_KEYWORDS} for seg in SEGMENTS}
+
+        # interviews: aggregate with TWO multipliers:
+        #   (a) depth weight — more questions asked = deeper signal
+        #   (b) segment saturation decay — each additional interview in the same
+        #       segment yields LESS information density. After the 3rd interview
+        #       in a segment, each new interview's signal decays as 0.8^(n-3).
+        #       This is the real phenomenon: the 5th homeowner tells you very
+        #       little the first 3 didn't. Forces learners to diversify segments.
+        interviews_done = 0
+        total_questions_asked = 0
+        # Sort interview PIDs by booking order so we count in sequence per segment
+        ordered_pids = [pid for pid in S["booked_ids"] if pid in S["interview"] and S["interview"][pid].q_count > 0]
+        segment_interview_count = {seg: 0 for seg in SEGMENTS}
+        saturation_by_seg: Dict[str, float] = {}   # avg saturation per segment for display
+        for pid, saturation in zip(ordered_pids, self._saturation_weights(ordered_pids)):
+            stt = S["interview"][pid]
+            sig = self._signals.get(pid) or _NO_SIGNAL
+            interviews_done += 1
+            total_questions_asked += stt.q_count
+            seg = INTERVIEW_PERSONAS[pid]["segment"]
+            segment_interview_count[seg] += 1
+            saturation_by_seg[seg] = saturation  # latest saturation for that segment
+            # Depth weight: more questions = deeper signal
+            depth_weight = min(2.0, 1.0 + (stt.q_count - MIN_QUESTIONS_PER_INTERVIEW) * 0.25)
+            depth_weight = max(0.5, depth_weight)
+            # Effective weight = depth × saturation
+            eff_weight = depth_weight * saturation
+            for c, n in sig.hits.items():
+                # Repeated adds (not eff_weight * n) keep the rounded totals identical to a full rescan
+                for _ in range(n):
+                    clusters[c] += eff_weight
+                    seg_cluster[seg][c] += eff_weight
+            for c, qs in sig.quotes.items():
+                quotes[c].extend(qs[:3 - len(quotes[c])])
+            # Bonus: if trust was high enough to unlock material pains, count those
+            unlock = unlock_bonus(pid) if stt.trust >= INTERVIEW_PERSONAS[pid]["tell_threshold"] else ()
+            for c, v in unlock:
+                # Material-pain unlocks also decay with saturation
+                clusters[c] += v * saturation
+                seg_cluster[seg][c] += v * saturation
+
+        # Round cluster counts for display
+        clusters = {k: round(v, 1) for k, v in clusters.items()}
+        for seg in seg_cluster:
+            seg_cluster[seg] = {c: round(v, 1) for c, v in seg_cluster[seg].items()}
+
+        # flash bursts
+        flash_count = len(S["flash_open"])
+        for fidx in S["flash_open"]:
+            f = FLASH_PERSONAS[fidx]
+            for c in match_clusters(f["bio"] + " " + f["note"]):
+                clusters[c] += 1
+                if len(quotes[c]) < 3:
+                    quotes[c].append(f["note"])
+
+        # coverage & bias
+        segs = [INTERVIEW_PERSONAS[pid]["segment"] for pid in S["booked_ids"]]
+        seg_mix = {s: segs.count(s) for s in set(segs)} if segs else {}
+
+        total_alloc = sum(S["alloc"].values())
+        top_ch = max(S["alloc"], key=lambda k: S["alloc"][k]) if total_alloc > 0 else None
+        bias_flag = total_alloc > 0 and top_ch and S["alloc"][top_ch] > 0.6 * total_alloc
+
+        # Continuous sampling-bias concentration score (Herfindahl-style on channels + segments)
+        if total_alloc > 0:
+            ch_shares = [v/total_alloc for v in S["alloc"].values() if v > 0]
+            ch_hhi = sum(s*s for s in ch_shares)  # 1.0 = all one channel, low = diverse
+        else:
+            ch_hhi = 1.0
+        if seg_mix:
+            seg_total = sum(seg_mix.values())
+            seg_shares = [v/seg_total for v in seg_mix.values() if v > 0]
+            seg_hhi = sum(s*s for s in seg_shares)
+        else:
+            seg_hhi = 1.0
+        bias_score = round(0.5 * ch_hhi + 0.5 * seg_hhi, 3)  # 0=perfect diversity, 1=total concentration
+
+        # Average "last-interview saturation" across segments the learner hit.
+        # 1.0 = every segment still yielding new info; <0.5 = grinding same segment.
+        avg_saturation = (sum(saturation_by_seg.values()) / len(saturation_by_seg)
+                          if saturation_by_seg else 1.0)
+
+        S["analytics"] = {
+            "clusters": clusters,
+            "quotes": quotes,
+            "seg_mix": seg_mix,
+            "bias_flag": bias_flag,
+            "bias_score": bias_score,
+            "top_channel": top_ch,
+            "seg_cluster": seg_cluster,
+            "interviews_done": interviews_done,
+            "flash_count": flash_count,
+            "total_questions": total_questions_asked,
+            "segment_interview_count": segment_interview_count,
+            "avg_saturation": round(avg_saturation, 2),
+        }
+
+    # ---------- Scoring ----------
+    def score_key(self) -> bytes:
+        """score_fingerprint of the current scoring inputs; the analytics digest is reused until they fold again."""
+        S = self.s
+        if self._analytics_key[0] is not S["analytics"]:
+            self._analytics_key = (S["analytics"], analytics_digest(S["analytics"]))
+        return score_fingerprint(S["interview"], self._analytics_key[1], *(S[k] for k in SCORE_KEYS[2:]))
+
+    def compute_score(self):
+        S = self.s
+        inputs = [S[k] for k in SCORE_KEYS]
+        key = self.score_key()
+        cached = _SCORE_CACHE.get(key)
+        if cached is not None:
+            _SCORE_CACHE.move_to_end(key)
+            SCORE_CACHE_STATS["hits"] += 1
+        else:
+            SCORE_CACHE_STATS["misses"] += 1
+            cached = _SCORE_CACHE[key] = score_session(*inputs)
+            if len(_SCORE_CACHE) > SCORE_CACHE_SIZE:
+                _SCORE_CACHE.popitem(last=False)
+        if S["score"] != cached[0] or S["reasons"] != cached[1]:
+            S["score"], S["reasons"] = cached
+            self._changed()   # snapshot what the score page shows; unchanged reruns write nothing
+
+    # ---------- Draft ----------
+    def prefill_draft(self):
+        """Fill empty structured draft fields from the strongest cluster, once per session."""
+        S = self.s
+        if S.get("_draft_prefilled"):
+            return
+        ds = S["draft_struct"]
+        cluster_counts = S.get("analytics", {}).get("clusters", {}) or {c: 0 for c in PAIN_KEYWORDS}
+        top2 = sorted(cluster_counts.items(), key=lambda kv: kv[1], reverse=True)[:2]
+        top_cluster = top2[0][0] if top2 else "Cold room"
+        defaults = PAIN_DEFAULTS.get(top_cluster, PAIN_DEFAULTS["Cold room"])
+        if not ds.get("core_pain"):   ds["core_pain"]   = defaults["core_pain"]
+        if not ds.get("trigger"):     ds["trigger"]     = defaults["trigger"]
+        if not ds.get("impact"):      ds["impact"]      = defaults["impact"]
+        if not ds.get("workaround"):  ds["workaround"]  = "Space heater, fan, closed vents, or tolerating it"
+        if not ds.get("quantifier"):  ds["quantifier"]  = f"{sum(cluster_counts.values())} mentions across interviews; {top2[0][1] if top2 else 0} tied to this cluster"
+        if not ds.get("next_method"): ds["next_method"] = "10-person concierge pilot with ThermaLoop install"
+        if not ds.get("next_target"): ds["next_target"] = "8 of 10 report noticeable improvement within 2 weeks"
+        S["_draft_prefilled"] = True
+
+    def suggested_hypothesis(self) -> str:
+        S = self.s; ds = S["draft_struct"]
+        return (
+            f"For {S['chosen_segment'].lower()}s, {ds['core_pain']} occurs around {ds['trigger']}, causing {ds['impact']}. "
+            f"They currently {ds['workaround']}. Evidence so far: {ds['quantifier']}."
+        ).strip()
+
+    def submit_guess(self, top1:Optional[str]=None, top2:Optional[str]=None):
+        """Lock in the synthesis guesses; without arguments, the ones already in the state."""
+        S = self.s
+        if top1 is not None:
+            S["synth_guess_top1"], S["synth_guess_top2"] = top1, top2
+        S["synth_guess_submitted"] = True
+        self._emit("guess", S["synth_guess_top1"], S["synth_guess_top2"])
+
+    def redo_guess(self):
+        self.s["synth_guess_submitted"] = False
+        self._emit("redo")
+
+    def submit_draft(self, draft:Optional[Dict[str, Any]]=None):
+        """Submit the draft; without `draft`, the fields already in the state. The event carries the fields."""
+        S = self.s
+        if draft is not None:
+            S.update(json.loads(json.dumps(draft)))   # deep copy
+        S["_draft_prefilled"] = True
+        S["submitted_draft"] = True
+        self._emit("submit", {k: S[k] for k in DRAFT_KEYS})
+
+    def suggested_next_test(self) -> str:
+        S = self.s; ds = S["draft_struct"]
+        return (
+            f"Run a {ds['next_method']} targeting {S['chosen_segment'].lower()}s for 2–4 weeks. "
+            f"Success if {ds['next_target']}."
+        ).strip()
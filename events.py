@@ -0,0 +1,164 @@
+# events.py
+# Append-only log of learner actions. Replaying a session's events through the engine rebuilds its state dict.
+# Log:    SIM_EVENTS=events.jsonl streamlit run app.py   (a ".zst" path compresses with zstandard; "" disables)
+# Replay: python events.py replay events.jsonl [--sid SID]
+#
+# One JSON array per line: [sid, t, kind, *args], e.g. ["k3Jq9xYz",1718000000.213,"ask",4,"rooms"].
+# Sessions interleave freely; line order is event order within a session.
+
+import argparse
+import atexit
+import io
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from engine import Simulation
+
+EVENTS = {   # kind -> (Simulation method, argument names)
+    "start":  (None,             ("seed",)),
+    "stage":  ("set_stage",      ("stage",)),
+    "alloc":  ("set_alloc",      ("channel", "tokens")),
+    "book":   ("book",           ("need",)),
+    "ask":    ("ask",            ("pid", "qkey")),
+    "end":    ("end_interview",  ("pid",)),
+    "next":   ("next_interview", ()),
+    "flash":  ("open_flash",     ("fidx",)),
+    "guess":  ("submit_guess",   ("top1", "top2")),
+    "redo":   ("redo_guess",     ()),
+    "submit": ("submit_draft",   ("draft",)),
+}
+
+class Event(NamedTuple):
+    sid: str
+    t: float
+    kind: str
+    args: tuple
+
+# ---------- Writing ----------
+class EventLog:
+    """Thread-safe appender shared by every session in the process.
+
+    Lines are buffered and flushed every `flush_every` events and on close. With
+    zstandard each flush ends a frame, so the file stays readable after a crash.
+    A flush is one os.write on an O_APPEND descriptor, so server processes sharing
+    the file append whole batches and never split each other's lines.
+    """
+
+    def __init__(self, path: str, flush_every: int = 64):
+        self.path, self.flush_every = path, flush_every
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._buf = io.BytesIO()
+        if path.endswith(".zst"):
+            import zstandard
+            self._zstd = zstandard
+            self._w = zstandard.ZstdCompressor(level=3).stream_writer(self._buf, closefd=False)
+        else:
+            self._zstd, self._w = None, self._buf
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        atexit.register(self.close)
+
+    def append(self, sid: str, kind: str, args: tuple):
+        line = json.dumps([sid, round(time.time(), 3), kind, *args], separators=(",", ":")) + "\n"
+        with self._lock:
+            self._w.write(line.encode("utf-8"))
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        if self._zstd is not None:
+            self._w.flush(self._zstd.FLUSH_FRAME)
+        self._write_out()
+        self._unflushed = 0
+
+    def _write_out(self):
+        data = memoryview(self._buf.getvalue())
+        while data:   # one write in practice; a short write (e.g. disk full) resumes where it stopped
+            data = data[os.write(self._fd, data):]
+        self._buf.seek(0)
+        self._buf.truncate()
+
+    def flush(self):
+        with self._lock:
+            if self._unflushed:
+                self._flush()
+
+    def close(self):
+        if self._fd < 0:
+            return
+        self.flush()
+        with self._lock:
+            if self._zstd is not None:
+                self._w.close()
+                self._write_out()
+            os.close(self._fd)
+            self._fd = -1
+
+    def attach(self, sim: Simulation, sid: str, fresh: bool = True):
+        """Log `sim`'s actions under `sid`; a fresh session starts with a start event."""
+        sim.on_event = lambda kind, args: self.append(sid, kind, args)
+        if fresh:
+            self.append(sid, "start", (sim.s["seed"],))
+
+# ---------- Reading and replay ----------
+def read_events(path: str) -> Iterator[Event]:
+    with open(path, "rb") as raw:
+        if path.endswith(".zst"):
+            import zstandard
+            raw = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        lines = io.TextIOWrapper(raw, encoding="utf-8")
+        for line in lines:
+            try:
+                sid, t, kind, *args = json.loads(line)
+            except ValueError:
+                if line.endswith("\n"):
+                    raise
+                return   # a write cut off by a crash
+            yield Event(sid, t, kind, tuple(args))
+
+def apply_event(sim: Simulation, ev: Event):
+    method, _ = EVENTS[ev.kind]
+    getattr(sim, method)(*ev.args)
+
+def replay(events: Iterable[Event], sid: Optional[str] = None, score: bool = True) -> Dict[str, Simulation]:
+    """Fold events into one Simulation per session (or only `sid`); scores submitted drafts."""
+    sims: Dict[str, Simulation] = {}
+    for ev in events:
+        if sid is not None and ev.sid != sid:
+            continue
+        if ev.kind == "start":
+            sims[ev.sid] = Simulation(seed=ev.args[0])   # a restart replaces the session
+            continue
+        sim = sims.get(ev.sid)
+        if sim is None:
+            sim = sims[ev.sid] = Simulation()   # the log began mid-session
+        apply_event(sim, ev)
+    if score:
+        for sim in sims.values():
+            if sim.s["submitted_draft"]:
+                sim.compute_score()
+    return sims
+
+def _summary(sid: str, sim: Simulation) -> Dict[str, Any]:
+    S = sim.s
+    return {"sid": sid, "stage": S["stage"], "booked": len(S["booked_ids"]),
+            "questions": sum(stt.q_count for stt in S["interview"].values()),
+            "submitted": S["submitted_draft"], "total": S["score"]["total"] if S["score"] else None}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Event log utilities.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("replay", help="rebuild sessions from a log and print one JSON summary per session")
+    r.add_argument("log")
+    r.add_argument("--sid", default=None)
+    r.add_argument("--state", action="store_true", help="print the full state dict instead of a summary")
+    args = ap.parse_args()
+    from engine import dump_state
+    for sid, sim in replay(read_events(args.log), sid=args.sid).items():
+        line = f'{{"sid":{json.dumps(sid)},"state":{dump_state(sim.s)}}}' if args.state else json.dumps(_summary(sid, sim))
+        sys.stdout.write(line + "\n")
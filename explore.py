@@ -0,0 +1,185 @@
+# explore.py
+# Monte Carlo policy explorer: score landscape over recruitment allocations x questioning policies.
+# Run: python explore.py --out landscape.csv [--sample 500] [--policies open_first,minimum] [--workers 8]
+
+import argparse
+import csv
+import itertools
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+from engine import CHANNELS, EFFORT_TOKENS, FLASH_PERSONAS, MIN_QUESTIONS_PER_INTERVIEW, Simulation
+from solver import solve_persona
+
+MAX_PER_CHANNEL = 5
+
+# ---------- Scripted questioning policies ----------
+# Each policy asks questions in one booked interview. selectable() lists open questions first.
+def policy_open_first(sim: Simulation, pid: int, rng: random.Random):
+    for _ in range(8):
+        opts = [q for q in sim.selectable(pid) if q["kind"] == "open"]
+        if not opts: break
+        sim.ask(pid, opts[0]["key"])
+
+def policy_minimum(sim: Simulation, pid: int, rng: random.Random):
+    for _ in range(MIN_QUESTIONS_PER_INTERVIEW):
+        q = sim.selectable(pid)[0]
+        sim.ask(pid, q["key"])
+
+def policy_leading_first(sim: Simulation, pid: int, rng: random.Random):
+    for _ in range(6):
+        opts = sim.selectable(pid)
+        if not opts: break
+        q = next((q for q in opts if q["kind"] == "leading"), opts[0])
+        sim.ask(pid, q["key"])
+
+def policy_random(sim: Simulation, pid: int, rng: random.Random):
+    for _ in range(rng.randint(MIN_QUESTIONS_PER_INTERVIEW, 8)):
+        opts = sim.selectable(pid)
+        if not opts: break
+        q = rng.choice(opts)
+        sim.ask(pid, q["key"])
+
+def policy_expert(sim: Simulation, pid: int, rng: random.Random):
+    for key in solve_persona(pid).keys:
+        sim.ask(pid, key)
+
+def policy_exhaustive(sim: Simulation, pid: int, rng: random.Random):
+    while True:
+        opts = sim.selectable(pid)
+        if not opts: break
+        sim.ask(pid, opts[0]["key"])
+
+POLICIES = {
+    "open_first": policy_open_first,
+    "minimum": policy_minimum,
+    "leading_first": policy_leading_first,
+    "random": policy_random,
+    "exhaustive": policy_exhaustive,
+    "expert": policy_expert,
+}
+
+# ---------- Strategy space ----------
+def allocations() -> List[Tuple[int, ...]]:
+    """Every token vector over CHANNELS with at most MAX_PER_CHANNEL each and 1..EFFORT_TOKENS in total."""
+    return [v for v in itertools.product(range(MAX_PER_CHANNEL + 1), repeat=len(CHANNELS))
+            if 0 < sum(v) <= EFFORT_TOKENS]
+
+def run_strategy(job: Tuple[Tuple[int, ...], str, int, int]) -> Dict[str, Any]:
+    """Play one headless session end to end and return a flat result row."""
+    alloc, policy, flash, seed = job
+    rng = random.Random(seed)
+    sim = Simulation(seed=seed)
+    S = sim.s
+    for ch, tokens in zip(CHANNELS, alloc):
+        sim.set_alloc(ch, tokens)
+    sim.book(need=6)
+    for pid in S["booked_ids"]:
+        POLICIES[policy](sim, pid, rng)
+        sim.end_interview(pid)
+    for fidx in rng.sample(range(len(FLASH_PERSONAS)), flash):
+        sim.open_flash(fidx)
+
+    # Draft like a learner who follows the data: biggest segment, strongest cluster, suggested text.
+    a = S["analytics"]
+    seg_mix = a.get("seg_mix", {})
+    S["chosen_segment"] = max(seg_mix, key=seg_mix.get) if seg_mix else "Homeowner"
+    S["chosen_pain"] = max(a["clusters"], key=a["clusters"].get)
+    sim.prefill_draft()
+    S["problem_text"] = sim.suggested_hypothesis()
+    S["next_test_text"] = sim.suggested_next_test()
+    S["submitted_draft"] = True
+    sim.compute_score()
+
+    row: Dict[str, Any] = dict(zip(CHANNELS, alloc))
+    row.update({
+        "policy": policy,
+        "seed": seed,
+        "booked": len(S["booked_ids"]),
+        "segments": len(seg_mix),
+        "bias_score": a["bias_score"],
+        "avg_saturation": a["avg_saturation"],
+        "total": S["score"]["total"],
+    })
+    row.update(S["score"]["components"])
+    return row
+
+# ---------- Output ----------
+class CsvSink:
+    def __init__(self, path: str):
+        self.f = open(path, "w", newline="") if path != "-" else sys.stdout
+        self.w = None
+
+    def write(self, row: Dict[str, Any]):
+        if self.w is None:
+            self.w = csv.DictWriter(self.f, fieldnames=list(row))
+            self.w.writeheader()
+        self.w.writerow(row)
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+class ParquetSink:
+    """Buffers rows and writes one Parquet row group per `batch` rows (needs pyarrow)."""
+
+    def __init__(self, path: str, batch: int = 5000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.path, self.batch = path, batch
+        self.rows: List[Dict[str, Any]] = []
+        self.writer = None
+
+    def write(self, row: Dict[str, Any]):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch:
+            self._flush()
+
+    def _flush(self):
+        if not self.rows: return
+        table = self.pa.Table.from_pylist(self.rows)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Map the score landscape over allocations and questioning policies.")
+    ap.add_argument("--out", default="-", help="output path (.csv or .parquet); '-' writes CSV to stdout")
+    ap.add_argument("--policies", default=",".join(POLICIES), help="comma-separated subset of: " + ", ".join(POLICIES))
+    ap.add_argument("--sample", type=int, default=0, help="sample this many strategies instead of enumerating all")
+    ap.add_argument("--flash", type=int, default=3, help="flash profiles opened per session (0-5)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--chunksize", type=int, default=64)
+    args = ap.parse_args(argv)
+
+    policies = [p for p in args.policies.split(",") if p]
+    unknown = [p for p in policies if p not in POLICIES]
+    if unknown:
+        ap.error(f"unknown policies: {', '.join(unknown)}")
+    strategies = list(itertools.product(allocations(), policies))
+    rng = random.Random(args.seed)
+    if args.sample and args.sample < len(strategies):
+        strategies = rng.sample(strategies, args.sample)
+    jobs = [(alloc, policy, min(5, max(0, args.flash)), rng.randrange(2**32)) for alloc, policy in strategies]
+
+    sink = ParquetSink(args.out) if args.out.endswith(".parquet") else CsvSink(args.out)
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for row in pool.map(run_strategy, jobs, chunksize=args.chunksize):
+                sink.write(row)
+    finally:
+        sink.close()
+    print(f"{len(jobs)} sessions", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# loadtest.py
+# Drive N simulated learners through the whole app concurrently with Streamlit's AppTest (no browser, no network).
+# Run: python loadtest.py --learners 30 [--processes 4] [--policy open_first] [--think 2] [--ramp 10]
+#
+# Each learner is one AppTest session walking intro -> target -> live -> flash ->
+# synth -> draft -> score with a scripted questioning policy.
+#
+# AppTest swaps a process-global Runtime on every run, so sessions in one process
+# cannot run on parallel threads. Instead each process is one "server": a scheduler
+# interleaves its learners click by click, as one interpreter's GIL would, and
+# --processes runs several servers side by side. Every click is charged to the
+# stage it was made on, twice:
+#   service:  the script run itself
+#   response: service plus the time the click queued behind other learners' runs
+# Response time is what a learner feels; it grows as one server takes more learners.
+
+import argparse
+import heapq
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+from engine import CHANNELS, EFFORT_TOKENS, MIN_QUESTIONS_PER_INTERVIEW
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+STAGES = ("intro", "target", "live", "flash", "synth", "draft", "score")
+
+# ---------- Scripted policies ----------
+# A policy picks the next question button from those on screen, or None to end the
+# interview (only honoured once MIN_QUESTIONS_PER_INTERVIEW have been asked).
+def _is_leading(button) -> bool:
+    return button.label.startswith("⚠")
+
+def pick_open_first(opts, asked: int, rng: random.Random):
+    if asked >= 6:
+        return None
+    open_ = [b for b in opts if not _is_leading(b)]
+    return (open_ or opts)[0]
+
+def pick_minimum(opts, asked: int, rng: random.Random):
+    return opts[0] if asked < MIN_QUESTIONS_PER_INTERVIEW else None
+
+def pick_leading_first(opts, asked: int, rng: random.Random):
+    if asked >= 6:
+        return None
+    return next((b for b in opts if _is_leading(b)), opts[0])
+
+def pick_random(opts, asked: int, rng: random.Random):
+    if asked >= MIN_QUESTIONS_PER_INTERVIEW and rng.random() < 0.3:
+        return None
+    return rng.choice(opts)
+
+def pick_exhaustive(opts, asked: int, rng: random.Random):
+    return opts[0]
+
+POLICIES = {
+    "open_first": pick_open_first,
+    "minimum": pick_minimum,
+    "leading_first": pick_leading_first,
+    "random": pick_random,
+    "exhaustive": pick_exhaustive,
+}
+
+# ---------- One learner ----------
+Step = Tuple[str, float]   # (stage clicked on, seconds the script run took)
+
+class Learner:
+    def __init__(self, n: int, policy: str, seed: int, timeout: float):
+        from streamlit.testing.v1 import AppTest
+        from store import new_sid
+        self.n = n
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.at.query_params["sid"] = new_sid()
+        self.pick = POLICIES[policy]
+        self.rng = random.Random(seed * 7919 + n)
+
+    def _run(self, stage: str) -> Step:
+        t = time.perf_counter()
+        self.at.run()
+        step = (stage, time.perf_counter() - t)
+        if self.at.exception:
+            raise RuntimeError(f"{stage}: {self.at.exception[0].message}")
+        return step
+
+    def _click(self, stage: str, label: str) -> Step:
+        for b in self.at.button:
+            if b.label == label:
+                b.click()
+                return self._run(stage)
+        raise RuntimeError(f"no {label!r} button on {stage}; have {[b.label for b in self.at.button]}")
+
+    def _asked(self) -> int:
+        S = self.at.session_state["sim"].s
+        return S["interview"][S["booked_ids"][S["current_idx"]]].q_count
+
+    def play(self) -> Iterator[Step]:
+        """The learner's whole session, yielding after every script run."""
+        at = self.at
+        yield self._run("intro")
+        yield self._click("intro", "Start simulation")
+
+        alloc = [0] * len(CHANNELS)
+        for _ in range(EFFORT_TOKENS):
+            i = self.rng.randrange(len(CHANNELS))
+            alloc[i] = min(5, alloc[i] + 1)
+        for ni, v in zip(at.number_input, alloc):
+            ni.set_value(v)
+        yield self._run("target")
+        yield self._click("target", "Book personas")
+
+        while True:
+            labels = {b.label for b in at.button}
+            if "Go to Flash Bursts" in labels:
+                yield self._click("live", "Go to Flash Bursts")
+                break
+            if "Next interview" in labels:
+                yield self._click("live", "Next interview")
+                continue
+            opts = [b for b in at.button if b.key and b.key.startswith("q_")]
+            choice = self.pick(opts, self._asked(), self.rng) if opts else None
+            if choice is None and "Thank and end interview" in labels:
+                yield self._click("live", "Thank and end interview")
+                continue
+            if choice is None:
+                choice = opts[0]   # below the minimum the learner has to keep asking
+            choice.click()
+            yield self._run("live")
+
+        for _ in range(3):
+            opens = [b for b in at.button if b.label == "Open"]
+            if not opens:
+                break
+            opens[0].click()
+            yield self._run("flash")
+        yield self._click("flash", "Run synthesis")
+        yield self._click("synth", "Lock in my guesses and show data")
+        yield self._click("synth", "Next: Decide & draft")
+        yield self._click("draft", "Submit")   # lands on the score page
+        yield self._run("score")
+
+# ---------- One server process ----------
+def _share_script_cache():
+    # AppTest compiles app.py afresh on every run; a real server compiles it once per process.
+    # ScriptCache is private to AppTest, so only share it where it still looks the way we expect;
+    # elsewhere service times just include the compile.
+    import streamlit.testing.v1.app_test as app_test
+    cls = getattr(app_test, "ScriptCache", None)
+    if not (isinstance(cls, type) and callable(getattr(cls, "get_bytecode", None))):
+        print("loadtest: AppTest.ScriptCache not found; app.py is recompiled on every click", file=sys.stderr)
+        return
+    cache = cls()
+    app_test.ScriptCache = lambda: cache
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss   # peak, where /proc is missing
+
+def run_server(job: Tuple[List[int], str, int, float, float, float]) -> Dict[str, Any]:
+    """Interleave learners `ids` click by click in this process; returns raw timings and RSS."""
+    ids, policy, seed, think, ramp, timeout = job
+    _share_script_cache()
+    # Walk one throwaway learner to the score page first, so the deferred chart imports and
+    # every page's first run are paid before timing starts and RSS growth is per learner.
+    for _ in Learner(-1, policy, seed, timeout).play():
+        pass
+    rss_start = rss_peak = _rss_kb()
+
+    t0 = time.perf_counter()
+    # (ready at, learner no., steps): whoever has been ready longest clicks next
+    queue = [(t0 + ramp * k / max(1, len(ids)), n, Learner(n, policy, seed, timeout).play())
+             for k, n in enumerate(ids)]
+    heapq.heapify(queue)
+    clicks, errors, done = [], [], 0
+    while queue:
+        ready, n, steps = heapq.heappop(queue)
+        now = time.perf_counter()
+        if ready > now:
+            time.sleep(ready - now)
+            now = ready
+        try:
+            stage, service = next(steps)
+        except StopIteration:
+            done += 1
+            continue
+        except Exception as e:   # report and keep the other learners going
+            errors.append(f"learner {n}: {type(e).__name__}: {e}")
+            continue
+        clicks.append((stage, service, now - ready + service))
+        rss_peak = max(rss_peak, _rss_kb())
+        heapq.heappush(queue, (time.perf_counter() + think, n, steps))
+    return {"clicks": clicks, "errors": errors, "wall": time.perf_counter() - t0, "learners": done,
+            "rss_start_kb": rss_start, "rss_peak_kb": rss_peak, "rss_end_kb": _rss_kb()}
+
+# ---------- Report ----------
+def _pct(xs: List[float], q: float) -> float:
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+def report(parts: List[Dict[str, Any]], learners: int) -> Dict[str, Any]:
+    by_stage: Dict[str, Tuple[List[float], List[float]]] = {s: ([], []) for s in STAGES}
+    for p in parts:
+        for stage, service, response in p["clicks"]:
+            by_stage[stage][0].append(service)
+            by_stage[stage][1].append(response)
+    wall = max(p["wall"] for p in parts)
+    completed = sum(p["learners"] for p in parts)
+    n_clicks = sum(len(p["clicks"]) for p in parts)
+    out = {"learners": learners, "completed": completed, "processes": len(parts), "wall_s": round(wall, 2),
+           "clicks_per_s": round(n_clicks / wall, 2), "learners_per_min": round(60 * completed / wall, 2),
+           "stages": {}, "rss": [], "errors": [e for p in parts for e in p["errors"]]}
+    print(f"{'':<8}{'':>7}{'service ms':>24}{'response ms':>32}")
+    print(f"{'stage':<8}{'clicks':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for stage, (service, response) in by_stage.items():
+        if not service:
+            continue
+        service.sort()
+        response.sort()
+        row = {"clicks": len(service)}
+        for name, xs in (("service", service), ("response", response)):
+            for q in (50, 95, 99):
+                row[f"{name}_p{q}_ms"] = round(1e3 * _pct(xs, q / 100), 1)
+        row["response_max_ms"] = round(1e3 * response[-1], 1)
+        out["stages"][stage] = row
+        print(f"{stage:<8}" + "".join(f"{v:>8.0f}" if k != "clicks" else f"{v:>7}" for k, v in row.items()))
+    print(f"{completed}/{learners} learners on {len(parts)} process(es) in {wall:.1f}s: "
+          f"{out['clicks_per_s']} clicks/s, {out['learners_per_min']} learners/min")
+    for i, p in enumerate(parts):
+        growth = p["rss_end_kb"] - p["rss_start_kb"]
+        out["rss"].append({k: p[k] for k in ("rss_start_kb", "rss_peak_kb", "rss_end_kb")})
+        print(f"process {i}: RSS {p['rss_start_kb'] / 1024:.0f} -> peak {p['rss_peak_kb'] / 1024:.0f} -> "
+              f"end {p['rss_end_kb'] / 1024:.0f} MB ({growth / max(1, p['learners']):.0f} KB per learner)")
+    for e in out["errors"]:
+        print("ERROR " + e, file=sys.stderr)
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Concurrent learner load test over AppTest sessions.")
+    ap.add_argument("--learners", type=int, default=20)
+    ap.add_argument("--processes", type=int, default=1, help="server processes; learners are dealt out evenly")
+    ap.add_argument("--policy", default="open_first", choices=sorted(POLICIES))
+    ap.add_argument("--think", type=float, default=0.0, help="seconds a learner waits between clicks")
+    ap.add_argument("--ramp", type=float, default=0.0, help="spread learner start times over this many seconds")
+    ap.add_argument("--timeout", type=float, default=60.0, help="per script run")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default="", help="also write the report to this path")
+    args = ap.parse_args(argv)
+
+    # keep the run's snapshots and events out of the working directory unless asked for
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.setdefault("SIM_STORE", os.path.join(tmp.name, "sessions.sqlite"))
+    os.environ.setdefault("SIM_EVENTS", "")
+
+    procs = max(1, min(args.processes, args.learners))
+    jobs = [(list(range(i, args.learners, procs)), args.policy, args.seed, args.think, args.ramp, args.timeout)
+            for i in range(procs)]
+    if procs == 1:
+        parts = [run_server(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=procs) as pool:
+            parts = list(pool.map(run_server, jobs))
+    out = report(parts, args.learners)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(out, f, indent=1)
+    tmp.cleanup()
+    return 1 if out["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
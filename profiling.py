@@ -0,0 +1,183 @@
+# profiling.py
+# Opt-in timers and counters for the app's hot paths.
+# Enable for the process: SIM_PROFILE=1 streamlit run app.py
+# Sidebar panel:          add ?debug=1 to a session's URL (only in a process started with SIM_PROFILE;
+#                         it shows the whole process's timings, not just that session's)
+# Metrics file:           SIM_PROFILE_FILE=metrics.prom   (Prometheus text format, rewritten at most every 5 s)
+#
+# Each server process writes its own file, with its pid in the name (metrics.<pid>.prom)
+# and on every series (pid="..."), so processes never overwrite each other; point
+# node_exporter's textfile collector at the directory. A process removes its file on exit.
+#
+# While disabled, span() hands back one shared no-op context manager and no engine
+# method is wrapped, so instrumented call sites cost about one extra function call.
+
+import atexit
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Dict, List, Optional
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)   # seconds
+
+class _Timing:
+    __slots__ = ("count", "total", "max", "last", "buckets")
+
+    def __init__(self):
+        self.count, self.total, self.max, self.last = 0, 0.0, 0.0, 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)   # last slot is +Inf
+
+class Registry:
+    """Process-wide timings and counters; shared by every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings: Dict[str, _Timing] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            t = self.timings.get(name)
+            if t is None:
+                t = self.timings[name] = _Timing()
+            t.count += 1
+            t.total += seconds
+            t.last = seconds
+            if seconds > t.max:
+                t.max = seconds
+            t.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def inc(self, name: str, by: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + by
+
+    def rows(self) -> List[Dict[str, float]]:
+        """One row per timer, slowest total first, for the sidebar panel."""
+        with self._lock:
+            rows = [{"span": name, "calls": t.count, "mean ms": 1e3 * t.total / t.count, "p95 ms": 1e3 * _quantile(t, 0.95),
+                     "max ms": 1e3 * t.max, "last ms": 1e3 * t.last, "total s": t.total}
+                    for name, t in self.timings.items()]
+        return sorted(rows, key=lambda r: r["total s"], reverse=True)
+
+    def prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        pid = f'pid="{os.getpid()}"'
+        lines = ["# HELP sim_span_seconds Time spent in instrumented pages, engine calls and script runs.",
+                 "# TYPE sim_span_seconds histogram"]
+        with self._lock:
+            for name, t in sorted(self.timings.items()):
+                cum = 0
+                for le, n in zip(BUCKETS + ("+Inf",), t.buckets):
+                    cum += n
+                    lines.append(f'sim_span_seconds_bucket{{{pid},span="{name}",le="{le}"}} {cum}')
+                lines.append(f'sim_span_seconds_sum{{{pid},span="{name}"}} {t.total:.6f}')
+                lines.append(f'sim_span_seconds_count{{{pid},span="{name}"}} {t.count}')
+            lines += ["# HELP sim_events_total Counted events (reruns, interrupted runs, ...).",
+                      "# TYPE sim_events_total counter"]
+            lines += [f'sim_events_total{{{pid},event="{k}"}} {v:g}' for k, v in sorted(self.counters.items())]
+        for k, v in sorted((gauges or {}).items()):
+            lines += [f"# TYPE sim_{k} gauge", f"sim_{k}{{{pid}}} {v:g}"]
+        return "\n".join(lines) + "\n"
+
+def _quantile(t: _Timing, q: float) -> float:
+    """Upper bucket bound holding the q-quantile (the max when it falls in +Inf)."""
+    need, cum = q * t.count, 0
+    for le, n in zip(BUCKETS, t.buckets):
+        cum += n
+        if cum >= need:
+            return min(le, t.max)
+    return t.max
+
+REGISTRY = Registry()
+_enabled = bool(os.environ.get("SIM_PROFILE"))
+_targets: List[tuple] = []
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        REGISTRY.observe(self.name, time.perf_counter() - self.t0)
+        if exc_type is not None:
+            # st.rerun() and st.stop() end a run by raising; count them by exception type
+            REGISTRY.inc(f"{self.name}:{exc_type.__name__}")
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): return False
+
+_NULL = _NullSpan()
+
+def enabled() -> bool:
+    return _enabled
+
+def enable():
+    """Start collecting in this process (e.g. from a script; the app relies on SIM_PROFILE)."""
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        for cls, names in _targets:
+            _patch(cls, names)
+
+def span(name: str):
+    return _Span(name) if _enabled else _NULL
+
+def instrument(cls, *names: str):
+    """Time the named methods of `cls` as "Class.method" spans once profiling is enabled. Idempotent."""
+    if (cls, names) not in _targets:
+        _targets.append((cls, names))
+        if _enabled:
+            _patch(cls, names)
+
+def timed(name: str):
+    """Decorator: time every call as span `name` while profiling is enabled."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def _patch(cls, names):
+    for name in names:
+        fn = getattr(cls, name)
+        if not getattr(fn, "_profiled", False):
+            wrapper = timed(f"{cls.__name__}.{name}")(fn)
+            wrapper._profiled = True
+            setattr(cls, name, wrapper)
+
+_last_write = [0.0]
+
+def metrics_path(path: Optional[str] = None) -> str:
+    """This process's metrics file: SIM_PROFILE_FILE (or `path`) with the pid before the suffix."""
+    root, ext = os.path.splitext(path or os.environ.get("SIM_PROFILE_FILE", "metrics.prom"))
+    return f"{root}.{os.getpid()}{ext}"
+
+def _remove_metrics(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def write_metrics(gauges: Optional[Dict[str, float]] = None, path: Optional[str] = None, every: float = 5.0):
+    """Rewrite this process's Prometheus text file, at most once per `every` seconds."""
+    now = time.monotonic()
+    if not _enabled or now - _last_write[0] < every:
+        return
+    path = metrics_path(path)
+    if not _last_write[0]:
+        atexit.register(_remove_metrics, path)   # a dead process's series should not linger
+    _last_write[0] = now
+    with open(path + ".tmp", "w") as f:
+        f.write(REGISTRY.prometheus(gauges))
+    os.replace(path + ".tmp", path)
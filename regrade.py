@@ -0,0 +1,132 @@
+# regrade.py
+# Rescore every submitted session in a store, e.g. after changing the score weights.
+# Run: python regrade.py --out regrade.csv [--store sessions.sqlite] [--weights '{"Coverage":0.2,...}'] [--workers 8]
+#   (--weights gives all five components, summing to 1; sessions stored without a
+#   score get blank old_total and delta)
+#
+# Sessions are read in sid order, `--chunk` at a time, and at most `--inflight`
+# chunks are queued on the pool, so memory stays flat however large the cohort.
+# After every chunk the CSV is flushed and OUT.ckpt records the last sid and the
+# CSV size; rerunning the same command resumes from there.
+
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import engine
+from engine import SCORE_WEIGHTS, Simulation, load_state
+from store import open_store
+
+# Weights used when --weights is not given
+BASELINE_WEIGHTS = dict(SCORE_WEIGHTS)
+FIELDS = ["sid", "old_total", "new_total", "delta"] + list(SCORE_WEIGHTS)
+
+def _init_worker(weights: Dict[str, float]):
+    engine.set_score_weights(weights)
+
+def regrade_chunk(rows: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Rebuild analytics and rescore each submitted session in `rows` (sid, stored state)."""
+    out = []
+    for sid, text in rows:
+        state = load_state(text)
+        if not state["submitted_draft"]:
+            continue
+        old = state["score"]
+        sim = Simulation(state)
+        sim.run_synthesis()
+        sim.compute_score()
+        new = state["score"]
+        if old:
+            row = {"sid": sid, "old_total": old["total"], "new_total": new["total"], "delta": new["total"] - old["total"]}
+        else:   # never scored: nothing to compare against
+            row = {"sid": sid, "old_total": "", "new_total": new["total"], "delta": ""}
+        row.update(new["components"])
+        out.append(row)
+    return out
+
+# ---------- Checkpoint ----------
+def read_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_checkpoint(path: str, ckpt: Dict[str, Any]):
+    with open(path + ".tmp", "w") as f:
+        json.dump(ckpt, f)
+    os.replace(path + ".tmp", path)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Rescore stored sessions and write new scores and diffs.")
+    ap.add_argument("--out", required=True, help="CSV of sid, old/new totals, delta and new components")
+    ap.add_argument("--store", default=None, help="session store (default: SIM_STORE or sessions.sqlite)")
+    ap.add_argument("--weights", default=None, help="JSON object of all component weights, or @file.json")
+    ap.add_argument("--chunk", type=int, default=500, help="sessions per task")
+    ap.add_argument("--inflight", type=int, default=0, help="max queued chunks (default: 2 x workers)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = ap.parse_args(argv)
+
+    spec = args.weights or json.dumps(BASELINE_WEIGHTS)
+    if spec.startswith("@"):
+        with open(spec[1:]) as f:
+            spec = f.read()
+    weights = json.loads(spec)
+    try:
+        engine.set_score_weights(weights)   # validate before starting the pool
+    except ValueError as e:
+        ap.error(str(e))
+
+    store = open_store(args.store)
+    ckpt_path = args.out + ".ckpt"
+    ckpt = None if args.restart else read_checkpoint(ckpt_path)
+    if ckpt and ckpt.get("weights") != weights:
+        sys.exit(f"{ckpt_path} was written with other weights; pass --restart to start over")
+    if ckpt:
+        f = open(args.out, "r+", newline="")
+        f.truncate(ckpt["offset"])   # drop rows written after the last checkpoint
+        f.seek(ckpt["offset"])
+        print(f"resuming after {ckpt['sid']!r} ({ckpt['rows']} rows)", file=sys.stderr)
+    else:
+        f = open(args.out, "w", newline="")
+        ckpt = {"weights": weights, "sid": "", "rows": 0, "changed": 0, "offset": 0}
+    w = csv.DictWriter(f, fieldnames=FIELDS)
+    if not ckpt["offset"]:
+        w.writeheader()
+
+    workers = args.workers or os.cpu_count() or 1
+    inflight = deque()
+    def drain_one():
+        last_sid, fut = inflight.popleft()
+        rows = fut.result()
+        w.writerows(rows)
+        f.flush()
+        ckpt.update(sid=last_sid, rows=ckpt["rows"] + len(rows),
+                    changed=ckpt["changed"] + sum(1 for r in rows if r["delta"]), offset=f.tell())
+        write_checkpoint(ckpt_path, ckpt)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(weights,)) as pool:
+            after = ckpt["sid"]
+            while True:
+                rows = store.scan(after, args.chunk)
+                if not rows:
+                    break
+                after = rows[-1][0]
+                inflight.append((after, pool.submit(regrade_chunk, rows)))
+                if len(inflight) >= (args.inflight or 2 * workers):
+                    drain_one()   # results are written in sid order, so the checkpoint is a prefix
+            while inflight:
+                drain_one()
+    finally:
+        f.close()
+    print(f"{ckpt['rows']} sessions rescored, {ckpt['changed']} changed total", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
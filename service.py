@@ -0,0 +1,440 @@
+# service.py
+# Local HTTP scoring service for sessions collected outside the Streamlit app (e.g. by an LMS).
+# Serve: python service.py serve [--port 8077] [--window 0.005] [--max-batch 256] [--workers 4]
+# Bench: python service.py bench [--windows 0,0.002,0.005,0.02] [--clients 64] [--requests 2000]
+#
+#   POST /score       one session snapshot (JSON as written by dump_state) -> {"total", "components"}
+#   POST /synthesize  one session snapshot -> {"analytics"}
+#   POST /bulk        NDJSON stream of snapshots (Content-Length or chunked) -> NDJSON of scores, same order
+#   GET  /health      request and batch counters
+#
+# Stdlib only: asyncio streams with HTTP/1.1 keep-alive. Requests arriving within
+# `window` seconds of each other are handed to a process pool as one task, which
+# rebuilds their analytics and scores them with a single score_batch call; the
+# event loop itself never does CPU work.
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from engine import SCORE_KEYS, Simulation, load_state, score_batch
+
+MAX_BODY = 4 << 20       # bytes per /score or /synthesize request
+MAX_LINE = 4 << 20       # bytes per /bulk line
+BULK_INFLIGHT = 1024     # lines of one /bulk stream waiting on results
+
+# ---------- Pool work ----------
+# Each takes a batch of snapshots and returns one JSON-able result per snapshot,
+# {"error": ...} for those that fail, so one bad submission does not sink its batch.
+def _synthesized(text) -> Dict[str, Any]:
+    sim = Simulation(load_state(text))
+    sim.run_synthesis()
+    return sim.s
+
+def _error(e: Exception) -> Dict[str, str]:
+    return {"error": f"{type(e).__name__}: {e}"}
+
+def synthesize_many(texts: List[bytes]) -> List[Dict[str, Any]]:
+    out = []
+    for text in texts:
+        try:
+            out.append({"analytics": _synthesized(text)["analytics"]})
+        except Exception as e:
+            out.append(_error(e))
+    return out
+
+def score_many(texts: List[bytes]) -> List[Dict[str, Any]]:
+    out: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+    table: Dict[str, list] = {k: [] for k in SCORE_KEYS}
+    ok = []
+    for i, text in enumerate(texts):
+        try:
+            S = _synthesized(text)
+        except Exception as e:
+            out[i] = _error(e)
+            continue
+        ok.append(i)
+        for k in SCORE_KEYS:
+            table[k].append(S[k])
+    try:
+        scores = score_batch(table)
+    except Exception:
+        # a malformed score field (e.g. "problem_text": null) fails the whole batch; score rows alone to find it
+        scores = []
+        for j in range(len(ok)):
+            try:
+                scores.append(score_batch({k: table[k][j:j+1] for k in SCORE_KEYS})[0])
+            except Exception as e:
+                scores.append(_error(e))
+    for i, score in zip(ok, scores):
+        out[i] = score
+    return out
+
+# ---------- Micro-batching ----------
+class Batcher:
+    """Collects concurrent submissions for up to `window` seconds and runs them as one pool task."""
+
+    def __init__(self, pool, fn: Callable[[list], list], window: float = 0.005, max_batch: int = 256):
+        self.pool, self.fn, self.window, self.max_batch = pool, fn, window, max_batch
+        self.stats = {"requests": 0, "batches": 0}
+        self._items: list = []
+        self._futs: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, item) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._items.append(item)
+        self._futs.append(fut)
+        self.stats["requests"] += 1
+        if len(self._items) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            # window 0 still batches whatever arrives before the loop comes round again
+            self._timer = loop.call_later(self.window, self._flush) if self.window else loop.call_soon(self._flush)
+        return fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futs = self._items, self._futs
+        if not items:
+            return
+        self._items, self._futs = [], []
+        self.stats["batches"] += 1
+        try:
+            task = asyncio.get_running_loop().run_in_executor(self.pool, self.fn, items)
+        except Exception as e:   # a broken or shut-down pool refuses work; fail this batch, don't strand it
+            task = asyncio.get_running_loop().create_future()
+            task.set_exception(e)
+        task.add_done_callback(lambda t: self._resolve(t, futs))
+
+    @staticmethod
+    def _resolve(task: asyncio.Future, futs: List[asyncio.Future]):
+        exc = task.exception()
+        for i, fut in enumerate(futs):
+            if not fut.done():   # skip callers that went away
+                if exc is not None:
+                    fut.set_exception(exc)
+                else:
+                    fut.set_result(task.result()[i])
+
+# ---------- HTTP ----------
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+async def _body_chunks(reader: asyncio.StreamReader, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while (await reader.readline()).strip():   # trailers
+                    pass
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+    else:
+        left = int(headers.get("content-length", 0))
+        while left:
+            chunk = await reader.read(min(left, 1 << 16))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", left)
+            left -= len(chunk)
+            yield chunk
+
+async def _read_body(chunks: AsyncIterator[bytes]) -> bytes:
+    parts, size = [], 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > MAX_BODY:
+            raise HTTPError(413, f"body over {MAX_BODY} bytes")
+        parts.append(chunk)
+    return b"".join(parts)
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buf = b""
+    async for chunk in chunks:
+        *lines, buf = (buf + chunk).split(b"\n")
+        if len(buf) > MAX_LINE:
+            raise HTTPError(413, f"line over {MAX_LINE} bytes")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buf.strip():
+        yield buf
+
+class ScoringService:
+    def __init__(self, pool, window: float = 0.005, max_batch: int = 256):
+        self.score = Batcher(pool, score_many, window, max_batch)
+        self.synthesize = Batcher(pool, synthesize_many, window, max_batch)
+        self.started = time.time()
+        self._conns: set = set()
+
+    def health(self) -> Dict[str, Any]:
+        return {"uptime_s": round(time.time() - self.started, 1),
+                "score": self.score.stats, "synthesize": self.synthesize.stats}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._conns.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if not h.strip():
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    await self.route(method, target.split("?", 1)[0], _body_chunks(reader, headers), writer)
+                except HTTPError as e:
+                    # the rest of the body may still be unread, so the connection cannot be reused
+                    self.respond(writer, e.status, {"error": str(e)}, keep=False)
+                    keep = False
+                except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    raise
+                except Exception as e:   # e.g. BrokenProcessPool: answer 500 rather than hang up
+                    self.respond(writer, 500, _error(e), keep=False)
+                    keep = False
+                await writer.drain()
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass   # client went away or sent garbage; drop the connection
+        finally:
+            writer.close()
+            self._conns.discard(asyncio.current_task())
+
+    async def wait_idle(self, timeout: float = 5.0):
+        """Wait for open connections to finish (after the server stopped accepting)."""
+        if self._conns:
+            await asyncio.wait(list(self._conns), timeout=timeout)
+
+    async def route(self, method: str, path: str, body: AsyncIterator[bytes], writer: asyncio.StreamWriter):
+        if path == "/health":
+            return self.respond(writer, 200, self.health())
+        if path not in ("/score", "/synthesize", "/bulk"):
+            raise HTTPError(404, f"no route {path}")
+        if method != "POST":
+            raise HTTPError(405, f"{path} takes POST")
+        if path == "/bulk":
+            return await self.bulk(body, writer)
+        batcher = self.score if path == "/score" else self.synthesize
+        result = await batcher.submit(await _read_body(body))
+        self.respond(writer, 400 if "error" in result else 200, result)
+
+    async def bulk(self, body: AsyncIterator[bytes], writer: asyncio.StreamWriter):
+        """Stream one score per NDJSON line back as chunked NDJSON, keeping input order.
+
+        A writer task sends each result as soon as it and every earlier line are scored,
+        while this coroutine keeps reading; at most BULK_INFLIGHT lines wait unwritten.
+        """
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        queue: "asyncio.Queue[Optional[asyncio.Future]]" = asyncio.Queue(BULK_INFLIGHT)   # None ends the stream
+
+        async def write_results():
+            try:
+                while True:
+                    fut = await queue.get()
+                    if fut is None:
+                        return
+                    data = json.dumps(await fut).encode() + b"\n"
+                    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    await writer.drain()
+            finally:
+                while not queue.empty():   # unblock the reader and drop work nobody will see
+                    fut = queue.get_nowait()
+                    if fut is not None:
+                        fut.cancel()
+
+        results = asyncio.create_task(write_results())
+        try:
+            async for line in _lines(body):
+                if results.done():
+                    break
+                await queue.put(self.score.submit(line))
+            await queue.put(None)
+            await results
+        except HTTPError as e:
+            await queue.put(None)
+            await asyncio.gather(results, return_exceptions=True)   # send what was read before the bad line
+            error = {"error": str(e)}
+        except (asyncio.IncompleteReadError, ConnectionError):
+            raise
+        except Exception as e:   # e.g. BrokenProcessPool out of a batch
+            error = _error(e)
+        else:
+            writer.write(b"0\r\n\r\n")
+            return
+        finally:
+            results.cancel()   # no-op once it has finished
+        data = json.dumps(error).encode() + b"\n"
+        writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        raise ConnectionError(error["error"])   # the status line is already out; end the connection
+
+    @staticmethod
+    def respond(writer: asyncio.StreamWriter, status: int, doc: Any, keep: bool = True):
+        data = json.dumps(doc).encode()
+        head = [f"HTTP/1.1 {status} {REASONS[status]}", "Content-Type: application/json", f"Content-Length: {len(data)}"]
+        if not keep:
+            head.append("Connection: close")
+        writer.write("\r\n".join(head + ["", ""]).encode() + data)
+
+def scoring_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    # Forked workers would inherit open client sockets and keep them alive after
+    # the service closes them; spawned ones start clean.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+async def start(pool, host: str, port: int, window: float, max_batch: int):
+    service = ScoringService(pool, window, max_batch)
+    server = await asyncio.start_server(service.handle, host, port)
+    return service, server
+
+def serve(args):
+    async def run():
+        with scoring_pool(args.workers) as pool:
+            _, server = await start(pool, args.host, args.port, args.window, args.max_batch)
+            print(f"scoring on http://{args.host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+            async with server:
+                await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+# ---------- Benchmark ----------
+async def _request(reader, writer, path: str, body: bytes) -> bytes:
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    status = await reader.readline()
+    length = 0
+    while True:
+        h = await reader.readline()
+        if not h.strip():
+            break
+        if h.lower().startswith(b"content-length:"):
+            length = int(h.split(b":")[1])
+    data = await reader.readexactly(length)
+    if b" 200 " not in status:
+        raise RuntimeError(f"{status.decode().strip()}: {data.decode()}")
+    return data
+
+async def _bench_one(port: int, bodies: List[bytes], clients: int, requests: int) -> Dict[str, float]:
+    lat: List[float] = []
+    todo = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for i in todo:
+            t = time.perf_counter()
+            await _request(reader, writer, "/score", bodies[i % len(bodies)])
+            lat.append(time.perf_counter() - t)
+        writer.close()
+        await writer.wait_closed()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {"req_per_s": requests / wall, "p50_ms": 1e3 * lat[len(lat) // 2],
+            "p99_ms": 1e3 * lat[min(len(lat) - 1, int(0.99 * len(lat)))]}
+
+async def _bench_bulk(port: int, bodies: List[bytes], requests: int) -> float:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    t0 = time.perf_counter()
+    writer.write(b"POST /bulk HTTP/1.1\r\nHost: bench\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+    async def send():
+        for i in range(requests):
+            line = bodies[i % len(bodies)] + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+
+    async def receive() -> int:
+        while (await reader.readline()).strip():   # status line and headers
+            pass
+        n = 0
+        async for line in _lines(_body_chunks(reader, {"transfer-encoding": "chunked"})):
+            if b'"error"' in line:
+                raise RuntimeError(line.decode())
+            n += 1
+        return n
+
+    _, n = await asyncio.gather(send(), receive())
+    writer.close()
+    await writer.wait_closed()
+    return n / (time.perf_counter() - t0)
+
+def bench(args):
+    from bench import synthetic_session
+    from engine import INTERVIEW_PERSONAS, dump_state
+    # distinct sessions, so nothing is answered from a cache
+    bodies = [dump_state(synthetic_session(min(6, len(INTERVIEW_PERSONAS)), seed).s).encode() for seed in range(64)]
+    # (label, window, max batch); "unbatched" sends every request to the pool on its own
+    configs = [("unbatched", 0.0, 1)] + [(f"{1e3 * float(w):.1f} ms", float(w), args.max_batch)
+                                         for w in args.windows.split(",")]
+
+    async def run():
+        rows = []
+        with scoring_pool(args.workers) as pool:
+            for label, window, max_batch in configs:
+                service, server = await start(pool, "127.0.0.1", 0, window, max_batch)
+                port = server.sockets[0].getsockname()[1]
+                await _bench_one(port, bodies, args.clients, min(args.requests, 200))   # warm the workers
+                before = dict(service.score.stats)
+                r = await _bench_one(port, bodies, args.clients, args.requests)
+                batches = service.score.stats["batches"] - before["batches"]
+                r["mean_batch"] = (service.score.stats["requests"] - before["requests"]) / max(1, batches)
+                r["bulk_lines_per_s"] = await _bench_bulk(port, bodies, args.requests)
+                server.close()
+                await service.wait_idle()
+                rows.append((label, r))
+                print(f"window {label:>9}  {r['req_per_s']:>8.0f} req/s  p50 {r['p50_ms']:>7.1f} ms  "
+                      f"p99 {r['p99_ms']:>7.1f} ms  mean batch {r['mean_batch']:>6.1f}  "
+                      f"bulk {r['bulk_lines_per_s']:>8.0f} lines/s")
+        return rows
+
+    print(f"{args.requests} /score requests from {args.clients} keep-alive clients, "
+          f"{args.workers or os.cpu_count()} worker process(es)")
+    rows = asyncio.run(run())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({label: {k: round(v, 2) for k, v in r.items()} for label, r in rows}, f, indent=1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Batched HTTP scoring service.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="run the service")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8077)
+    b = sub.add_parser("bench", help="requests/sec and latency at several batch windows")
+    b.add_argument("--windows", default="0,0.002,0.005,0.02", help="comma-separated batch windows (s)")
+    b.add_argument("--clients", type=int, default=64, help="concurrent keep-alive connections")
+    b.add_argument("--requests", type=int, default=2000)
+    b.add_argument("--json", default="", help="also write results to this path")
+    s.add_argument("--window", type=float, default=0.005, help="batching window (s)")
+    for p in (s, b):
+        p.add_argument("--max-batch", type=int, default=256, help="flush a batch early at this size")
+        p.add_argument("--workers", type=int, default=None, help="scoring processes (default: one per CPU)")
+    args = ap.parse_args()
+    if args.cmd == "serve":
+        serve(args)
+    else:
+        bench(args)
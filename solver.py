@@ -0,0 +1,168 @@
+# solver.py
+# Expert questioning paths: the best question sequence for each persona, found by dynamic programming.
+# Run: python solver.py [--persona 3] [--seed 7]   (no --persona: solve every persona, then one booked session)
+#
+# Interviews are deterministic: ask() moves trust by +0.06 (open) or -0.08 (leading),
+# an answer is "unlocked" once trust reaches the persona's tell_threshold, and
+# selectable() only ever offers the first 5 unasked questions of open_first_order.
+# A state is therefore (asked bitmask, trust). Every question sets one more bit,
+# so states are expanded layer by layer by questions asked, each reached state
+# keeps the path with the most cluster hits so far, and the best finishing state
+# is picked at the end: a few thousand states instead of n! orderings.
+#
+# A path is ranked by, in order:
+#   1. Interview Craft of the persona on its own;
+#   2. signal: depth weight x cluster hits + the unlock bonus if trust ends above
+#      tell_threshold (the weight _fold_analytics credits, before saturation);
+#   3. fewer questions.
+# Craft pools open/leading counts and trust across interviews, so when every
+# persona reaches full craft alone the pooled craft is full too; signal adds up
+# per persona with a fixed saturation factor. Solving each booked persona thus
+# solves the booked set whenever every bank has enough open questions, which
+# the built-in banks do.
+
+import argparse
+import sys
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from engine import (INTERVIEW_PERSONAS, MIN_QUESTIONS_PER_INTERVIEW, SCORE_KEYS, Interview, Simulation, bank_index,
+                    clamp, craft_points, dump_state, load_state, lookup_answer, match_clusters, on_answers_changed,
+                    open_first_order, score_session, start_trust, unlock_bonus)
+
+OFFERED = 5   # questions selectable() shows at a time
+
+class ExpertPath(NamedTuple):
+    pid: int
+    keys: Tuple[str, ...]   # question keys, in asking order
+    craft: int              # Interview Craft of this interview alone
+    signal: float           # depth weight x hits + unlock bonus
+    trust: float            # final trust
+    unlocked: bool
+    states: int             # (bitmask, trust) states explored
+
+def depth_weight(q_count: int) -> float:
+    return max(0.5, min(2.0, 1.0 + (q_count - MIN_QUESTIONS_PER_INTERVIEW) * 0.25))
+
+@lru_cache(maxsize=None)
+def _turn_hits(pid: int, pos: int, unlocked: bool) -> int:
+    q = bank_index(INTERVIEW_PERSONAS[pid]["segment"]).questions[pos]
+    return len(match_clusters(q["text"] + " " + lookup_answer(pid, q["key"], unlocked)))
+
+def _clear_caches():
+    _turn_hits.cache_clear()
+    solve_persona.cache_clear()
+
+def _offered(order: Tuple[int, ...], asked: int) -> List[int]:
+    out = []
+    for pos in order:
+        if not asked >> pos & 1:
+            out.append(pos)
+            if len(out) == OFFERED:
+                break
+    return out
+
+@lru_cache(maxsize=None)
+def solve_persona(pid: int) -> ExpertPath:
+    """Best question sequence for one interview with persona `pid` (see module header)."""
+    p = INTERVIEW_PERSONAS[pid]
+    bank = bank_index(p["segment"]).questions
+    order = open_first_order(pid)
+    threshold = p["tell_threshold"]
+    bonus = sum(v for _, v in unlock_bonus(pid))
+    # trust is keyed exactly, not rounded: it takes few distinct values, and unlock
+    # checks then agree with ask() to the last bit
+    start = (0, start_trust(p["segment"]))
+    best: Dict[Tuple[int, float], Tuple[int, Optional[Tuple[int, float]], int]] = {start: (0, None, -1)}
+    layer = [start]
+    while layer:
+        nxt: Dict[Tuple[int, float], Tuple[int, Optional[Tuple[int, float]], int]] = {}
+        for state in layer:
+            asked, trust = state
+            hits = best[state][0]
+            for pos in _offered(order, asked):
+                t = clamp(trust + (0.06 if bank[pos]["kind"] == "open" else -0.08), 0, 1)
+                h = hits + _turn_hits(pid, pos, t >= threshold)
+                key = (asked | 1 << pos, t)
+                if key not in nxt or h > nxt[key][0]:
+                    nxt[key] = (h, state, pos)
+        best.update(nxt)
+        layer = list(nxt)
+
+    def rank(state):
+        asked, trust = state
+        n = bin(asked).count("1")
+        opens = sum(1 for pos in range(len(bank)) if asked >> pos & 1 and bank[pos]["kind"] == "open")
+        unlocked = trust >= threshold
+        signal = depth_weight(n) * best[state][0] + (bonus if unlocked else 0.0)
+        return craft_points(opens, n - opens, trust), round(signal, 6), -n
+
+    need = min(MIN_QUESTIONS_PER_INTERVIEW, len(bank))
+    final = max((s for s in best if bin(s[0]).count("1") >= need), key=rank)
+    keys, state = [], final
+    while best[state][1] is not None:
+        _, prev, pos = best[state]
+        keys.append(bank[pos]["key"])
+        state = prev
+    craft, signal, _ = rank(final)
+    return ExpertPath(pid, tuple(reversed(keys)), craft, signal, final[1], final[1] >= threshold, len(best))
+
+on_answers_changed(_clear_caches)   # edited answers change hits, and so the best path
+
+def expert_session(S: Dict[str, Any]) -> Tuple[List[ExpertPath], Dict[str, Any]]:
+    """Expert paths for a session's booked personas, and the score the session would get
+    asking them instead (same booking, flash bursts and draft)."""
+    state = load_state(dump_state(S))   # a copy; the learner's session is left alone
+    state["interview"] = {pid: Interview(pid, start_trust(INTERVIEW_PERSONAS[pid]["segment"]))
+                          for pid in state["booked_ids"]}
+    sim = Simulation(state)
+    paths = [solve_persona(pid) for pid in state["booked_ids"]]
+    for path in paths:
+        for key in path.keys:
+            sim.ask(path.pid, key)
+        sim.end_interview(path.pid)
+    # scored directly: a what-if, not a learner submission, so it stays out of the score cache and its stats
+    state["score"], state["reasons"] = score_session(*(state[k] for k in SCORE_KEYS))
+    return paths, state["score"]
+
+def _check(path: ExpertPath):
+    """Replay a path through Simulation.ask(), enforcing selectable(); returns the final Interview."""
+    sim = Simulation()
+    sim.init_interview(path.pid)
+    for key in path.keys:
+        assert key in [q["key"] for q in sim.selectable(path.pid)], (path.pid, key)
+        sim.ask(path.pid, key)
+    return sim.s["interview"][path.pid]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Best questioning sequence per persona and per booked session.")
+    ap.add_argument("--persona", type=int, default=None, help="solve one persona (index into INTERVIEW_PERSONAS)")
+    ap.add_argument("--seed", type=int, default=0, help="seed of the booked session to solve")
+    args = ap.parse_args(argv)
+
+    pids = [args.persona] if args.persona is not None else range(len(INTERVIEW_PERSONAS))
+    for pid in pids:
+        t = time.perf_counter()
+        solve_persona.cache_clear()
+        path = solve_persona(pid)
+        ms = 1e3 * (time.perf_counter() - t)
+        stt = _check(path)
+        assert abs(stt.trust - path.trust) < 1e-12
+        print(f"{pid:>3} {INTERVIEW_PERSONAS[pid]['name']:<18} craft {path.craft:>3}  signal {path.signal:>6.2f}  "
+              f"trust {path.trust:.2f}{' unlocked' if path.unlocked else '         '}  {len(path.keys):>2} questions  "
+              f"{path.states:>5} states  {ms:6.1f} ms")
+        print("      " + " -> ".join(path.keys))
+    if args.persona is None:
+        from engine import CHANNELS
+        sim = Simulation(seed=args.seed)
+        for ch in CHANNELS:
+            sim.set_alloc(ch, 2)
+        sim.book()
+        sim.s["chosen_pain"] = max(sim.s["analytics"]["clusters"], key=sim.s["analytics"]["clusters"].get)
+        paths, score = expert_session(sim.s)
+        print(f"booked {sim.s['booked_ids']}: expert questioning scores Interview Craft "
+              f"{score['components']['Interview Craft']}, total {score['total']} with an empty draft")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+# store.py
+# Durable learner sessions: JSON snapshots of the state dict, keyed by a session id.
+# Default backend is SQLite (SIM_STORE=sessions.sqlite); a path ending in "/" keeps one file per session.
+# Benchmark: python store.py bench [--rate 1000] [--seconds 5] [--sessions 200] [--store PATH]
+#
+# Writes go through WriteBehind: a click only records the latest snapshot of its
+# session, and a background thread writes whatever is pending in one transaction.
+# Several snapshots of one session between flushes collapse into a single write.
+# Next to the snapshots each backend keeps cohort score counts (score name -> value
+# -> learners), which cohort.ScoreRanks turns into live percentile ranks, and the
+# values each session is counted at, so a session is counted once however often its
+# score page is rendered or reloaded, and a resubmit or restart moves its count.
+
+import argparse
+import atexit
+import bisect
+import os
+import re
+import secrets
+import sqlite3
+import json
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+ScoreCounts = Dict[str, Dict[int, int]]   # score name -> value -> count
+ScoreMarks = Dict[str, Optional[Dict[str, int]]]   # sid -> score name -> value it is counted at
+
+from engine import dump_state
+
+SID_RE = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+def new_sid() -> str:
+    return secrets.token_urlsafe(12)
+
+def valid_sid(sid: str) -> bool:
+    return bool(SID_RE.fullmatch(sid or ""))
+
+# ---------- Backends ----------
+class SQLiteStore:
+    """Snapshots in one table; one connection per thread, WAL so readers never wait on the writer."""
+
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, updated REAL NOT NULL, state TEXT NOT NULL)",
+              "CREATE TABLE IF NOT EXISTS score_counts (name TEXT, value INTEGER, n INTEGER NOT NULL, "
+              "PRIMARY KEY (name, value))",
+              "CREATE TABLE IF NOT EXISTS score_sids (sid TEXT PRIMARY KEY, vals TEXT)")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        for ddl in self.SCHEMA:
+            self._con().execute(ddl)
+        if "vals" not in [c[1] for c in self._con().execute("PRAGMA table_info(score_sids)")]:
+            # sids counted before values were kept stay counted once, unmoved, until `cohort.py ranks`
+            with self._con() as con:
+                con.execute("ALTER TABLE score_sids ADD COLUMN vals TEXT")
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = sqlite3.connect(self.path, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def load(self, sid: str) -> Optional[str]:
+        rows = self._con().execute("SELECT state FROM sessions WHERE sid=?", (sid,)).fetchall()
+        return rows[0][0] if rows else None
+
+    def scan(self, after: str = "", limit: int = 1000) -> List[Tuple[str, str]]:
+        """Up to `limit` (sid, state) pairs with sid > `after`, in sid order."""
+        return self._con().execute("SELECT sid, state FROM sessions WHERE sid > ? ORDER BY sid LIMIT ?",
+                                   (after, limit)).fetchall()
+
+    def save_many(self, items: Iterable[Tuple[str, str]]):
+        now = time.time()
+        with self._con() as con:
+            con.executemany("INSERT INTO sessions VALUES (?,?,?) ON CONFLICT(sid) DO UPDATE "
+                            "SET updated=excluded.updated, state=excluded.state",
+                            ((sid, now, state) for sid, state in items))
+
+    def score_counts(self) -> ScoreCounts:
+        out: ScoreCounts = {}
+        for name, value, n in self._con().execute("SELECT name, value, n FROM score_counts"):
+            out.setdefault(name, {})[value] = n
+        return out
+
+    def count_scores(self, sid: str, values: Dict[str, int]) -> Optional[Dict[str, int]]:
+        """Count session `sid` at `values` (score name -> value), moving it from the values it
+        was counted at before. Returns those ({} if it was not counted), or None if it is
+        already counted at `values`. Safe across processes."""
+        with self._con() as con:
+            con.execute("BEGIN IMMEDIATE")   # read and move under one write lock
+            row = con.execute("SELECT vals FROM score_sids WHERE sid=?", (sid,)).fetchone()
+            if row and row[0] is None:
+                return None   # counted before values were kept: nothing to move it from
+            old = json.loads(row[0]) if row else {}
+            if row and old == values:
+                return None
+            con.executemany("UPDATE score_counts SET n=n-1 WHERE name=? AND value=?", old.items())
+            con.execute("DELETE FROM score_counts WHERE n <= 0")
+            con.executemany("INSERT INTO score_counts VALUES (?,?,1) ON CONFLICT(name, value) DO UPDATE SET n=n+1",
+                            values.items())
+            con.execute("INSERT INTO score_sids VALUES (?,?) ON CONFLICT(sid) DO UPDATE SET vals=excluded.vals",
+                        (sid, json.dumps(values)))
+        return old
+
+    def set_score_counts(self, counts: ScoreCounts, marks: ScoreMarks):
+        """Replace all score counts and where each session is counted, e.g. after a regrade."""
+        with self._con() as con:
+            con.execute("DELETE FROM score_counts")
+            con.executemany("INSERT INTO score_counts VALUES (?,?,?)",
+                            ((name, v, n) for name, row in counts.items() for v, n in row.items() if n))
+            con.execute("DELETE FROM score_sids")
+            con.executemany("INSERT INTO score_sids VALUES (?,?)",
+                            ((sid, json.dumps(vals)) for sid, vals in marks.items()))
+
+class FileStore:
+    """One JSON file per session, replaced atomically; meant for tests and single-user runs."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._scores_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sid: str) -> str:
+        if not valid_sid(sid):
+            raise ValueError(f"invalid session id: {sid!r}")
+        return os.path.join(self.root, sid + ".json")
+
+    def load(self, sid: str) -> Optional[str]:
+        try:
+            with open(self._path(sid), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def scan(self, after: str = "", limit: int = 1000) -> List[Tuple[str, str]]:
+        sids = sorted(name[:-5] for name in os.listdir(self.root) if name.endswith(".json"))
+        out = []
+        for sid in sids[bisect.bisect_right(sids, after):][:limit]:
+            state = self.load(sid)
+            if state is not None:
+                out.append((sid, state))
+        return out
+
+    def save_many(self, items: Iterable[Tuple[str, str]]):
+        for sid, state in items:
+            path = self._path(sid)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(state)
+            os.replace(path + ".tmp", path)
+
+    def _scores_path(self) -> str:
+        return os.path.join(self.root, "score_counts")   # no .json suffix, so scan() skips it
+
+    def _read_scores(self) -> Tuple[ScoreCounts, ScoreMarks]:
+        try:
+            with open(self._scores_path(), encoding="utf-8") as f:
+                doc = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        marks = doc["sids"]
+        if isinstance(marks, list):   # written before values were kept; see SQLiteStore.__init__
+            marks = dict.fromkeys(marks)
+        return {name: {int(v): n for v, n in row.items()} for name, row in doc["counts"].items()}, marks
+
+    def score_counts(self) -> ScoreCounts:
+        return self._read_scores()[0]
+
+    def count_scores(self, sid: str, values: Dict[str, int]) -> Optional[Dict[str, int]]:
+        with self._scores_lock:
+            counts, marks = self._read_scores()
+            old = marks.get(sid, {})
+            if sid in marks and (old is None or old == values):
+                return None
+            for vals, d in ((old, -1), (values, 1)):
+                for name, v in vals.items():
+                    row = counts.setdefault(name, {})
+                    row[v] = row.get(v, 0) + d
+            marks[sid] = values
+            self.set_score_counts(counts, marks)
+        return old
+
+    def set_score_counts(self, counts: ScoreCounts, marks: ScoreMarks):
+        counts = {name: {v: n for v, n in row.items() if n > 0} for name, row in counts.items()}
+        path = self._scores_path()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"counts": counts, "sids": marks}, f)
+        os.replace(path + ".tmp", path)
+
+def open_store(spec: Optional[str] = None):
+    spec = spec or os.environ.get("SIM_STORE", "sessions.sqlite")
+    if spec.endswith(("/", os.sep)) or os.path.isdir(spec):
+        return FileStore(spec)
+    return SQLiteStore(spec)
+
+# ---------- Write-behind ----------
+class WriteBehind:
+    """Queues the latest snapshot per session and writes them in batches on a background thread."""
+
+    def __init__(self, store, interval: float = 0.05):
+        self.store, self.interval = store, interval
+        self.stats = {"puts": 0, "writes": 0, "batches": 0, "errors": 0}
+        self._pending: Dict[str, str] = {}
+        self._writing: Dict[str, str] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="store-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, sid: str, state: str):
+        with self._cond:
+            self._pending[sid] = state
+            self.stats["puts"] += 1
+            self._cond.notify_all()
+
+    def load(self, sid: str) -> Optional[str]:
+        with self._cond:
+            state = self._pending.get(sid) or self._writing.get(sid)
+        return state if state is not None else self.store.load(sid)
+
+    # Score counts change once per submitted score, so they skip the queue.
+    def count_scores(self, sid: str, values: Dict[str, int]) -> Optional[Dict[str, int]]:
+        return self.store.count_scores(sid, values)
+
+    def score_counts(self) -> ScoreCounts:
+        return self.store.score_counts()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            time.sleep(self.interval)   # let a burst of clicks coalesce
+            with self._cond:
+                self._writing, self._pending = self._pending, {}
+            try:
+                self.store.save_many(self._writing.items())
+                self.stats["writes"] += len(self._writing)
+                self.stats["batches"] += 1
+            except Exception as e:
+                # keep the batch unless a newer snapshot arrived meanwhile; retried on the next pass
+                print(f"store: write failed: {e}", file=sys.stderr)
+                self.stats["errors"] += 1
+                with self._cond:
+                    for sid, state in self._writing.items():
+                        self._pending.setdefault(sid, state)
+            with self._cond:
+                self._writing = {}
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far is on disk; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self, timeout: float = 5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+def snapshotter(store: WriteBehind, sid: str) -> Callable:
+    """Simulation.on_change callback that queues a snapshot of the session under `sid`."""
+    return lambda sim: store.put(sid, dump_state(sim.s))
+
+# ---------- Benchmark ----------
+def _sample_state() -> str:
+    from engine import CHANNELS, Simulation
+    sim = Simulation(seed=1)
+    for ch in CHANNELS:
+        sim.set_alloc(ch, 1)
+    sim.book(need=6)
+    for pid in sim.s["booked_ids"]:
+        for _ in range(6):
+            sim.ask(pid, sim.selectable(pid)[0]["key"])
+    return dump_state(sim.s)
+
+def bench(args):
+    tmp = None
+    if not args.store:
+        tmp = tempfile.TemporaryDirectory()
+        args.store = os.path.join(tmp.name, "bench.sqlite")
+    wb = WriteBehind(open_store(args.store), interval=args.interval)
+    state = _sample_state()
+    sids = [new_sid() for _ in range(args.sessions)]
+    n = int(args.rate * args.seconds)
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        due = t0 + i / args.rate
+        while time.perf_counter() < due:
+            time.sleep(max(0.0, due - time.perf_counter()) / 2)
+        t = time.perf_counter()
+        wb.put(sids[i % len(sids)], state)
+        lat.append(time.perf_counter() - t)
+    sent = time.perf_counter() - t0
+    wb.flush()
+    drained = time.perf_counter() - t0
+    wb.close()
+    lat.sort()
+    pct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1e6
+    print(f"store: {args.store}  snapshot: {len(state)} bytes  sessions: {args.sessions}")
+    print(f"puts: {n} in {sent:.2f}s ({n / sent:.0f}/s)  put latency p50 {pct(0.5):.1f}us  "
+          f"p99 {pct(0.99):.1f}us  max {lat[-1] * 1e6:.1f}us")
+    print(f"disk writes: {wb.stats['writes']} in {wb.stats['batches']} batches  "
+          f"(coalesced {n - wb.stats['writes']})  drained after {drained:.2f}s  errors: {wb.stats['errors']}")
+    if tmp:
+        tmp.cleanup()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Session store utilities.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="measure snapshot write latency at a fixed request rate")
+    b.add_argument("--rate", type=float, default=1000, help="snapshots per second")
+    b.add_argument("--seconds", type=float, default=5)
+    b.add_argument("--sessions", type=int, default=200, help="distinct session ids written round-robin")
+    b.add_argument("--interval", type=float, default=0.05, help="write-behind batching window (s)")
+    b.add_argument("--store", default="", help="store path (default: a temporary SQLite file)")
+    bench(ap.parse_args())
@@ -0,0 +1,39 @@
+# conftest.py
+# Shared helpers for the test suite. Run: python -m pytest -q
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import CHANNELS, PAIN_KEYWORDS, Simulation  # noqa: E402
+
+PROBLEM = "Homeowners: bills spike 20% per month in summer; we half-close vents measure within"
+NEXT_TEST = "pilot target >= 5 signups"
+
+def play(seed: int, max_alloc: int = 3, max_questions: int = 10) -> Simulation:
+    """A synthesized session with random channels, questions, flash bursts and draft, fixed by `seed`."""
+    r = random.Random(seed)
+    sim = Simulation(seed=seed)
+    for ch in CHANNELS:
+        sim.set_alloc(ch, r.randint(0, max_alloc))
+    sim.book()
+    for pid in sim.s["booked_ids"]:
+        for _ in range(r.randint(0, max_questions)):
+            offered = sim.selectable(pid)
+            if not offered:
+                break
+            sim.ask(pid, r.choice(offered)["key"])
+    for f in r.sample(range(12), r.randint(0, 5)):
+        sim.open_flash(f)
+    sim.s["chosen_pain"] = r.choice([None, *PAIN_KEYWORDS])
+    sim.s["problem_text"] = r.choice(["", "   ", PROBLEM, PROBLEM.lower()[:40]])
+    sim.s["next_test_text"] = r.choice(["", NEXT_TEST])
+    sim.run_synthesis()
+    return sim
+
+@pytest.fixture
+def played():
+    return play
@@ -0,0 +1,22 @@
+import multiprocessing
+
+from events import EventLog, read_events
+
+def _write(path: str, n: int):
+    log = EventLog(path, flush_every=200)   # ~40 KB per flush, far past any atomic pipe/page size
+    for i in range(5000):
+        log.append(f"proc{n}", "ask", (i, "x" * 200))
+    log.close()
+
+def test_processes_sharing_a_log_never_split_lines(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    procs = [multiprocessing.get_context("fork").Process(target=_write, args=(path, n)) for n in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    seen = {}
+    for ev in read_events(path):
+        assert ev.args[0] == seen.get(ev.sid, -1) + 1   # whole lines, in order within a session
+        seen[ev.sid] = ev.args[0]
+    assert seen == {f"proc{n}": 4999 for n in range(4)}
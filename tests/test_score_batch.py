@@ -0,0 +1,41 @@
+import pytest
+
+from engine import SCORE_KEYS, Simulation, score_batch, score_session
+
+def _table(sims):
+    return {k: [sim.s[k] for sim in sims] for k in SCORE_KEYS}
+
+def _loop(sims):
+    return [score_session(*(sim.s[k] for k in SCORE_KEYS))[0] for sim in sims]
+
+def test_empty_batch():
+    assert score_batch({k: [] for k in SCORE_KEYS}) == []
+
+def test_matches_score_session_across_seeds(played):
+    sims = [played(seed) for seed in range(300)]
+    assert score_batch(_table(sims)) == _loop(sims)
+
+def test_matches_row_by_row(played):
+    sims = [played(seed) for seed in range(20)]
+    assert [score_batch(_table([sim]))[0] for sim in sims] == _loop(sims)
+
+def test_zero_interviews():
+    sim = Simulation(seed=1)
+    sim.run_synthesis()
+    assert score_batch(_table([sim])) == _loop([sim])
+
+@pytest.mark.parametrize("problem", ["", " ", "\n\t  "])
+def test_blank_problem_text(played, problem):
+    sims = [played(seed) for seed in range(5)]
+    for sim in sims:
+        sim.s["problem_text"] = problem
+    assert score_batch(_table(sims)) == _loop(sims)
+
+def test_all_channels_zero(played):
+    sims = [played(seed, max_alloc=0) for seed in range(10)]
+    assert all(not any(sim.s["alloc"].values()) for sim in sims)
+    assert score_batch(_table(sims)) == _loop(sims)
+
+def test_mixed_with_unasked_sessions(played):
+    sims = [played(seed, max_questions=seed % 3) for seed in range(30)]
+    assert score_batch(_table(sims)) == _loop(sims)
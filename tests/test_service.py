@@ -0,0 +1,19 @@
+import json
+
+from engine import dump_state
+from service import score_many
+
+def test_bad_snapshot_does_not_sink_its_batch(played):
+    texts = [dump_state(played(seed).s).encode() for seed in range(4)]
+    bad = json.loads(texts[1])
+    bad["problem_text"] = None
+    texts[1] = json.dumps(bad).encode()
+    alone = [score_many([t])[0] for t in texts]
+    out = score_many(texts)
+    assert "error" in out[1]
+    assert out[:1] + out[2:] == alone[:1] + alone[2:]
+    assert all("total" in r for r in out[:1] + out[2:])
+
+def test_unreadable_snapshot_is_an_error(played):
+    out = score_many([b"{", dump_state(played(0).s).encode()])
+    assert "error" in out[0] and "total" in out[1]
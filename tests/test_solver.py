@@ -0,0 +1,19 @@
+import engine
+import solver
+
+def test_invalidate_answers_clears_solver_caches(monkeypatch):
+    pid = 0
+    p = engine.INTERVIEW_PERSONAS[pid]
+    before = solver.solve_persona(pid)
+    # every answer of this persona now hits every cluster
+    loud = " ".join(w[0] for w in engine.PAIN_KEYWORDS.values())
+    overrides = {qkey: loud for qkey in engine.bank_index(p["segment"]).by_key}
+    monkeypatch.setitem(engine.PERSONA_OVERRIDES, p["name"], overrides)
+    engine.invalidate_answers(pid)
+    try:
+        after = solver.solve_persona(pid)
+        assert after.signal > before.signal
+    finally:
+        monkeypatch.undo()
+        engine.invalidate_answers(pid)
+    assert solver.solve_persona(pid) == before
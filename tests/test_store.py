@@ -0,0 +1,28 @@
+import pytest
+
+from cohort import ScoreRanks
+from store import FileStore, SQLiteStore
+
+@pytest.fixture(params=["sqlite", "files"])
+def store(request, tmp_path):
+    return SQLiteStore(str(tmp_path / "s.sqlite")) if request.param == "sqlite" else FileStore(str(tmp_path / "s"))
+
+def test_count_scores_moves_a_resubmitted_score(store):
+    assert store.count_scores("sid-aaaa1", {"total": 40}) == {}
+    assert store.count_scores("sid-bbbb2", {"total": 40}) == {}
+    assert store.count_scores("sid-aaaa1", {"total": 40}) is None   # a reload counts nothing
+    assert store.count_scores("sid-aaaa1", {"total": 70}) == {"total": 40}
+    assert store.score_counts() == {"total": {40: 1, 70: 1}}
+
+def test_set_score_counts_replaces_marks(store):
+    store.count_scores("sid-aaaa1", {"total": 40})
+    store.set_score_counts({"total": {55: 1}}, {"sid-aaaa1": {"total": 55}})
+    assert store.count_scores("sid-aaaa1", {"total": 55}) is None
+    assert store.count_scores("sid-aaaa1", {"total": 60}) == {"total": 55}
+    assert store.score_counts() == {"total": {60: 1}}
+
+def test_ranks_move():
+    ranks = ScoreRanks({"total": {40: 2, 70: 1}})
+    ranks.move({"total": 40}, {"total": 90})
+    assert ranks.totals["total"] == 3
+    assert ranks.below("total", 71) == 2 and ranks.below("total", 91) == 3